@@ -3,6 +3,7 @@ houses the site pair counting functions that underlie the estimation of the
 two-locus heterozygosity
 """
 from bisect import bisect
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import numpy.ma as ma
 
@@ -209,6 +210,395 @@ def count_weighted_site_pairs(
     return num_pairs
 
 
+_chunk_entries = 1 << 22
+
+
+def get_bin_edges(r_map, bins, left_bound=None):
+    """
+    for each left site, find the indices of the first sites lying at least
+    each bin edge away in the recombination map. edges are bounded below by
+    the index of the left site + 1, so that no site pairs with itself or
+    with sites to its left. sites with indices in [edges[i, k], edges[i, k+1])
+    pair with site i in bin k.
+
+    :param r_map: recombination map
+    :param bins: recombination distance bins. unit must match r_map
+    :param left_bound: optional. the number of sites allowed as left loci
+    :return: integer array of shape (left_bound, len(bins))
+    """
+    if left_bound is None:
+        left_bound = len(r_map)
+    elif left_bound > len(r_map):
+        raise ValueError('left_bound index exceeds map length')
+    edges = np.searchsorted(
+        r_map, r_map[:left_bound, np.newaxis] + bins[np.newaxis, :]
+    )
+    np.maximum(edges, np.arange(1, left_bound + 1)[:, np.newaxis], out=edges)
+    return edges
+
+
+def count_weighted_site_pairs_2d(
+    weights,
+    r_map,
+    bins,
+    left_bound=None,
+    chunk_size=None
+):
+    """
+    compute binned sums of site-weight products for many weight vectors in
+    one pass. weights[:, k] plays the role of the weights argument of
+    count_weighted_site_pairs; bin edges are computed once and shared across
+    columns, and left sites are processed in vectorized chunks rather than
+    one at a time.
+
+    unlike count_weighted_site_pairs, a left_bound of 0 means that no site is
+    counted as a left locus.
+
+    :param weights: array of shape (n_sites, n_stats)
+    :param r_map: recombination map
+    :param bins: recombination bins. unit must match r_map
+    :param left_bound: optional. the number of sites allowed as left loci
+    :param chunk_size: optional. number of left sites handled at once
+    :return: array of shape (n_stats, len(bins) - 1) of weighted pair counts
+    """
+    weights = np.asanyarray(weights, dtype=np.float64)
+    if weights.ndim == 1:
+        weights = weights[:, np.newaxis]
+    if len(weights) != len(r_map):
+        raise ValueError('weights and r_map have mismatched lengths')
+    if left_bound is None:
+        left_bound = len(r_map)
+    elif left_bound > len(r_map):
+        raise ValueError('left_bound index exceeds map length')
+    site_edges = np.array([[0, left_bound, len(r_map)]])
+    num_pairs = count_windowed_site_pairs(
+        r_map, bins, site_edges, weights=weights, chunk_size=chunk_size
+    )
+    return num_pairs[0]
+
+
+"""
+window-batched pair counting
+"""
+
+
+def get_window_site_edges(positions, windows, bounds=None):
+    """
+    convert windows of positions into windows of site indices.
+
+    :param positions: sorted position vector or util.SiteIndex
+    :param windows: array of shape (n_windows, 3) holding (start, left_end,
+        right_end) positions, or of shape (n_windows, 2) if bounds is given
+    :param bounds: optional. right-locus bounds, overriding windows[:, 2]
+    :return: integer array of shape (n_windows, 3)
+    """
+    windows = np.asanyarray(windows).reshape(len(windows), -1)
+    if bounds is not None:
+        windows = np.column_stack((windows[:, :2], bounds))
+    site_edges = util.rank_sites(positions, windows[:, :3])
+    return np.asarray(site_edges, dtype=np.int64)
+
+
+def _get_left_sites(site_edges, start, stop):
+    # enumerate the left-locus indices of all windows, in window order, along
+    # with the index of the window each belongs to, and return entries
+    # [start, stop) of the enumeration. only that slice is allocated, so the
+    # enumeration is never held whole. windows with overlapping left ranges
+    # contribute repeated site indices
+    lengths = np.maximum(site_edges[:, 1] - site_edges[:, 0], 0)
+    ends = np.cumsum(lengths)
+    entries = np.arange(start, min(stop, ends[-1]))
+    window_idx = np.searchsorted(ends, entries, side='right')
+    left_idx = entries - (ends - lengths)[window_idx] \
+        + site_edges[window_idx, 0]
+    return left_idx, window_idx
+
+
+_cum_block_size = 64
+
+
+def _get_cum_weights(weights, dtype=np.float64):
+    # prefix sums of weights along axis 0 with a leading row of zeros, so
+    # that sums over [i, j) are cum[j] - cum[i]. in float32 mode a single
+    # running float32 sum would lose small bin sums to cancellation, so sums
+    # are held in two levels: float32 sums within blocks of _cum_block_size
+    # sites and float64 offsets at block starts. returns (offsets, local);
+    # offsets is None in float64 mode
+    n, k = weights.shape
+    if np.dtype(dtype) == np.float64:
+        cum = np.zeros((n + 1, k), dtype=np.float64)
+        np.cumsum(weights, axis=0, out=cum[1:])
+        return None, cum
+    size = _cum_block_size
+    n_blocks = -(-n // size)
+    padded = np.zeros((n_blocks * size, k), dtype=np.float32)
+    padded[:n] = weights
+    blocks = padded.reshape(n_blocks, size, k)
+    local = np.zeros((n + 1, k), dtype=np.float32)
+    local[1:] = np.cumsum(blocks, axis=1, dtype=np.float32).reshape(-1, k)[:n]
+    # sums restart at each block boundary
+    local[::size] = 0
+    offsets = np.zeros((n_blocks + 1, k), dtype=np.float64)
+    np.cumsum(blocks.sum(1, dtype=np.float64), axis=0, out=offsets[1:])
+    return offsets, local
+
+
+def _index_cum_weights(cum_weights, idx):
+    # look up prefix sums from _get_cum_weights at indices idx, as float64
+    offsets, local = cum_weights
+    if offsets is None:
+        return local[idx]
+    return offsets[idx // _cum_block_size] + local[idx]
+
+
+def count_windowed_site_pairs(
+    r_map,
+    bins,
+    site_edges,
+    weights=None,
+    right_weights=None,
+    chunk_size=None,
+    dtype=np.float64
+):
+    """
+    compute binned site pair counts or sums of site-weight products in many
+    windows with a single sweep over the left loci of all windows. bin edges
+    are searched once per left locus on the whole map and clipped at the
+    right bound of the window that owns it; per-locus contributions are
+    then attributed to windows with np.add.at.
+
+    the contribution of left locus i in bin k is
+    weights[i] * sum(right_weights[j]) over right loci j in bin k. a window
+    with a left_end equal to its start counts nothing.
+
+    :param r_map: recombination map
+    :param bins: recombination bins. unit must match r_map
+    :param site_edges: integer array of shape (n_windows, 3) holding the
+        (start, left_end, right_end) site indices of each window
+    :param weights: optional. array of shape (n_sites,) or (n_sites, n_stats)
+        of left-locus weights. if None, site pairs are counted
+    :param right_weights: optional. right-locus weights with the shape of
+        weights. defaults to weights
+    :param chunk_size: optional. number of left sites handled at once
+    :param dtype: optional, default np.float64. storage type for weights and
+        their prefix sums. np.float32 halves their memory footprint; prefix
+        sums are then compensated by blocking and accumulators stay float64
+    :return: array of shape (n_windows, n_stats, len(bins) - 1), or of shape
+        (n_windows, len(bins) - 1) if weights is None or 1d
+    """
+    bins = np.asanyarray(bins)
+    site_edges = np.asanyarray(site_edges, dtype=np.int64).reshape(-1, 3)
+    if np.any(site_edges[:, 2] > len(r_map)):
+        raise ValueError('window bound exceeds map length')
+    n_windows = len(site_edges)
+    n_bins = len(bins) - 1
+
+    squeeze = weights is None or np.ndim(weights) == 1
+    if weights is None:
+        n_stats = 1
+    else:
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError('dtype must be np.float32 or np.float64')
+        weights = np.asanyarray(weights, dtype=dtype)
+        if weights.ndim == 1:
+            weights = weights[:, np.newaxis]
+        if right_weights is None:
+            right_weights = weights
+        else:
+            right_weights = np.asanyarray(right_weights, dtype=dtype)
+            right_weights = right_weights.reshape(weights.shape)
+        if len(weights) != len(r_map):
+            raise ValueError('weights and r_map have mismatched lengths')
+        n_stats = weights.shape[1]
+        cum_weights = _get_cum_weights(right_weights, dtype=dtype)
+
+    num_pairs = np.zeros((n_windows, n_stats, n_bins), dtype=np.float64)
+    n_left = np.maximum(site_edges[:, 1] - site_edges[:, 0], 0).sum()
+    if chunk_size is None:
+        chunk_size = max(1, _chunk_entries // (n_stats * len(bins)))
+
+    for start in range(0, n_left, chunk_size):
+        sites, owners = _get_left_sites(
+            site_edges, start, start + chunk_size
+        )
+        edges = np.searchsorted(
+            r_map, r_map[sites, np.newaxis] + bins[np.newaxis, :]
+        )
+        # no self-pairing, and no right loci beyond the window bound
+        np.maximum(edges, sites[:, np.newaxis] + 1, out=edges)
+        np.minimum(edges, site_edges[owners, 2, np.newaxis], out=edges)
+        if weights is None:
+            contribs = np.diff(edges, axis=1)[:, np.newaxis, :]
+        else:
+            bin_sums = np.diff(
+                _index_cum_weights(cum_weights, edges), axis=1
+            )
+            contribs = weights[sites, :, np.newaxis] \
+                * bin_sums.transpose(0, 2, 1)
+        np.add.at(num_pairs, owners, contribs)
+
+    if squeeze:
+        return num_pairs[:, 0]
+    return num_pairs
+
+
+"""
+two-locus statistic plugins
+"""
+
+
+def _as_float_array(arr):
+    # float32 and float64 arrays are kept as they are, so that weights
+    # stored in reduced precision are not copied
+    arr = np.asanyarray(arr)
+    if arr.dtype not in (np.float32, np.float64):
+        arr = arr.astype(np.float64)
+    return arr
+
+
+class PairStatistic:
+    """
+    declares a two-locus statistic of the form
+    sum(left_weights[i] * right_weights[j]) over site pairs (i, j) in each
+    recombination bin, so that it can be computed by the shared counting
+    engine in compute_pair_statistics
+    """
+
+    def __init__(self, name, left_weights=None, right_weights=None):
+        """
+        :param name: key of the statistic in the output of
+            compute_pair_statistics
+        :param left_weights: optional. array of shape (n_sites,) or
+            (n_sites, k). if None, every site has weight 1
+        :param right_weights: optional. array with the shape of left_weights.
+            defaults to left_weights
+        """
+        self.name = name
+        if left_weights is not None:
+            left_weights = _as_float_array(left_weights)
+        if right_weights is None:
+            right_weights = left_weights
+        else:
+            right_weights = _as_float_array(right_weights)
+            if left_weights is None:
+                raise ValueError('right_weights require left_weights')
+            if right_weights.shape != left_weights.shape:
+                raise ValueError('left and right weights mismatch in shape')
+        self.left_weights = left_weights
+        self.right_weights = right_weights
+
+    def __repr__(self):
+        return f'PairStatistic({self.name})'
+
+    @property
+    def n_columns(self):
+        # the number of weight vectors declared
+        if self.left_weights is None or self.left_weights.ndim == 1:
+            return 1
+        return self.left_weights.shape[1]
+
+    def get_weights(self, n_sites):
+        # left and right weights as arrays of shape (n_sites, n_columns)
+        if self.left_weights is None:
+            ones = np.ones((n_sites, 1), dtype=np.float32)
+            return ones, ones
+        left = self.left_weights.reshape(n_sites, -1)
+        right = self.right_weights.reshape(n_sites, -1)
+        return left, right
+
+
+def _count_window_group(args):
+    # count statistics in a contiguous group of windows, on the slice of the
+    # map they span
+    r_map, bins, site_edges, left, right, chunk_size, dtype = args
+    return count_windowed_site_pairs(
+        r_map,
+        bins,
+        site_edges,
+        weights=left,
+        right_weights=right,
+        chunk_size=chunk_size,
+        dtype=dtype
+    )
+
+
+def compute_pair_statistics(
+    stats,
+    r_map,
+    bins,
+    site_edges,
+    n_workers=1,
+    chunk_size=None,
+    dtype=np.float64
+):
+    """
+    compute any number of declared two-locus statistics in windows with one
+    chunked pass. the weights of all statistics are stacked as columns and
+    counted together by count_windowed_site_pairs; with n_workers > 1,
+    groups of windows are counted in parallel on the parts of the map they
+    span.
+
+    :param stats: list of PairStatistic instances
+    :param r_map: recombination map
+    :param bins: recombination bins. unit must match r_map
+    :param site_edges: integer array of shape (n_windows, 3) holding the
+        (start, left_end, right_end) site indices of each window
+    :param n_workers: optional, default 1. number of worker processes
+    :param chunk_size: optional. number of left sites handled at once
+    :param dtype: optional, default np.float64. storage type for weights;
+        see count_windowed_site_pairs
+    :return: dictionary mapping statistic names to arrays of shape
+        (n_windows, len(bins) - 1), or (n_windows, k, len(bins) - 1) for
+        statistics with k > 1 weight columns
+    """
+    names = [stat.name for stat in stats]
+    if len(set(names)) < len(names):
+        raise ValueError('statistic names must be unique')
+    n_sites = len(r_map)
+    # stack the weights of all statistics as columns
+    n_columns = sum(stat.n_columns for stat in stats)
+    left = np.empty((n_sites, n_columns), dtype=dtype)
+    right = np.empty((n_sites, n_columns), dtype=dtype)
+    col = 0
+    for stat in stats:
+        k = stat.n_columns
+        left[:, col:col + k], right[:, col:col + k] = stat.get_weights(n_sites)
+        col += k
+    site_edges = np.asanyarray(site_edges, dtype=np.int64).reshape(-1, 3)
+
+    n_groups = max(1, min(n_workers, len(site_edges)))
+    tasks = []
+    for group in np.array_split(site_edges, n_groups):
+        lo = group[:, 0].min()
+        hi = group[:, 1:].max()
+        tasks.append((
+            r_map[lo:hi],
+            bins,
+            group - lo,
+            left[lo:hi],
+            right[lo:hi],
+            chunk_size,
+            dtype
+        ))
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_count_window_group, tasks))
+    else:
+        results = [_count_window_group(task) for task in tasks]
+    sums = np.concatenate(results)
+
+    ret = dict()
+    col = 0
+    for stat in stats:
+        k = stat.n_columns
+        if stat.left_weights is None or stat.left_weights.ndim == 1:
+            ret[stat.name] = sums[:, col]
+        else:
+            ret[stat.name] = sums[:, col:col + k]
+        col += k
+    return ret
+
+
 """
 mutation-rate weighted pair counting functions
 """
@@ -226,30 +616,33 @@ def compute_bin_averaged_u_weight(
     # for this statistic we use as the bin denominator
     # sum(u_l * u_r)  / [mean(u_l) * mean(u_r)], where sums/means are within
     # the bin
-
-    denom = np.zeros((len(windows), len(bins) - 1), dtype=float)
-
-    for w, (window, bound) in enumerate(zip(windows, bounds)):
-        start = np.searchsorted(positions, window[0])
-        r_end = np.searchsorted(positions, bounds[w])
-        l_end = np.searchsorted(positions[start:], window[1])
-
-        bin_u_prods = compute_binned_u_prods(
-            u_map[start:r_end],
-            r_map[start:r_end],
-            bins,
-            l_lim=l_end
-        )
-        num_pairs, sum_l, sum_r = compute_binned_u_sums(
-            u_map[start:r_end],
-            r_map[start:r_end],
-            bins,
-            l_lim=l_end
-        )
-        mean_l = np.divide(sum_l, num_pairs, where=num_pairs > 0)
-        mean_r = np.divide(sum_r, num_pairs, where=num_pairs > 0)
-        prod_rl = mean_l * mean_r
-        denom[w] = np.divide(bin_u_prods, prod_rl, where=prod_rl > 0)
+    site_edges = get_window_site_edges(positions, windows, bounds=bounds)
+
+    # all four sums come from one pass. as in compute_binned_u_sums, pair
+    # counts and sums of u_r skip left loci with u = 0
+    nonzero = (u_map > 0).astype(np.float64)
+    ones = np.ones(len(u_map))
+    stats = [
+        PairStatistic('u_prods', u_map),
+        PairStatistic('sum_l', u_map, ones),
+        PairStatistic('num_pairs', nonzero, ones),
+        PairStatistic('sum_r', nonzero, u_map)
+    ]
+    sums = compute_pair_statistics(stats, r_map, bins, site_edges)
+    bin_u_prods = sums['u_prods']
+    sum_l = sums['sum_l']
+    num_pairs = sums['num_pairs']
+    sum_r = sums['sum_r']
+    mean_l = np.divide(
+        sum_l, num_pairs, out=np.zeros_like(sum_l), where=num_pairs > 0
+    )
+    mean_r = np.divide(
+        sum_r, num_pairs, out=np.zeros_like(sum_r), where=num_pairs > 0
+    )
+    prod_rl = mean_l * mean_r
+    denom = np.divide(
+        bin_u_prods, prod_rl, out=np.zeros_like(prod_rl), where=prod_rl > 0
+    )
 
     return denom
 
@@ -265,28 +658,15 @@ def compute_chrom_averaged_u_weight(
     # here, the denominator for a bin equals the sum of mutation rate pair
     # products over the mean mutation rate pair product across all bins
     # e.g. sum(u_l * u_r)(bin) / mean(u_l * u_r)(tot)
+    site_edges = get_window_site_edges(positions, windows)
 
     # this array has a row for each window
-    bin_u_prods = np.zeros((len(windows), len(bins) - 1), dtype=float)
-    num_pairs = 0
-
-    for w, (w_start, w_l_end, w_r_end) in enumerate(windows):
-        start = np.searchsorted(positions, w_start)
-        r_end = np.searchsorted(positions, w_r_end)
-        l_end = np.searchsorted(positions[start:], w_l_end)
-
-        #
-        bin_u_prods[w] = compute_binned_u_prods(
-            u_map[start:r_end],
-            r_map[start:r_end],
-            bins,
-            l_lim=l_end
-        )
-        num_pairs += count_site_pairs(
-            r_map[start:r_end],
-            np.array([bins[0], bins[-1]]),
-            left_bound=l_end
-        ).sum()
+    bin_u_prods = compute_pair_statistics(
+        [PairStatistic('u_prods', u_map)], r_map, bins, site_edges
+    )['u_prods']
+    num_pairs = count_windowed_site_pairs(
+        r_map, np.array([bins[0], bins[-1]]), site_edges
+    ).sum()
 
     tot_ul_ur = bin_u_prods.sum()
     print(num_pairs)
@@ -310,19 +690,10 @@ def chrom_weighted_u2(
     # this is some sort of approximation to the average product of mutation
     # rates for sites which are actually counted
     # e.g. sum(u_l * u_r)(bin) / mean(u) ** 2
-    bin_u_prods = np.zeros((len(windows), len(bins) - 1), dtype=float)
-
-    for w, (window, bound) in enumerate(zip(windows, bounds)):
-        start = np.searchsorted(positions, window[0])
-        r_end = np.searchsorted(positions, bounds[w])
-        l_end = np.searchsorted(positions[start:], window[1])
-
-        bin_u_prods[w] = compute_binned_u_prods(
-            u_map[start:r_end],
-            r_map[start:r_end],
-            bins,
-            l_lim=l_end
-        )
+    site_edges = get_window_site_edges(positions, windows, bounds=bounds)
+    bin_u_prods = compute_pair_statistics(
+        [PairStatistic('u_prods', u_map)], r_map, bins, site_edges
+    )['u_prods']
 
     u_squared = np.mean(u_map) ** 2
     denom = bin_u_prods / u_squared
@@ -370,35 +741,18 @@ def compute_binned_u_prods(
     r_map,
     bins,
     l_lim=None,
-    verbosity=1e6
+    verbosity=1e6,
+    dtype=np.float64
 ):
-    # compute sums of products of left * right locus mutation rates
+    # compute sums of products of left * right locus mutation rates. with
+    # dtype np.float32, the u-map is stored in single precision with
+    # compensated prefix sums; see count_windowed_site_pairs
     if not l_lim:
         l_lim = len(r_map)
-
-    site_bins = r_map[:l_lim, np.newaxis] + bins[np.newaxis, :]
-    bin_edges = np.searchsorted(r_map, site_bins)
-    bin_edges -= 1
-
-    # correction
-    over_counts = bin_edges[:, 0] < np.arange(l_lim)
-    bin_edges[over_counts, 0] = np.arange(l_lim)[over_counts]
-
-    cum_u = np.cumsum(u_map)
-
-    sum_lr = np.zeros(len(bins) - 1, dtype=float)
-
-    for i, l_u in enumerate(u_map[:l_lim]):
-        if l_u > 0:
-            sum_lr += l_u * np.diff(cum_u[bin_edges[i]])
-
-            if i % verbosity == 0:
-                if i > 0:
-                    print(
-                        util.get_time(),
-                        f'weighted site pairs counted at site {i}'
-                    )
-
+    site_edges = np.array([[0, l_lim, len(r_map)]])
+    sum_lr = count_windowed_site_pairs(
+        r_map, bins, site_edges, weights=u_map, dtype=dtype
+    )[0]
     return sum_lr
 
 
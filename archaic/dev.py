@@ -3,7 +3,7 @@ from bisect import bisect
 import numpy as np
 import numpy.ma as ma
 
-from archaic import util
+from archaic import util, counting
 
 
 def _count_num_pairs(rmap, bins, llim=None):
@@ -116,15 +116,11 @@ def compute_weight_facs(positions, rmap, umap, bins, windows, mean_u=None):
     num_windows = len(windows)
     num_bins = len(bins) - 1
     #num_pairs = np.zeros((num_windows, num_bins))
-    u_prods = np.zeros((num_windows, num_bins))
-    for w, (start, end, bound) in enumerate(windows):
-        lrstart = np.searchsorted(positions, start)
-        rlim = np.searchsorted(positions, bound)
-        llim = np.searchsorted(positions[lrstart:], end)
-        #num_pairs[w] = count_num_pairs(rmap[lrstart:rlim], bins, llim=llim)
-        u_prods[w] = compute_uu_sums(
-            rmap[lrstart:rlim], umap[lrstart:rlim], bins, llim=llim
-        )
+    # u * u sums for every window come from one sweep over all left loci
+    site_edges = counting.get_window_site_edges(positions, windows)
+    u_prods = counting.compute_pair_statistics(
+        [counting.PairStatistic('u_prods', umap)], rmap, bins, site_edges
+    )['u_prods']
     #tot_prod = u_prods.sum()
     #tot_pairs = num_pairs.sum()
     # mean_prod = tot_prod / tot_pairs
@@ -159,26 +155,32 @@ def compute_weight_facs(positions, rmap, umap, bins, windows, mean_u=None):
     return facs
 
 
-def compute_uu_sums(rmap, umap, bins, llim=None, verbosity=1e6):
+def compute_uu_sums(rmap, umap, bins, llim=None, verbosity=1e6, dtype=None):
     """
+    compute sums of products of left and right locus mutation rates, binned
+    by recombination distance.
+
+    :param rmap: 1d array holding the recombination map in cM
+    :param umap: 1d array of mutation map values
+    :param bins: 1d array of recombination distance bin edges, in cM
+    :param llim: optional, default None. maximum index for left loci
+    :param dtype: optional, default None. storage type for the mutation map;
+        np.float32 halves its memory footprint. if None, float32 maps stay
+        in single precision and others are treated as float64
     """
-    # compute sums of products of left * right locus mutation rates
     if len(umap) != len(rmap):
         raise ValueError('rmap length mismatches umap')
     if not llim:
         llim = len(rmap)
-    cum_umap = np.cumsum(umap)
-    cum_products = np.zeros(len(bins), dtype=float)
-    for i, (rl, ul) in enumerate(zip(rmap[:llim], umap[:llim])):
-        if ul > 0:
-            edges = np.searchsorted(rmap[i + 1:], rl + bins)
-            cum_products += ul * cum_umap[i:][edges]
-            if i % verbosity == 0 and i > 0:
-                print(util.get_time(), f'u prods computed at site {i}')
-    _products = np.diff(cum_products)
+    if dtype is None:
+        dtype = np.float32 if umap.dtype == np.float32 else np.float64
+    site_edges = np.array([[0, llim, len(rmap)]])
+    _products = counting.count_windowed_site_pairs(
+        rmap, bins, site_edges, weights=umap, dtype=dtype
+    )[0]
     products = ma.array(_products, mask=_products == 0)
     return products
- 
+
 
 def get_chromosome_uu(umap):
     # get the total sum of u * u site products on a chromosome
@@ -1,13 +1,19 @@
 """
 functions for fitting models to H2 and SFS statistics
 """
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
 import demes
+import multiprocessing
 import numpy as np
+import os
 import moments
 import scipy
+import time
 
 from archaic import util
-from archaic.spectra import H2Spectrum
+from archaic.spectra import H2Evaluator, H2Spectrum
 
 
 """
@@ -17,17 +23,40 @@ handling graphs and options/parameters
 
 def perturb_graph(graph_fname, options_fname, out_fname=None, timeout=1000):
     # uniformly and randomly pick parameter values
+    builder = moments.Demes.Inference._get_demes_dict(graph_fname)
+    options = moments.Demes.Inference._get_params_dict(options_fname)
+    p = get_perturbed_params(builder, options, timeout=timeout)
+    print(p)
+    builder = moments.Demes.Inference._update_builder(builder, options, p)
+    graph = demes.Graph.fromdict(builder)
+    if out_fname is not None:
+        demes.dump(graph, out_fname)
+    else:
+        return graph
+
+
+def get_perturbed_params(builder, options, rng=None, timeout=1000):
+    """
+    draw a parameter vector that satisfies the bounds and constraints in
+    options. parameters with lower bounds below 1 are drawn log-uniformly,
+    others uniformly.
+
+    :param builder: demes graph dictionary
+    :param options: moments options dictionary
+    :param rng: optional. numpy Generator; np.random is used by default
+    :param timeout: optional, default 1000. maximum number of draws
+    """
+    if rng is None:
+        rng = np.random
 
     def log_uniform(lower, upper):
         # sample parameters log-uniformly
         log_lower = np.log10(lower)
         log_upper = np.log10(upper)
-        log_draws = np.random.uniform(log_lower, log_upper)
+        log_draws = rng.uniform(log_lower, log_upper)
         draws = 10 ** log_draws
         return draws
 
-    builder = moments.Demes.Inference._get_demes_dict(graph_fname)
-    options = moments.Demes.Inference._get_params_dict(options_fname)
     pnames, p0, lower_bounds, upper_bounds = \
         moments.Demes.Inference._set_up_params_and_bounds(options, builder)
     constraints = moments.Demes.Inference._set_up_constraints(options, pnames)
@@ -41,7 +70,7 @@ def perturb_graph(graph_fname, options_fname, out_fname=None, timeout=1000):
 
     while not satisfied:
         p = np.zeros(len(p0))
-        p[above1] = np.random.uniform(
+        p[above1] = rng.uniform(
             lower_bounds[above1], upper_bounds[above1]
         )
         p[below1] = log_uniform(
@@ -50,20 +79,13 @@ def perturb_graph(graph_fname, options_fname, out_fname=None, timeout=1000):
         if constraints:
             if np.all(constraints(p) > 0):
                 satisfied = True
-                print(p)
             else:
                 i += 1
                 if i > timeout:
                     raise ValueError('parameter perturbation timeout!')
         else:
             satisfied = True
-
-    builder = moments.Demes.Inference._update_builder(builder, options, p)
-    graph = demes.Graph.fromdict(builder)
-    if out_fname is not None:
-        demes.dump(graph, out_fname)
-    else:
-        return out_fname
+    return p
 
 
 def get_param_arr(graph_fnames, options_fname, permissive=False):
@@ -90,8 +112,6 @@ optimization functions
 
 
 _out_of_bounds = -1e10
-_n_func_calls = 0
-_n_iters = 0
 
 
 _init_u = 1.35e-8
@@ -99,6 +119,466 @@ _lower_u = 1e-8
 _upper_u = 1.6e-8
 
 
+"""
+caching expected statistics
+"""
+
+
+class ModelCache:
+    """
+    a bounded least-recently-used cache of model expectations. keys combine a
+    parameter vector, rounded to a number of significant digits so that
+    nearly identical points coincide, with whatever else determines the
+    model (sample ids, r grid, u)
+    """
+
+    def __init__(self, max_size=1024, sig_digits=10):
+        """
+        :param max_size: optional, default 1024. maximum number of entries
+        :param sig_digits: optional, default 10. parameters are rounded to
+            this many significant digits when forming keys
+        """
+        self.max_size = max_size
+        self.sig_digits = sig_digits
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (
+            f'ModelCache(size={len(self)}, max_size={self.max_size}, '
+            f'hits={self.hits}, misses={self.misses})'
+        )
+
+    def get_key(self, p, *context):
+        # form a hashable key from rounded parameters and context objects
+        digits = self.sig_digits - 1
+        rounded = tuple(
+            float(np.format_float_scientific(x, digits)) for x in p
+        )
+        return (rounded,) + tuple(self._hashable(x) for x in context)
+
+    @staticmethod
+    def _hashable(x):
+        #
+        if isinstance(x, np.ndarray):
+            return (x.shape, x.tobytes())
+        if isinstance(x, (list, tuple)):
+            return tuple(ModelCache._hashable(y) for y in x)
+        return x
+
+    def get(self, key):
+        # returns None on a miss
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, model):
+        #
+        self._entries[key] = model
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_model(self, model_func, p, *context):
+        # look up the model for p and context, computing it on a miss
+        key = self.get_key(p, *context)
+        model = self.get(key)
+        if model is None:
+            model = model_func(p)
+            self.put(key, model)
+        return model
+
+    def clear(self):
+        #
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class FitSession:
+    """
+    the mutable state of one fit: its model cache, counts of objective
+    function calls and optimizer iterations, and timing. every fit owns a
+    session, so fits may run concurrently in threads or worker processes
+    """
+
+    def __init__(self, cache_size=1024):
+        """
+        :param cache_size: optional, default 1024. maximum number of models
+            to cache
+        """
+        self.cache = ModelCache(max_size=cache_size)
+        self.n_calls = 0
+        self.n_iters = 0
+        self.start_time = time.time()
+        self.best_p = None
+        self.best_f = np.inf
+        self.last_p = None
+        self.last_f = None
+
+    def __repr__(self):
+        return (
+            f'FitSession(n_calls={self.n_calls}, n_iters={self.n_iters}, '
+            f'elapsed={self.elapsed:.1f}, cache={self.cache})'
+        )
+
+    @property
+    def elapsed(self):
+        # seconds since the session began
+        return time.time() - self.start_time
+
+    def count_iter(self, xk, *args):
+        # used as a scipy optimizer callback
+        self.n_iters += 1
+
+    def update(self, p, f):
+        # record an objective function value
+        self.last_p = np.array(p, copy=True)
+        self.last_f = f
+        if f < self.best_f:
+            self.best_f = f
+            self.best_p = np.array(p, copy=True)
+
+    def restore(self, state):
+        # continue the counts and timing recorded in a checkpoint
+        self.n_calls = int(state['n_calls'])
+        self.n_iters = int(state['n_iters'])
+        self.start_time = time.time() - float(state['elapsed'])
+        self.best_p = np.array(state['p'])
+        self.best_f = float(state['fopt'])
+
+
+class H2Model:
+    """
+    a picklable function from parameter vectors to expected H2, so that
+    models can be built in worker processes
+    """
+
+    def __init__(self, builder, options, sample_ids, r, u=None, get_H=True):
+        """
+        :param builder: demes graph dictionary
+        :param options: moments options dictionary
+        :param sample_ids: list of sampled demes
+        :param r: recombination rates at which to compute expectations
+        :param u: optional. mutation rate. if None, u is taken as the last
+            element of p
+        :param get_H: optional, default True. whether to compute H
+        """
+        self.builder = builder
+        self.options = options
+        self.u = u
+        self.evaluator = H2Evaluator(sorted(sample_ids), r, get_H=get_H)
+
+    def __call__(self, p):
+        #
+        if self.u is None:
+            u = p[-1]
+        else:
+            u = self.u
+        builder = moments.Demes.Inference._update_builder(
+            self.builder, self.options, p
+        )
+        graph = demes.Graph.fromdict(builder)
+        return self.evaluator(graph, u)
+
+
+def _get_expected_SFS(graph, sampled_demes, sample_sizes, uL):
+    # the expected SFS for demes sampled at their end times
+    end_times = {d.name: d.end_time for d in graph.demes}
+    sample_times = [end_times[d] for d in sampled_demes]
+    return moments.Demes.SFS(
+        graph,
+        sampled_demes=sampled_demes,
+        sample_sizes=sample_sizes,
+        sample_times=sample_times,
+        u=uL
+    )
+
+
+class SFSModel:
+    """
+    a picklable function from parameter vectors to the expected SFS
+    """
+
+    def __init__(self, builder, options, pop_ids, sample_sizes, uL=None, L=1):
+        """
+        :param builder: demes graph dictionary
+        :param options: moments options dictionary
+        :param pop_ids: list of sampled demes
+        :param sample_sizes: list of haploid sample sizes
+        :param uL: optional. mutation rate times sequence length. if None,
+            u is taken as the last element of p
+        :param L: optional, default 1. sequence length, used when uL is None
+        """
+        self.builder = builder
+        self.options = options
+        self.pop_ids = pop_ids
+        self.sample_sizes = sample_sizes
+        self.uL = uL
+        self.L = L
+
+    def __call__(self, p):
+        #
+        if self.uL is None:
+            uL = self.L * p[-1]
+        else:
+            uL = self.uL
+        builder = moments.Demes.Inference._update_builder(
+            self.builder, self.options, p
+        )
+        graph = demes.Graph.fromdict(builder)
+        return _get_expected_SFS(graph, self.pop_ids, self.sample_sizes, uL)
+
+
+class CompositeModel:
+    """
+    a picklable function from parameter vectors to the expected SFS and H2,
+    computed from one graph
+    """
+
+    def __init__(
+        self,
+        builder,
+        options,
+        sample_ids,
+        r,
+        pop_ids,
+        sample_sizes,
+        L,
+        u=None
+    ):
+        """
+        :param sample_ids: list of demes sampled for H2
+        :param r: recombination rates at which to compute H2
+        :param pop_ids: list of demes sampled for the SFS
+        :param sample_sizes: list of haploid SFS sample sizes
+        :param L: sequence length of the SFS
+        :param u: optional. mutation rate. if None, u is taken as the last
+            element of p
+        """
+        self.builder = builder
+        self.options = options
+        self.evaluator = H2Evaluator(sorted(sample_ids), r, get_H=False)
+        self.pop_ids = pop_ids
+        self.sample_sizes = sample_sizes
+        self.L = L
+        self.u = u
+
+    def __call__(self, p):
+        #
+        if self.u is None:
+            u = p[-1]
+        else:
+            u = self.u
+        builder = moments.Demes.Inference._update_builder(
+            self.builder, self.options, p
+        )
+        graph = demes.Graph.fromdict(builder)
+        SFS_model = _get_expected_SFS(
+            graph, self.pop_ids, self.sample_sizes, u * self.L
+        )
+        H2_model = self.evaluator(graph, u)
+        return SFS_model, H2_model
+
+
+def evaluate_models(
+    model_func,
+    points,
+    n_workers=1,
+    cache=None,
+    executor=None
+):
+    """
+    compute expected statistics at many parameter vectors. points already
+    held by cache are looked up; the others are evaluated in parallel and
+    added to it.
+
+    :param model_func: function returning expected statistics given p. must
+        be picklable (e.g. an H2Model) when n_workers > 1
+    :param points: array of shape (n_points, n_params)
+    :param n_workers: optional, default 1. number of worker processes
+    :param cache: optional. a ModelCache
+    :param executor: optional. an open ProcessPoolExecutor to use in place
+        of a new pool of n_workers
+    :return: list of models
+    """
+    models = [None] * len(points)
+    if cache is not None:
+        keys = [cache.get_key(p) for p in points]
+        for i, key in enumerate(keys):
+            models[i] = cache.get(key)
+    missing = [i for i, model in enumerate(models) if model is None]
+    missing_points = [points[i] for i in missing]
+    if executor is not None:
+        new_models = list(executor.map(model_func, missing_points))
+    elif n_workers == 1 or len(missing) < 2:
+        new_models = [model_func(p) for p in missing_points]
+    else:
+        chunksize = max(1, len(missing) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            new_models = list(executor.map(
+                model_func, missing_points, chunksize=chunksize
+            ))
+    for i, model in zip(missing, new_models):
+        models[i] = model
+        if cache is not None:
+            cache.put(keys[i], model)
+    return models
+
+
+class FiniteDifferenceGradient:
+    """
+    finite-difference gradients of an objective function for use as fprime
+    or jac in scipy optimizers. the models at the perturbed points are built
+    concurrently and stored in the fit's model cache, so that evaluating the
+    objective at each point only computes a log-likelihood. steps are taken
+    relative to the magnitude of each parameter, and are one-sided where a
+    two-sided step would leave the bounds or violate the constraints.
+    """
+
+    def __init__(
+        self,
+        object_func,
+        model_func,
+        cache,
+        lower_bounds=None,
+        upper_bounds=None,
+        constraints=None,
+        delta=1e-4,
+        central=False,
+        n_workers=1,
+        session=None
+    ):
+        """
+        :param object_func: objective function taking (p, *args)
+        :param model_func: picklable function returning the models that
+            object_func looks up in cache
+        :param cache: the ModelCache used by object_func
+        :param lower_bounds: optional. array of lower parameter bounds
+        :param upper_bounds: optional. array of upper parameter bounds
+        :param constraints: optional. moments constraint function
+        :param delta: optional, default 1e-4. relative step size
+        :param central: optional, default False. if True, use central
+            differences (2p models per gradient) rather than forward
+            differences (p + 1 models)
+        :param n_workers: optional, default 1. number of worker processes
+        :param session: optional. the fit's FitSession. the objective value
+            it last recorded is reused when the gradient is taken at the
+            same point
+        """
+        self.object_func = object_func
+        self.model_func = model_func
+        self.cache = cache
+        self.lower_bounds = lower_bounds
+        self.upper_bounds = upper_bounds
+        self.constraints = constraints
+        self.delta = delta
+        self.central = central
+        self.n_workers = n_workers
+        self.session = session
+        self.n_calls = 0
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # shut down the worker pool
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def get_points(self, p):
+        """
+        get the parameter vectors at which to evaluate the objective. the
+        derivative in parameter i is estimated from points[idx_upper[i]] and
+        points[idx_lower[i]], which lie widths[i] apart. a step that leaves
+        the bounds or violates the constraints is replaced by a step in the
+        opposite direction; where neither is feasible, widths[i] is 0
+
+        :param p: parameter vector
+        :return: points, idx_upper, idx_lower, widths
+        """
+        p = np.array(p, dtype=float)
+        n = len(p)
+        hs = self.delta * np.where(p != 0, np.abs(p), 1)
+        steps = hs[:, np.newaxis] * np.eye(n)
+        # p, then each raised point, then each lowered point
+        candidates = np.vstack([p, p + steps, p - steps])
+        feasible = np.array([
+            check_params(x, self.lower_bounds, self.upper_bounds,
+                         self.constraints) == 0
+            for x in candidates
+        ])
+        can_raise = feasible[1:n + 1]
+        can_lower = feasible[n + 1:]
+        # forward and backward steps need the objective at p itself
+        central = (self.central | ~feasible[0]) & can_raise & can_lower
+        forward = ~central & can_raise & feasible[0]
+        backward = ~central & ~forward & can_lower & feasible[0]
+        idx_upper = np.where(central | forward, 1 + np.arange(n), 0)
+        idx_lower = np.where(central | backward, 1 + n + np.arange(n), 0)
+        widths = hs * (2 * central + forward + backward)
+        # keep only the candidates that are used
+        used = np.unique(np.concatenate([[0], idx_upper, idx_lower]))
+        remap = np.zeros(len(candidates), dtype=int)
+        remap[used] = np.arange(len(used))
+        return candidates[used], remap[idx_upper], remap[idx_lower], widths
+
+    def __call__(self, p, *args, object_func=None):
+        """
+        :param p: parameter vector
+        :param args: arguments to the objective function
+        :param object_func: optional. the objective function to evaluate,
+            e.g. an optimizer's wrapper around self.object_func
+        :return: gradient vector
+        """
+        self.n_calls += 1
+        if object_func is None:
+            object_func = self.object_func
+        points, idx_upper, idx_lower, widths = self.get_points(p)
+        # reuse the objective at p when the optimizer has just evaluated it
+        session = self.session
+        if session is not None and session.last_p is not None \
+                and np.array_equal(session.last_p, points[0]):
+            fs = [session.last_f]
+        else:
+            fs = []
+        # build models in parallel only at points the objective accepts
+        todo = points[len(fs):]
+        valid = [
+            check_params(x, self.lower_bounds, self.upper_bounds,
+                         self.constraints) == 0
+            for x in todo
+        ]
+        if self.n_workers > 1 and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        evaluate_models(
+            self.model_func,
+            todo[valid],
+            cache=self.cache,
+            executor=self._executor
+        )
+        fs = np.array(fs + [object_func(x, *args) for x in todo])
+        # the derivative is taken as 0 where there is no feasible step
+        grad = np.zeros(len(widths))
+        has_step = widths > 0
+        grad[has_step] = (
+            fs[idx_upper[has_step]] - fs[idx_lower[has_step]]
+        ) / widths[has_step]
+        return grad
+
+
 def fit_H2(
     graph_fname,
     options_fname,
@@ -108,7 +588,13 @@ def fit_H2(
     u=None,
     verbosity=1,
     use_H=True,
-    out_fname=None
+    out_fname=None,
+    p0=None,
+    monitor=None,
+    n_workers=1,
+    checkpoint_fname=None,
+    checkpoint_every=10,
+    resume=False
 ):
     #
     if not use_H and data.has_H:
@@ -119,8 +605,13 @@ def fit_H2(
     )
     builder = moments.Demes.Inference._get_demes_dict(graph_fname)
     options = moments.Demes.Inference._get_params_dict(options_fname)
-    pnames, p0, lower_bounds, upper_bounds = \
+    pnames, _p0, lower_bounds, upper_bounds = \
         moments.Demes.Inference._set_up_params_and_bounds(options, builder)
+    # p0 may be given to start away from the parameters in the graph
+    if p0 is None:
+        p0 = _p0
+    else:
+        p0 = np.array(p0, dtype=float)
     constraints = moments.Demes.Inference._set_up_constraints(options, pnames)
 
     if u is None:
@@ -135,6 +626,10 @@ def fit_H2(
 
     print_start(pnames, p0)
 
+    session = FitSession()
+    model_func = H2Model(
+        builder, options, data.sample_ids, data.r, u=u, get_H=use_H
+    )
     args = (
         builder,
         options,
@@ -145,21 +640,44 @@ def fit_H2(
         constraints,
         verbosity,
         fit_u,
-        use_H
-    )
-    ret = optimize(
-        objective_H2,
-        p0,
-        args,
-        u=u,
-        builder=builder,
-        options=options,
-        method=method,
-        max_iter=max_iter,
-        out_fname=out_fname,
-        bounds=(lower_bounds, upper_bounds),
-        fit_u=fit_u
+        use_H,
+        session,
+        model_func
     )
+    if n_workers > 1:
+        gradient = FiniteDifferenceGradient(
+            objective_H2,
+            model_func,
+            session.cache,
+            lower_bounds=lower_bounds,
+            upper_bounds=upper_bounds,
+            constraints=constraints,
+            n_workers=n_workers,
+            session=session
+        )
+    else:
+        # serial fits keep scipy's own gradient approximations
+        gradient = None
+    with gradient or contextlib.nullcontext():
+        ret = optimize(
+            objective_H2,
+            p0,
+            args,
+            u=u,
+            builder=builder,
+            options=options,
+            method=method,
+            max_iter=max_iter,
+            out_fname=out_fname,
+            bounds=(lower_bounds, upper_bounds),
+            fit_u=fit_u,
+            monitor=monitor,
+            session=session,
+            gradient=gradient,
+            checkpoint_fname=checkpoint_fname,
+            checkpoint_every=checkpoint_every,
+            resume=resume
+        )
     return ret
 
 
@@ -174,27 +692,33 @@ def objective_H2(
     constraints=None,
     verbosity=1,
     fit_u=False,
-    use_H=True
+    use_H=True,
+    session=None,
+    model_func=None
 ):
     #
-    global _n_func_calls
-    _n_func_calls += 1
-
-    if fit_u:
-        u = p[-1]
+    if session is None:
+        # calls outside of a fit are not counted or cached
+        session = FitSession()
+    session.n_calls += 1
 
     if check_params(p, lower_bounds, upper_bounds, constraints) != 0:
         return -_out_of_bounds
 
-    builder = moments.Demes.Inference._update_builder(builder, options, p)
-    graph = demes.Graph.fromdict(builder)
-    model = H2Spectrum.from_graph(
-        graph, data.sample_ids, data.r, u, get_H=use_H
-    )
+    if model_func is None:
+        model_func = H2Model(
+            builder,
+            options,
+            data.sample_ids,
+            data.r,
+            u=None if fit_u else u,
+            get_H=use_H
+        )
+    model = session.cache.get_model(model_func, p)
     ll = get_ll(model, data)
 
-    if verbosity > 0 and _n_func_calls % verbosity == 0:
-        print_status(_n_func_calls, ll, p)
+    if verbosity > 0 and session.n_calls % verbosity == 0:
+        print_status(session.n_calls, ll, p)
     return -ll
 
 
@@ -207,7 +731,13 @@ def fit_SFS(
     max_iter=1000,
     method='NelderMead',
     verbosity=1,
-    out_fname=None
+    out_fname=None,
+    p0=None,
+    monitor=None,
+    n_workers=1,
+    checkpoint_fname=None,
+    checkpoint_every=10,
+    resume=False
 ):
     #
     print(
@@ -216,8 +746,13 @@ def fit_SFS(
     )
     builder = moments.Demes.Inference._get_demes_dict(graph_fname)
     options = moments.Demes.Inference._get_params_dict(options_fname)
-    pnames, p0, lower_bounds, upper_bounds = \
+    pnames, _p0, lower_bounds, upper_bounds = \
         moments.Demes.Inference._set_up_params_and_bounds(options, builder)
+    # p0 may be given to start away from the parameters in the graph
+    if p0 is None:
+        p0 = _p0
+    else:
+        p0 = np.array(p0, dtype=float)
     constraints = moments.Demes.Inference._set_up_constraints(options, pnames)
 
     if uL is None:
@@ -235,6 +770,10 @@ def fit_SFS(
 
     print_start(pnames, p0)
 
+    session = FitSession()
+    model_func = SFSModel(
+        builder, options, data.pop_ids, data.sample_sizes, uL=uL, L=L
+    )
     args = (
         builder,
         options,
@@ -245,19 +784,42 @@ def fit_SFS(
         upper_bounds,
         constraints,
         verbosity,
-        fit_u
-    )
-    ret = optimize(
-        objective_SFS,
-        p0,
-        args,
-        builder=builder,
-        options=options,
-        method=method,
-        max_iter=max_iter,
-        out_fname=out_fname,
-        bounds=(lower_bounds, upper_bounds)
+        fit_u,
+        session,
+        model_func
     )
+    if n_workers > 1:
+        gradient = FiniteDifferenceGradient(
+            objective_SFS,
+            model_func,
+            session.cache,
+            lower_bounds=lower_bounds,
+            upper_bounds=upper_bounds,
+            constraints=constraints,
+            n_workers=n_workers,
+            session=session
+        )
+    else:
+        # serial fits keep scipy's own gradient approximations
+        gradient = None
+    with gradient or contextlib.nullcontext():
+        ret = optimize(
+            objective_SFS,
+            p0,
+            args,
+            builder=builder,
+            options=options,
+            method=method,
+            max_iter=max_iter,
+            out_fname=out_fname,
+            bounds=(lower_bounds, upper_bounds),
+            monitor=monitor,
+            session=session,
+            gradient=gradient,
+            checkpoint_fname=checkpoint_fname,
+            checkpoint_every=checkpoint_every,
+            resume=resume
+        )
     return ret
 
 
@@ -272,36 +834,33 @@ def objective_SFS(
     upper_bounds=None,
     constraints=None,
     verbosity=1,
-    fit_u=False
+    fit_u=False,
+    session=None,
+    model_func=None
 ):
     #
-    global _n_func_calls
-    _n_func_calls += 1
+    if session is None:
+        # calls outside of a fit are not counted or cached
+        session = FitSession()
+    session.n_calls += 1
 
     if check_params(p, lower_bounds, upper_bounds, constraints) != 0:
         return -_out_of_bounds
 
-    if fit_u:
-        u = p[-1]
-        uL = L * u
-
-    builder = moments.Demes.Inference._update_builder(builder, options, p)
-    graph = demes.Graph.fromdict(builder)
-    sampled_demes = data.pop_ids
-    sample_sizes = data.sample_sizes
-    end_times = {d.name: d.end_time for d in graph.demes}
-    sample_times = [end_times[d] for d in sampled_demes]
-    model = moments.Demes.SFS(
-        graph,
-        sampled_demes=sampled_demes,
-        sample_sizes=sample_sizes,
-        sample_times=sample_times,
-        u=uL
-    )
+    if model_func is None:
+        model_func = SFSModel(
+            builder,
+            options,
+            data.pop_ids,
+            data.sample_sizes,
+            uL=None if fit_u else uL,
+            L=L
+        )
+    model = session.cache.get_model(model_func, p)
     ll = moments.Inference.ll(model, data)
 
-    if verbosity > 0 and _n_func_calls % verbosity == 0:
-        print_status(_n_func_calls, ll, p)
+    if verbosity > 0 and session.n_calls % verbosity == 0:
+        print_status(session.n_calls, ll, p)
     return -ll
 
 
@@ -315,7 +874,13 @@ def fit_composite(
     L=None,
     u=None,
     verbosity=1,
-    out_fname=None
+    out_fname=None,
+    p0=None,
+    monitor=None,
+    n_workers=1,
+    checkpoint_fname=None,
+    checkpoint_every=10,
+    resume=False
 ):
     #
     if H2_data.has_H:
@@ -326,8 +891,13 @@ def fit_composite(
     )
     builder = moments.Demes.Inference._get_demes_dict(graph_fname)
     options = moments.Demes.Inference._get_params_dict(options_fname)
-    pnames, p0, lower_bounds, upper_bounds = \
+    pnames, _p0, lower_bounds, upper_bounds = \
         moments.Demes.Inference._set_up_params_and_bounds(options, builder)
+    # p0 may be given to start away from the parameters in the graph
+    if p0 is None:
+        p0 = _p0
+    else:
+        p0 = np.array(p0, dtype=float)
     constraints = moments.Demes.Inference._set_up_constraints(options, pnames)
 
     if L is None:
@@ -344,6 +914,17 @@ def fit_composite(
 
     print_start(pnames, p0)
 
+    session = FitSession()
+    model_func = CompositeModel(
+        builder,
+        options,
+        H2_data.sample_ids,
+        H2_data.r,
+        SFS_data.pop_ids,
+        SFS_data.sample_sizes,
+        L,
+        u=u
+    )
     args = (
         builder,
         options,
@@ -355,19 +936,42 @@ def fit_composite(
         upper_bounds,
         constraints,
         verbosity,
-        fit_u
-    )
-    ret = optimize(
-        objective_composite,
-        p0,
-        args,
-        builder=builder,
-        options=options,
-        method=method,
-        max_iter=max_iter,
-        out_fname=out_fname,
-        bounds=(lower_bounds, upper_bounds)
+        fit_u,
+        session,
+        model_func
     )
+    if n_workers > 1:
+        gradient = FiniteDifferenceGradient(
+            objective_composite,
+            model_func,
+            session.cache,
+            lower_bounds=lower_bounds,
+            upper_bounds=upper_bounds,
+            constraints=constraints,
+            n_workers=n_workers,
+            session=session
+        )
+    else:
+        # serial fits keep scipy's own gradient approximations
+        gradient = None
+    with gradient or contextlib.nullcontext():
+        ret = optimize(
+            objective_composite,
+            p0,
+            args,
+            builder=builder,
+            options=options,
+            method=method,
+            max_iter=max_iter,
+            out_fname=out_fname,
+            bounds=(lower_bounds, upper_bounds),
+            monitor=monitor,
+            session=session,
+            gradient=gradient,
+            checkpoint_fname=checkpoint_fname,
+            checkpoint_every=checkpoint_every,
+            resume=resume
+        )
     return ret
 
 
@@ -383,40 +987,35 @@ def objective_composite(
     upper_bounds=None,
     constraints=None,
     verbosity=1,
-    fit_u=False
+    fit_u=False,
+    session=None,
+    model_func=None
 ):
     #
-    global _n_func_calls
-    _n_func_calls += 1
+    if session is None:
+        # calls outside of a fit are not counted or cached
+        session = FitSession()
+    session.n_calls += 1
 
     if check_params(p, lower_bounds, upper_bounds, constraints) != 0:
         return -_out_of_bounds
 
-    if fit_u:
-        u = p[-1]
-        uL = L * u
-
-    builder = moments.Demes.Inference._update_builder(builder, options, p)
-    graph = demes.Graph.fromdict(builder)
-    # get expected SFS
-    sampled_demes = SFS_data.pop_ids
-    sample_sizes = SFS_data.sample_sizes
-    end_times = {d.name: d.end_time for d in graph.demes}
-    sample_times = [end_times[d] for d in sampled_demes]
-    SFS_model = moments.Demes.SFS(
-        graph,
-        sampled_demes=sampled_demes,
-        sample_sizes=sample_sizes,
-        sample_times=sample_times,
-        u=u * L
-    )
-    H2_model = H2Spectrum.from_graph(
-        graph, H2_data.sample_ids, H2_data.r, u, get_H=False
-    )
+    if model_func is None:
+        model_func = CompositeModel(
+            builder,
+            options,
+            H2_data.sample_ids,
+            H2_data.r,
+            SFS_data.pop_ids,
+            SFS_data.sample_sizes,
+            L,
+            u=None if fit_u else u
+        )
+    SFS_model, H2_model = session.cache.get_model(model_func, p)
     ll = moments.Inference.ll(SFS_model, SFS_data) + get_ll(H2_model, H2_data)
 
-    if verbosity > 0 and _n_func_calls % verbosity == 0:
-        print_status(_n_func_calls, ll, p)
+    if verbosity > 0 and session.n_calls % verbosity == 0:
+        print_status(session.n_calls, ll, p)
     return -ll
 
 
@@ -432,6 +1031,12 @@ def check_params(p, lower_bounds, upper_bounds, constraints):
     return ret
 
 
+# exit flags with which each optimize method reports reaching max_iter
+_max_iter_flags = dict(
+    NelderMead=2, Powell=2, BFGS=1, LBFGSB=1, TrustConstr=0, TNC=3
+)
+
+
 def optimize(
     object_func,
     p0,
@@ -443,7 +1048,13 @@ def optimize(
     max_iter=1000,
     out_fname=None,
     bounds=None,
-    fit_u=False
+    fit_u=False,
+    monitor=None,
+    session=None,
+    gradient=None,
+    checkpoint_fname=None,
+    checkpoint_every=10,
+    resume=False
 ):
     """
     minimizes an objective function from initial parameters p0 using a tuple
@@ -461,7 +1072,9 @@ def optimize(
     :param builder:
     :param options:
     :param method: (optional, default 'NelderMead'; specifies a scipy fmin
-        function. options are 'NelderMead', 'Powell', 'BGFS', 'LBFGSB'
+        function. options are 'NelderMead', 'Powell', 'BGFS', 'LBFGSB', or
+        the scipy.optimize.minimize methods 'TrustConstr' (trust-region)
+        and 'TNC' (bounded truncated Newton)
     :type method: string
     :param max_iter: (optional, default 1000) maximum number of scipy
         function iterations
@@ -470,72 +1083,243 @@ def optimize(
         arrays of the form (lower_bounds, upper_bounds)
     :param u:
     :param fit_u:
+    :param monitor: (optional) function called as monitor(p, f) after each
+        evaluation of object_func. it may stop the fit by raising an error
+    :param session: (optional) the FitSession passed to object_func in args.
+        it counts iterations and times the fit
+    :param gradient: (optional) function returning the gradient of
+        object_func given p and args, e.g. a FiniteDifferenceGradient. used
+        by the gradient-based methods, which otherwise approximate it
+        serially. it is called with object_func=, the wrapped objective.
+        fit_H2, fit_SFS and fit_composite pass a FiniteDifferenceGradient
+        only when n_workers > 1
+    :param checkpoint_fname: (optional) .npz file to which the optimizer
+        state is written every checkpoint_every iterations. it holds the
+        best parameters, function value and call counts, and the simplex
+        or direction set for the NelderMead and Powell methods
+    :param checkpoint_every: (optional, default 10)
+    :param resume: (optional, default False) if True and checkpoint_fname
+        exists, continue the optimization it records
     :return:
     """
-    methods = ['NelderMead', 'Powell', 'BFGS', 'LBFGSB']
+    methods = ['NelderMead', 'Powell', 'BFGS', 'LBFGSB', 'TrustConstr', 'TNC']
 
     if method not in methods:
         raise ValueError(f'method: {method} is not in {methods}')
 
-    if method == 'NelderMead':
-        opt = scipy.optimize.fmin(
-            object_func,
-            p0,
-            args=args,
-            maxiter=max_iter,
-            full_output=True
-        )
-        p = opt[0]
-        fopt, n_iter, func_calls, flag = opt[1:5]
+    if session is None:
+        session = FitSession()
+
+    state = {}
+    if resume and checkpoint_fname is not None:
+        if os.path.exists(checkpoint_fname):
+            state = read_checkpoint(checkpoint_fname)
+            if state['method'] != method:
+                raise ValueError(
+                    f'checkpoint {checkpoint_fname} was written by '
+                    f'{state["method"]}, not {method}'
+                )
+            session.restore(state)
+            p0 = state['p']
+            print(
+                util.get_time(),
+                f'resuming from {checkpoint_fname} after '
+                f'{session.n_iters} iterations'
+            )
+
+    def save_checkpoint(p, fopt, done=False, **kwargs):
+        # record optimizer state
+        if checkpoint_fname is not None:
+            write_checkpoint(
+                checkpoint_fname,
+                method=method,
+                p=p,
+                fopt=fopt,
+                done=done,
+                n_calls=session.n_calls,
+                n_iters=session.n_iters,
+                elapsed=session.elapsed,
+                **kwargs
+            )
+
+    func_name = object_func.__name__
+    _object_func = object_func
+    # objective values already known at the start of a segment, such as
+    # those of the saved simplex. they are returned without recomputing or
+    # counting them
+    known = {}
+
+    def object_func(p, *args):
+        key = tuple(p)
+        if key in known:
+            return known[key]
+        f = _object_func(p, *args)
+        session.update(p, f)
+        if monitor is not None:
+            monitor(p, f)
+        return f
+
+    if gradient is not None:
+        _gradient = gradient
+
+        def gradient(p, *args):
+            # gradient points are counted, recorded and monitored like
+            # any other evaluation of the objective
+            return _gradient(p, *args, object_func=object_func)
+
+    # the simplex and direction set methods run in segments of
+    # checkpoint_every iterations; restarting from the saved simplex or
+    # direction set continues the optimization where it stopped. for
+    # NelderMead the path is the same as that of an unsegmented run. Powell
+    # skips the extrapolation step at the end of each segment, so its path
+    # may differ slightly
+    if checkpoint_fname is None:
+        segment_iters = max_iter
+    else:
+        segment_iters = checkpoint_every
+
+    def callback(xk, *args):
+        # count iterations and save the best parameters seen so far
+        session.count_iter(xk)
+        if session.n_iters % checkpoint_every == 0:
+            save_checkpoint(session.best_p, session.best_f)
+
+    if state.get('done', False):
+        p = state['p']
+        fopt = state['fopt']
+        n_iter = session.n_iters
+        flag = int(state['flag'])
+
+    elif state and session.n_iters >= max_iter:
+        # the checkpointed run used up the iterations but was stopped
+        # before it finished
+        p = state['p']
+        fopt = state['fopt']
+        n_iter = session.n_iters
+        flag = _max_iter_flags[method]
+
+    elif method == 'NelderMead':
+        simplex = state.get('simplex')
+        if simplex is not None:
+            known.update(zip(map(tuple, simplex), state['simplex_f']))
+        while True:
+            opt = scipy.optimize.minimize(
+                object_func,
+                p0,
+                args=args,
+                method='Nelder-Mead',
+                options=dict(
+                    # scipy counts the initial simplex as an iteration
+                    maxiter=min(segment_iters, max_iter - session.n_iters) + 1,
+                    initial_simplex=simplex
+                )
+            )
+            session.n_iters += opt.nit - 1
+            simplex, simplex_f = opt.final_simplex
+            known.clear()
+            known.update(zip(map(tuple, simplex), simplex_f))
+            p0 = opt.x
+            save_checkpoint(
+                opt.x, opt.fun, simplex=simplex, simplex_f=simplex_f
+            )
+            if opt.status != 2 or session.n_iters >= max_iter:
+                break
+        p = opt.x
+        fopt = opt.fun
+        n_iter = session.n_iters
+        flag = opt.status
 
     elif method == 'BFGS':
         opt = scipy.optimize.fmin_bfgs(
             object_func,
             p0,
+            fprime=gradient,
             args=args,
-            maxiter=max_iter,
+            callback=callback,
+            maxiter=max_iter - session.n_iters,
             full_output=True
         )
         p = opt[0]
-        fopt, _, __, func_calls, grad_calls, flag = opt[1:7]
-        # is it correct to equate these?
-        n_iter = grad_calls
+        fopt, flag = opt[1], opt[6]
+        n_iter = session.n_iters
 
     elif method == 'LBFGSB':
         lower, upper = bounds
         _bounds = list(zip(lower, upper))
+        if gradient is None:
+            grad_kwargs = dict(epsilon=1e-2, approx_grad=True)
+        else:
+            grad_kwargs = dict(fprime=gradient)
         opt = scipy.optimize.fmin_l_bfgs_b(
             object_func,
             p0,
             args=args,
-            maxiter=max_iter,
+            callback=callback,
+            maxiter=max_iter - session.n_iters,
             bounds=_bounds,
-            epsilon=1e-2,
             pgtol=1e-5,
-            approx_grad=True
+            **grad_kwargs
         )
         p, fopt, d = opt
-        n_iter = d['nit']
-        func_calls = d['funcalls']
+        n_iter = session.n_iters
         flag = d['warnflag']
 
-    elif method == 'Powell':
-        opt = scipy.optimize.fmin_powell(
+    elif method in ['TrustConstr', 'TNC']:
+        lower, upper = bounds
+        # TNC limits function evaluations rather than iterations
+        if method == 'TrustConstr':
+            scipy_method = 'trust-constr'
+            scipy_options = dict(maxiter=max_iter - session.n_iters)
+        else:
+            scipy_method = 'TNC'
+            scipy_options = dict(maxfun=max_iter - session.n_iters)
+        opt = scipy.optimize.minimize(
             object_func,
             p0,
             args=args,
-            maxiter=max_iter,
-            full_output=True,
+            method=scipy_method,
+            jac=gradient,
+            bounds=scipy.optimize.Bounds(lower, upper),
+            callback=callback,
+            options=scipy_options
         )
-        p = opt[0]
-        fopt, _, n_iter, func_calls, flag = opt[1:6]
+        p = opt.x
+        fopt = opt.fun
+        n_iter = session.n_iters
+        flag = opt.status
+
+    elif method == 'Powell':
+        direc = state.get('direc')
+        if direc is not None:
+            known[tuple(p0)] = state['fopt']
+        while True:
+            opt = scipy.optimize.fmin_powell(
+                object_func,
+                p0,
+                args=args,
+                maxiter=min(segment_iters, max_iter - session.n_iters),
+                full_output=True,
+                disp=checkpoint_fname is None,
+                direc=direc
+            )
+            p0, fopt, direc, seg_iters, _, flag = opt[:6]
+            session.n_iters += seg_iters
+            known.clear()
+            known[tuple(p0)] = fopt
+            save_checkpoint(p0, fopt, direc=direc)
+            if flag != 2 or session.n_iters >= max_iter:
+                break
+        p = p0
+        n_iter = session.n_iters
 
     else:
         return 1
 
-    global _n_func_calls
-    print_status(_n_func_calls, 'fit p:', p)
-    _n_func_calls = 0
+    # objective evaluations across resumed runs, including those made for
+    # finite-difference gradients
+    func_calls = session.n_calls
+    save_checkpoint(p, fopt, done=True, flag=flag)
+    print_status(session.n_calls, 'fit p:', p)
 
     if fit_u:
         info_u = p[-1]
@@ -545,13 +1329,14 @@ def optimize(
 
     info = dict(
         method=method,
-        objective_func=object_func.__name__,
+        objective_func=func_name,
         fopt=-fopt,
         max_iter=max_iter,
         n_iter=n_iter,
         func_calls=func_calls,
         flag=flag,
-        u=info_u
+        u=info_u,
+        time=round(session.elapsed, 1)
     )
 
     print('\n'.join([f'{key}: {info[key]}' for key in info]))
@@ -570,6 +1355,193 @@ def optimize(
 
 
 
+"""
+multi-start optimization
+"""
+
+
+class AbandonedFit(Exception):
+    """
+    raised to stop a fit that has fallen far behind the best fit so far
+    """
+    pass
+
+
+class _StartMonitor:
+    # tracks the best objective value of one start and abandons it when its
+    # log-likelihood trails the best of all starts by more than delta
+
+    def __init__(self, shared_best, delta=None, after=100):
+        #
+        self.shared_best = shared_best
+        self.delta = delta
+        self.after = after
+        self.n_calls = 0
+        self.best_ll = -np.inf
+
+    def __call__(self, p, f):
+        #
+        self.n_calls += 1
+        ll = -f
+        if ll > self.best_ll:
+            self.best_ll = ll
+            with self.shared_best.get_lock():
+                if ll > self.shared_best.value:
+                    self.shared_best.value = ll
+        if self.delta is not None and self.n_calls >= self.after:
+            if self.best_ll < self.shared_best.value - self.delta:
+                raise AbandonedFit(
+                    f'log-likelihood {self.best_ll} trails the best fit '
+                    f'{self.shared_best.value} after {self.n_calls} calls'
+                )
+
+
+_shared_best = None
+
+
+def _init_multistart_worker(shared_best):
+    # give each worker process a handle on the best log-likelihood
+    global _shared_best
+    _shared_best = shared_best
+
+
+def _run_start(args):
+    # run one start. returns a dictionary describing the result
+    i, p0, fit_func, fit_args, fit_kwargs, delta, after = args
+    monitor = _StartMonitor(_shared_best, delta=delta, after=after)
+    result = dict(start=i, p0=p0)
+    try:
+        graph = fit_func(*fit_args, p0=p0, monitor=monitor, **fit_kwargs)
+        result['abandoned'] = False
+        result['ll'] = float(graph.metadata['opt_info']['fopt'])
+        result['graph'] = graph
+    except AbandonedFit:
+        result['abandoned'] = True
+        result['ll'] = monitor.best_ll
+        result['graph'] = None
+    result['n_calls'] = monitor.n_calls
+    return result
+
+
+def multistart(
+    fit_func,
+    graph_fname,
+    options_fname,
+    *args,
+    n_starts=10,
+    n_workers=1,
+    top_k=1,
+    seed=None,
+    abandon_delta=None,
+    abandon_after=100,
+    out_prefix=None,
+    **kwargs
+):
+    """
+    run fit_func from n_starts randomly perturbed initial parameter vectors
+    and rank the resulting graphs by log-likelihood. starts are run in
+    parallel and results are kept in memory; only the top_k graphs are
+    written to file.
+
+    :param fit_func: one of fit_H2, fit_SFS or fit_composite
+    :param graph_fname: path to the initial .yaml graph
+    :param options_fname: path to the .yaml options file
+    :param args: further positional arguments to fit_func, e.g. data
+    :param n_starts: optional, default 10. number of starts
+    :param n_workers: optional, default 1. number of worker processes
+    :param top_k: optional, default 1. number of graphs to write
+    :param seed: optional. seed for drawing initial parameters
+    :param abandon_delta: optional. abandon a start once its best
+        log-likelihood trails the best over all starts by more than this
+    :param abandon_after: optional, default 100. number of function calls
+        made by a start before it may be abandoned
+    :param out_prefix: optional. if given, the top_k graphs are saved as
+        {out_prefix}_best{k}.yaml
+    :param kwargs: keyword arguments to fit_func, e.g. method, max_iter
+    :return: list of result dictionaries for all starts, sorted by
+        decreasing ll. abandoned starts have graph None
+    """
+    builder = moments.Demes.Inference._get_demes_dict(graph_fname)
+    options = moments.Demes.Inference._get_params_dict(options_fname)
+    rng = np.random.default_rng(seed)
+    p0s = [get_perturbed_params(builder, options, rng=rng)
+           for _ in range(n_starts)]
+    fit_args = (graph_fname, options_fname) + args
+    kwargs['out_fname'] = None
+    tasks = [
+        (i, p0, fit_func, fit_args, kwargs, abandon_delta, abandon_after)
+        for i, p0 in enumerate(p0s)
+    ]
+    shared_best = multiprocessing.Value('d', -np.inf)
+    results = []
+
+    def report(result):
+        #
+        status = 'abandoned' if result['abandoned'] else 'finished'
+        print(
+            util.get_time(),
+            f'start {result["start"]} {status} with ll {result["ll"]} '
+            f'after {result["n_calls"]} calls'
+        )
+
+    if n_workers == 1:
+        _init_multistart_worker(shared_best)
+        for task in tasks:
+            result = _run_start(task)
+            report(result)
+            results.append(result)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_multistart_worker,
+            initargs=(shared_best,)
+        ) as executor:
+            futures = [executor.submit(_run_start, task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                report(result)
+                results.append(result)
+
+    results.sort(key=lambda result: result['ll'], reverse=True)
+    finished = [result for result in results if not result['abandoned']]
+    if out_prefix is not None:
+        for k, result in enumerate(finished[:top_k]):
+            out_fname = f'{out_prefix}_best{k + 1}.yaml'
+            demes.dump(result['graph'], out_fname)
+            print(
+                util.get_time(),
+                f'saved start {result["start"]} with ll {result["ll"]} '
+                f'at {out_fname}'
+            )
+    return results
+
+
+def write_checkpoint(fname, **state):
+    """
+    save optimizer state to an .npz file. the file is replaced atomically,
+    so it can be read at any time to follow the progress of a fit
+
+    :param fname: path to .npz file
+    :param state: arrays and scalars to save
+    """
+    _savez_atomic(fname, **state)
+
+
+def read_checkpoint(fname):
+    """
+    load optimizer state saved by write_checkpoint
+
+    :param fname: path to .npz file
+    :return: dictionary. scalars are returned as python objects
+    """
+    with np.load(fname) as file:
+        state = {key: file[key] for key in file.files}
+    for key in state:
+        if state[key].ndim == 0:
+            state[key] = state[key].item()
+    return state
+
+
 def print_start(pnames, p0):
 
     print_status(0, 'pnames', pnames)
@@ -598,9 +1570,6 @@ def print_status(n_calls, ll, p):
     print(t, _n, _ll, _p)
 
 
-_inv_cov_cache = {}
-
-
 def log_gaussian(x, mu, inv_cov):
 
     return -(x - mu) @ inv_cov @ (x - mu)
@@ -612,14 +1581,15 @@ def get_ll(model, data):
 
 
 def get_bin_ll(model, data):
-    # operates on H2Spectrum instances
-    xs = data.arr
+    # operates on H2Spectrum instances. the inverse Cholesky factors of the
+    # data covariances are computed once and held by data
     if data.covs is None:
         raise ValueError('data has no covariance matrix!')
-    else:
-        covs = data.covs
+    xs = data.arr
     mus = model.arr
-    return _get_bin_ll(xs, mus, covs)
+    if len(xs) != len(mus):
+        raise ValueError('data and model bins do not match')
+    return get_whitened_bin_ll(xs, mus, data.cov_factors)
 
 
 def _get_ll(xs, mus, covs):
@@ -632,15 +1602,191 @@ def _get_bin_ll(xs, mus, covs):
     lens = np.array([len(xs), len(mus), len(covs)])
     if not np.all(lens == lens[0]):
         raise ValueError('xs, mus, covs lengths do not match')
-    bin_ll = np.zeros(len(xs))
-    for i in range(len(xs)):
-        if i in _inv_cov_cache and np.all(_inv_cov_cache[i]['cov'] == covs[i]):
-            inv_cov = _inv_cov_cache[i]['inv']
+    _, factors = H2Spectrum.get_cov_factors(covs)
+    return get_whitened_bin_ll(xs, mus, factors)
+
+
+def get_whitened_bin_ll(xs, mus, factors):
+    """
+    compute -(x - mu) @ inv(cov) @ (x - mu) in every bin at once, from
+    whitening matrices W with W.T @ W = inv(cov). mus may stack the spectra
+    of many models along a leading axis.
+
+    :param xs: array of shape (n_bins, n_stats) holding data
+    :param mus: array of shape (n_bins, n_stats) or (n_models, n_bins,
+        n_stats) holding expectations
+    :param factors: array of shape (n_bins, n_stats, n_stats), for instance
+        H2Spectrum.cov_factors
+    :return: array of shape (n_bins,) or (n_models, n_bins)
+    """
+    resid = xs - np.asanyarray(mus)
+    z = np.matmul(factors, resid[..., np.newaxis])[..., 0]
+    return -np.einsum('...i,...i->...', z, z)
+
+
+def get_many_ll(models, data):
+    """
+    compute log-likelihoods of many models against one dataset in a single
+    batched kernel call, for grid searches and population-based optimizers.
+
+    :param models: list of H2Spectrum instances, or array of shape
+        (n_models, n_bins, n_stats)
+    :param data: H2Spectrum with covariances
+    :return: array of shape (n_models,)
+    """
+    if data.covs is None:
+        raise ValueError('data has no covariance matrix!')
+    if isinstance(models, np.ndarray):
+        mus = models
+    else:
+        mus = np.stack([model.arr for model in models])
+    if mus.shape[1:] != data.arr.shape:
+        raise ValueError('model and data shapes do not match')
+    return get_whitened_bin_ll(data.arr, mus, data.cov_factors).sum(1)
+
+
+"""
+likelihood surfaces
+"""
+
+
+def grid_ll(
+    model_func,
+    data,
+    axes,
+    ll_func=None,
+    n_workers=1,
+    cache=None,
+    n_refine=0,
+    chunk_size=None,
+    out_fname=None
+):
+    """
+    evaluate the log-likelihood on the grid spanned by one or more parameter
+    axes. models are built in parallel and looked up in a model cache.
+    optionally, the grid is refined around its maximum n_refine times; each
+    refined grid spans the cells adjacent to the maximum of the last with
+    the same number of points per axis.
+
+    if out_fname is given, the surfaces are saved there after every chunk of
+    points, and an interrupted run given the same out_fname resumes where
+    it stopped.
+
+    :param model_func: function returning expected statistics given p. must
+        be picklable (e.g. an H2Model) when n_workers > 1
+    :param data: data passed to ll_func
+    :param axes: list of 1d arrays of parameter values, one per parameter
+    :param ll_func: optional. function taking (model, data) and returning a
+        log-likelihood. by default get_ll for H2Spectrum data and
+        moments.Inference.ll otherwise
+    :param n_workers: optional, default 1. number of worker processes
+    :param cache: optional. a ModelCache; by default a new one large enough
+        to hold a whole grid is used, so that refinements reuse its models
+    :param n_refine: optional, default 0. number of refinements
+    :param chunk_size: optional. number of points evaluated between saves;
+        by default 4 per worker
+    :param out_fname: optional. .npz file for saving/resuming progress
+    :return: list of (axes, lls) tuples, one per grid level. lls has shape
+        (len(axes[0]), len(axes[1]), ...)
+    """
+    if ll_func is None:
+        if isinstance(data, H2Spectrum):
+            ll_func = get_ll
         else:
-            inv_cov = np.linalg.inv(covs[i])
-            _inv_cov_cache[i] = dict(cov=covs[i], inv=inv_cov)
-        bin_ll[i] = log_gaussian(xs[i], mus[i], inv_cov)
-    return bin_ll
+            ll_func = moments.Inference.ll
+    if cache is None:
+        cache = ModelCache(max_size=int(np.prod([len(a) for a in axes])))
+    if chunk_size is None:
+        chunk_size = 4 * n_workers
+    saved = {}
+    if out_fname is not None and os.path.exists(out_fname):
+        saved = dict(np.load(out_fname))
+        print(util.get_time(), f'resuming from {out_fname}')
+    levels = []
+    # lls may be nan, so evaluated points are recorded separately
+    evaluated = []
+    axes = [np.asarray(axis, dtype=float) for axis in axes]
+    executor = None
+    if n_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        for level in range(n_refine + 1):
+            if level > 0:
+                axes = refine_axes(*levels[-1])
+            shape = tuple(len(axis) for axis in axes)
+            lls = np.full(shape, np.nan)
+            done = np.zeros(shape, dtype=bool)
+            if f'll{level}' in saved:
+                for i, axis in enumerate(axes):
+                    if not np.array_equal(axis, saved[f'axis{level}_{i}']):
+                        raise ValueError(
+                            f'grid in {out_fname} does not match axes'
+                        )
+                lls = saved[f'll{level}']
+                done = saved[f'evaluated{level}']
+            levels.append((axes, lls))
+            evaluated.append(done)
+            points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1)
+            points = points.reshape(-1, len(axes))
+            flat_lls = lls.reshape(-1)
+            flat_done = done.reshape(-1)
+            todo = np.nonzero(~flat_done)[0]
+            for start in range(0, len(todo), chunk_size):
+                idx = todo[start:start + chunk_size]
+                models = evaluate_models(
+                    model_func, points[idx], cache=cache, executor=executor
+                )
+                flat_lls[idx] = [ll_func(model, data) for model in models]
+                flat_done[idx] = True
+                if out_fname is not None:
+                    _save_grid(out_fname, levels, evaluated)
+            best = np.unravel_index(np.nanargmax(lls), shape)
+            print(
+                util.get_time(),
+                f'grid level {level}: max ll {lls[best]} at '
+                f'{[float(axis[i]) for axis, i in zip(axes, best)]}'
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return levels
+
+
+def refine_axes(axes, lls):
+    """
+    get axes spanning the grid cells adjacent to the maximum of lls, with
+    the same number of points as the given axes. nan values are ignored
+
+    :param axes: list of 1d arrays
+    :param lls: array of log-likelihoods on the grid spanned by axes
+    :return: list of 1d arrays
+    """
+    best = np.unravel_index(np.nanargmax(lls), lls.shape)
+    new_axes = []
+    for axis, i in zip(axes, best):
+        lower = axis[max(i - 1, 0)]
+        upper = axis[min(i + 1, len(axis) - 1)]
+        new_axes.append(np.linspace(lower, upper, len(axis)))
+    return new_axes
+
+
+def _save_grid(out_fname, levels, evaluated):
+    # write to a temporary file first, so that an interruption never leaves
+    # a partly written file behind. checkpoints are saved the same way
+    arrs = {}
+    for level, (axes, lls) in enumerate(levels):
+        for i, axis in enumerate(axes):
+            arrs[f'axis{level}_{i}'] = axis
+        arrs[f'll{level}'] = lls
+        arrs[f'evaluated{level}'] = evaluated[level]
+    _savez_atomic(out_fname, **arrs)
+
+
+def _savez_atomic(fname, **arrs):
+    #
+    tmp_fname = f'{fname}.tmp.npz'
+    np.savez(tmp_fname, **arrs)
+    os.replace(tmp_fname, fname)
 
 
 """
@@ -655,7 +1801,8 @@ def get_uncerts(
     bootstraps=None,
     u=None,
     delta=0.01,
-    method='GIM'
+    method='GIM',
+    n_workers=1
 ):
     #
     builder = moments.Demes.Inference._get_demes_dict(graph_fname)
@@ -669,25 +1816,10 @@ def get_uncerts(
         _u = float(g.metadata['opt_info']['u'])
         pnames.append('u')
         p0 = np.append(p0, _u)
-        fit_u = True
-    else:
-        fit_u = False
 
-    def model_func(p):
-        # takes parameters and returns expected statistics
-        nonlocal builder
-        nonlocal options
-        nonlocal data
-        nonlocal u
-        nonlocal fit_u
-
-        if fit_u:
-            u = p[-1]
-
-        builder = moments.Demes.Inference._update_builder(builder, options, p)
-        graph = demes.Graph.fromdict(builder)
-        model = H2Spectrum.from_graph(graph, data.sample_ids, data.r, u)
-        return model
+    model_func = H2Model(
+        builder, options, data.sample_ids, data.r, u=u, get_H=data.has_H
+    )
 
     if method == 'FIM':
         H = get_godambe_matrix(
@@ -696,7 +1828,8 @@ def get_uncerts(
             data,
             bootstraps,
             delta,
-            just_H=True
+            just_H=True,
+            n_workers=n_workers
         )
         uncerts = np.sqrt(np.diag(np.linalg.inv(H)))
 
@@ -708,7 +1841,8 @@ def get_uncerts(
             p0,
             data,
             bootstraps,
-            delta
+            delta,
+            n_workers=n_workers
         )
         uncerts = np.sqrt(np.diag(np.linalg.inv(godambe_matrix)))
     else:
@@ -717,113 +1851,125 @@ def get_uncerts(
     return pnames, p0, uncerts
 
 
-_ll_cache = {}
-
-
 def get_godambe_matrix(
     model_func,
     p0,
     data,
     bootstraps,
     delta,
-    just_H=False
+    just_H=False,
+    cache=None,
+    n_workers=1
 ):
     """
+    compute the Godambe information matrix H @ inv(J) @ H, where H is the
+    Hessian of the log-likelihood at p0 and J the mean outer product of
+    bootstrap score vectors. the finite-difference stencil is enumerated
+    once and its models are built in parallel, then shared between the
+    Hessian and the gradient of every bootstrap dataset.
+
+    :param model_func: function returning expected statistics given p. must
+        be picklable when n_workers > 1
+    :param p0: parameter vector
+    :param data: H2Spectrum
+    :param bootstraps: list of bootstrap H2Spectrum instances
+    :param delta: relative finite-difference step
+    :param just_H: optional, default False. if True, return only H
+    :param cache: optional. a ModelCache holding models from earlier calls
+    :param n_workers: optional, default 1. number of worker processes
     """
-
-    def func(p, data):
-        # compute log-likelihood given parameters, data
-        # cache check
-        key = tuple(p)
-        if key in _ll_cache:
-            model = _ll_cache[key]
-        else:
-            model = model_func(p)
-            _ll_cache[key] = model
-        return get_ll(model, data)
-
-    H = -get_hessian(func, p0, data, delta)
+    points, hs = get_stencil(p0, delta, hessian=True)
+    models = evaluate_models(model_func, points, n_workers, cache=cache)
+    H = -get_stencil_hessian(get_many_ll(models, data), hs)
 
     if just_H:
         return H
 
-    J = np.zeros((len(p0), len(p0)))
-    for i, bootstrap in enumerate(bootstraps):
-        cU = get_gradient(func, p0, delta, bootstrap)
-        cJ = cU @ cU.T
-        J += cJ
-
-    J = J / len(bootstraps)
+    # gradients only need the points p0 +- h_i at the head of the stencil
+    n_grad = 2 * len(p0) + 1
+    scores = np.array([
+        get_stencil_gradient(get_many_ll(models[:n_grad], bootstrap), hs)
+        for bootstrap in bootstraps
+    ])
+    J = scores.T @ scores / len(bootstraps)
     J_inv = np.linalg.inv(J)
     godambe_matrix = H @ J_inv @ H
     return godambe_matrix
 
 
-def get_hessian(ll_func, p0, data, delta):
-    #
-    f0 = ll_func(p0, data)
+def get_stencil(p0, delta, hessian=True):
+    """
+    enumerate the unique parameter vectors needed for central finite
+    differences with steps h = delta * p0. the stencil begins with p0, then
+    p0 + h_i and p0 - h_i for each i; for the Hessian it continues with
+    p0 +- h_i +- h_j for each pair i < j in the order ++, +-, -+, --.
+
+    :param p0: parameter vector
+    :param delta: relative step size
+    :param hessian: optional, default True. if False, enumerate only the
+        points needed for the gradient
+    :return: array of points, array of steps
+    """
+    p0 = np.array(p0, dtype=float)
+    n = len(p0)
     hs = delta * p0
-
-    hessian = np.zeros((len(p0), len(p0)))
-
-    for i in range(len(p0)):
-        for j in range(i, len(p0)):
-            _p = np.array(p0, copy=True, dtype=float)
-
-            if i == j:
-                _p[i] = p0[i] + hs[i]
-                fp = ll_func(_p, data)
-                _p[i] = p0[i] - hs[i]
-                fm = ll_func(_p, data)
-
-                element = (fp - 2 * f0 + fm) / hs[i] ** 2
-
-            else:
-                _p[i] = p0[i] + hs[i]
-                _p[j] = p0[j] + hs[j]
-                fpp = ll_func(_p, data)
-
-                _p[i] = p0[i] + hs[i]
-                _p[j] = p0[j] - hs[j]
-                fpm = ll_func(_p, data)
-
-                _p[i] = p0[i] - hs[i]
-                _p[j] = p0[j] + hs[j]
-                fmp = ll_func(_p, data)
-
-                _p[i] = p0[i] - hs[i]
-                _p[j] = p0[j] - hs[j]
-                fmm = ll_func(_p, data)
-
-                element = (fpp - fpm - fmp + fmm) / (4 * hs[i] * hs[j])
-
+    steps = [np.zeros(n)]
+    for i in range(n):
+        for sign in (1, -1):
+            step = np.zeros(n)
+            step[i] = sign * hs[i]
+            steps.append(step)
+    if hessian:
+        for i in range(n):
+            for j in range(i + 1, n):
+                for sign_i, sign_j in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+                    step = np.zeros(n)
+                    step[i] = sign_i * hs[i]
+                    step[j] = sign_j * hs[j]
+                    steps.append(step)
+    points = p0 + np.array(steps)
+    return points, hs
+
+
+def get_stencil_gradient(fs, hs):
+    # central-difference gradient from function values on a stencil
+    n = len(hs)
+    fp = fs[1:2 * n + 1:2]
+    fm = fs[2:2 * n + 1:2]
+    return (fp - fm) / (2 * hs)
+
+
+def get_stencil_hessian(fs, hs):
+    # central-difference Hessian from function values on a full stencil
+    n = len(hs)
+    f0 = fs[0]
+    fp = fs[1:2 * n + 1:2]
+    fm = fs[2:2 * n + 1:2]
+    hessian = np.diag((fp - 2 * f0 + fm) / hs ** 2)
+    k = 2 * n + 1
+    for i in range(n):
+        for j in range(i + 1, n):
+            fpp, fpm, fmp, fmm = fs[k:k + 4]
+            element = (fpp - fpm - fmp + fmm) / (4 * hs[i] * hs[j])
             hessian[i, j] = element
             hessian[j, i] = element
-
+            k += 4
     return hessian
 
 
-def get_gradient(func, p0, delta, args):
+def get_hessian(ll_func, p0, data, delta):
     #
+    points, hs = get_stencil(p0, delta, hessian=True)
+    fs = np.array([ll_func(p, data) for p in points])
+    return get_stencil_hessian(fs, hs)
 
-    # should be changed to match moments version
-    hs = delta * p0
-
-    # column
-    gradient = np.zeros((len(p0), 1))
-
-    for i in range(len(p0)):
-        _p = np.array(p0, copy=True, dtype=float)
 
-        _p[i] = p0[i] + hs[i]
-        fp = func(_p, args)
-
-        _p[i] = p0[i] - hs[i]
-        fm = func(_p, args)
-
-        gradient[i] = (fp - fm) / (2 * hs[i])
-
-    return gradient
+def get_gradient(func, p0, delta, args):
+    # returns a column vector
+    points, hs = get_stencil(p0, delta, hessian=False)
+    fs = np.array([func(p, args) for p in points[1:]])
+    gradient = (fs[0::2] - fs[1::2]) / (2 * hs)
+    return gradient[:, np.newaxis]
 
 
 """
@@ -1,6 +1,7 @@
 """
 Functions for parsing statistics from .vcf files
 """
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import time
 
@@ -27,6 +28,107 @@ def get_two_sample_site_H(gts_x, gts_y):
     return site_H
 
 
+def get_alt_dosages(genotype_arr):
+    # count the non-reference alleles carried by each sample at each site.
+    # shape (n_sites, n_samples)
+    return (genotype_arr != 0).sum(2, dtype=np.uint8)
+
+
+def _get_cum_sums(arr):
+    # cumulative sums along axis 0 with a leading row of zeros, so that
+    # sums over [start, end) are cum[end] - cum[start]
+    cum = np.zeros((len(arr) + 1,) + arr.shape[1:], dtype=np.float64)
+    np.cumsum(arr, axis=0, out=cum[1:])
+    return cum
+
+
+def _get_window_cross_prods(arr, edges):
+    # for each window [start, end) of sites, sum the products of columns of
+    # arr over sites; arr[start:end].T @ arr[start:end]. products of each
+    # pair of columns are summed cumulatively and differenced at the window
+    # edges. shape (n_windows, n_samples, n_samples)
+    n = arr.shape[1]
+    rows, cols = np.triu_indices(n)
+    cum = _get_cum_sums(arr[:, rows].astype(np.float64) * arr[:, cols])
+    sums = cum[edges[:, 1]] - cum[edges[:, 0]]
+    prods = np.zeros((len(edges), n, n))
+    prods[:, rows, cols] = sums
+    prods[:, cols, rows] = sums
+    return prods
+
+
+def compute_two_sample_H(genotype_arr, edges):
+    """
+    compute the summed probability of sampling distinct alleles from each
+    pair of samples in windows of sites, for all pairs at once.
+
+    for alt allele dosages d, the per-site probability for samples i, j at a
+    biallelic site is (d_i(2 - d_j) + d_j(2 - d_i)) / 4. summed over a window
+    this is (2 S_i + 2 S_j - 2 P_ij) / 4, where S holds dosage sums and P
+    dosage cross-products; P comes from one matrix product per window. at
+    multiallelic sites the cross-product is split into a total-dosage term
+    and one term per alt allele, which gives the exact mismatch probability
+
+    :param genotype_arr: array of shape (n_sites, n_samples, 2)
+    :param edges: array of shape (n_windows, 2) holding site index windows
+    :return: array of shape (n_windows, n_samples, n_samples)
+    """
+    edges = np.asanyarray(edges).reshape(-1, 2)
+    dosages = get_alt_dosages(genotype_arr)
+    cum_dosages = _get_cum_sums(dosages)
+    sums = cum_dosages[edges[:, 1]] - cum_dosages[edges[:, 0]]
+    prods = _get_window_cross_prods(dosages, edges)
+    max_allele = genotype_arr.max() if genotype_arr.size > 0 else 0
+    if max_allele > 1:
+        allele_prods = np.zeros(prods.shape)
+        for allele in range(1, max_allele + 1):
+            allele_dosages = (genotype_arr == allele).sum(2, dtype=np.uint8)
+            allele_prods += _get_window_cross_prods(allele_dosages, edges)
+    else:
+        allele_prods = prods
+    H = (
+        2 * sums[:, :, np.newaxis]
+        + 2 * sums[:, np.newaxis, :]
+        - prods
+        - allele_prods
+    ) / 4
+    return H
+
+
+def get_site_H(genotype_arr, get_two_sample=True):
+    """
+    compute per-site H for every statistic from the dosage matrix. one-sample
+    columns indicate heterozygosity and two-sample columns hold the
+    probability of sampling distinct alleles, as in get_two_sample_site_H.
+    columns are ordered as (0, 0), (0, 1), .. (0, n - 1), (1, 1), ..
+
+    :param genotype_arr: array of shape (n_sites, n_samples, 2)
+    :param get_two_sample: optional, default True. if False, only return the
+        one-sample columns
+    :return: array of shape (n_sites, n_stats)
+    """
+    het = (genotype_arr[:, :, 0] != genotype_arr[:, :, 1]).astype(np.float64)
+    if not get_two_sample:
+        return het
+    _, n_samples, __ = genotype_arr.shape
+    rows, cols = np.triu_indices(n_samples)
+    dosages = get_alt_dosages(genotype_arr).astype(np.float64)
+    prods = dosages[:, rows] * dosages[:, cols]
+    max_allele = genotype_arr.max() if genotype_arr.size > 0 else 0
+    if max_allele > 1:
+        allele_prods = np.zeros(prods.shape)
+        for allele in range(1, max_allele + 1):
+            allele_dosages = (genotype_arr == allele).sum(2).astype(np.float64)
+            allele_prods += allele_dosages[:, rows] * allele_dosages[:, cols]
+    else:
+        allele_prods = prods
+    site_H = (
+        2 * dosages[:, rows] + 2 * dosages[:, cols] - prods - allele_prods
+    ) / 4
+    site_H[:, rows == cols] = het
+    return site_H
+
+
 def compute_H(
     positions,
     genotype_arr,
@@ -38,35 +140,22 @@ def compute_H(
     if windows is None:
         windows = np.array([[positions[0], positions[-1] + 1]])
 
-    n_sites = np.diff(np.searchsorted(positions, windows))[:, 0]
+    n_sites = np.diff(util.rank_sites(positions, windows))[:, 0]
     _, n_samples, __ = genotype_arr.shape
+    vcf_edges = np.searchsorted(vcf_positions, windows[:, :2])
 
-    if get_two_sample:
-        n_stats = n_samples + util.n_choose_2(n_samples)
-    else:
-        n_stats = n_samples
-
-    num_H = np.zeros((len(windows), n_stats))
-
-    for z, window in enumerate(windows):
-        vcf_start, vcf_end = np.searchsorted(vcf_positions, window)
-        k = 0
-
-        for i in range(n_samples):
-            for j in range(i, n_samples):
-                if i == j:
-                    gts = genotype_arr[vcf_start:vcf_end, i]
-                    site_H = gts[:, 0] != gts[:, 1]
-                    num_H[z, k] = site_H.sum()
-                    k += 1
-                else:
-                    if not get_two_sample:
-                        continue
-                    gts_i = genotype_arr[vcf_start:vcf_end, i]
-                    gts_j = genotype_arr[vcf_start:vcf_end, j]
-                    site_H = get_two_sample_site_H(gts_i, gts_j)
-                    num_H[z, k] = site_H.sum()
-                    k += 1
+    # one-sample H counts heterozygous sites
+    het = genotype_arr[:, :, 0] != genotype_arr[:, :, 1]
+    cum_het = _get_cum_sums(het)
+    one_sample_H = cum_het[vcf_edges[:, 1]] - cum_het[vcf_edges[:, 0]]
+
+    if not get_two_sample:
+        return n_sites, one_sample_H
+
+    two_sample_H = compute_two_sample_H(genotype_arr, vcf_edges)
+    rows, cols = np.triu_indices(n_samples)
+    num_H = two_sample_H[:, rows, cols]
+    num_H[:, rows == cols] = one_sample_H
 
     return n_sites, num_H
 
@@ -138,7 +227,7 @@ def compute_H2(
     # num H2 has shape (n_windows, n_samples + n_pairs, n_bins)
     if windows is None:
         windows = np.array(
-            [[positions[0], positions[-1] + 1], positions[-1] + 1]
+            [[positions[0], positions[-1] + 1, positions[-1] + 1]]
         )
     if bins is None:
         bins = _default_bins
@@ -146,64 +235,25 @@ def compute_H2(
     # convert bins in r into bins in cM
     bins = util.map_function(bins)
 
-    vcf_r_map = r_map[np.searchsorted(positions, genotype_positions)]
-    _, n_samples, __ = genotype_arr.shape
+    vcf_r_map = r_map[util.rank_sites(positions, genotype_positions)]
 
-    if get_two_sample:
-        n_stats = n_samples + util.n_choose_2(n_samples)
+    # all windows are counted in one sweep over their left loci
+    if get_denominator:
+        site_edges = counting.get_window_site_edges(positions, windows)
+        num_pairs = counting.count_windowed_site_pairs(
+            r_map, bins, site_edges
+        )
     else:
-        n_stats = n_samples
-
-    num_pairs = np.zeros((len(windows), len(bins) - 1))
-    num_H2 = np.zeros((len(windows), n_stats, len(bins) - 1))
-
-    for w, (w_start, w_l_end, w_r_end) in enumerate(windows):
-
-        if get_denominator:
-            start = np.searchsorted(positions, w_start)
-            right_bound = np.searchsorted(positions, w_r_end)
-            left_bound = np.searchsorted(positions[start:], w_l_end)
-
-            num_pairs[w] = counting.count_site_pairs(
-                r_map[start:right_bound], bins, left_bound=left_bound
-            )
-
-        # these index vcf positions / genotypes
-        vcf_start = np.searchsorted(genotype_positions, w_start)
-        vcf_rbound = np.searchsorted(genotype_positions, w_r_end)
-        vcf_lbound = np.searchsorted(genotype_positions[vcf_start:], w_l_end)
-
-        win_vcf_positions = genotype_positions[vcf_start:vcf_rbound]
-        win_vcf_r_map = vcf_r_map[vcf_start:vcf_rbound]
-        win_genotype_arr = genotype_arr[vcf_start:vcf_rbound]
-
-        k = 0
-
-        for i in range(n_samples):
-            for j in range(i, n_samples):
-                if i == j:
-                    gts = win_genotype_arr[:, i]
-                    site_H = gts[:, 0] != gts[:, 1]
-                    H_idx = np.nonzero(site_H)[0]
-                    H_r_map = win_vcf_r_map[H_idx]
-                    H_positions = win_vcf_positions[H_idx]
-                    H_lbound = np.searchsorted(H_positions, w_l_end)
-                    num_H2[w, k] = counting.count_site_pairs(
-                        H_r_map, bins, left_bound=H_lbound
-                    )
-                    k += 1
-                else:
-                    if not get_two_sample:
-                        continue
-                    gts_i = win_genotype_arr[:, i]
-                    gts_j = win_genotype_arr[:, j]
-                    site_H = get_two_sample_site_H(gts_i, gts_j)
-                    num_H2[w, k] = counting.count_weighted_site_pairs(
-                        site_H, win_vcf_r_map, bins, left_bound=vcf_lbound
-                    )
-                    k += 1
-
-        print(util.get_time(), f'computed H2 in window {w}')
+        num_pairs = np.zeros((len(windows), len(bins) - 1))
+
+    # all statistics share one pass. one-sample H2 weights pairs by
+    # heterozygosity indicators
+    vcf_edges = counting.get_window_site_edges(genotype_positions, windows)
+    site_H = get_site_H(genotype_arr, get_two_sample=get_two_sample)
+    num_H2 = counting.count_windowed_site_pairs(
+        vcf_r_map, bins, vcf_edges, weights=site_H
+    )
+    print(util.get_time(), f'computed H2 in {len(windows)} windows')
 
     return num_pairs, num_H2
 
@@ -221,10 +271,7 @@ def compute_weighted_H2(
 
     bins = util.map_function(bins)
 
-    vcf_r_map = r_map[np.searchsorted(positions, genotype_pos)]
-    _, n_samples, __ = genotype_arr.shape
-    n_stats = util.n_choose_2(n_samples) + n_samples
-    num_H2 = np.zeros((len(windows), n_stats, len(bins) - 1))
+    vcf_r_map = r_map[util.rank_sites(positions, genotype_pos)]
 
     """
     if get_denominator:
@@ -246,43 +293,74 @@ def compute_weighted_H2(
         denom = np.zeros((len(windows), len(bins) - 1))
 
 
-    for w, (w_start, w_l_end, w_r_end) in enumerate(windows):
-        vcf_start = np.searchsorted(genotype_pos, w_start)
-        vcf_rbound = np.searchsorted(genotype_pos, w_r_end)
-        vcf_lbound = np.searchsorted(genotype_pos[vcf_start:], w_l_end)
-
-        win_vcf_positions = genotype_pos[vcf_start:vcf_rbound]
-        win_vcf_r_map = vcf_r_map[vcf_start:vcf_rbound]
-        win_genotype_arr = genotype_arr[vcf_start:vcf_rbound]
-
-        k = 0
-
-        for i in range(n_samples):
-            for j in range(i, n_samples):
-                if i == j:
-                    gts = win_genotype_arr[:, i]
-                    site_H = gts[:, 0] != gts[:, 1]
-                    H_idx = np.nonzero(site_H)[0]
-                    H_r_map = win_vcf_r_map[H_idx]
-                    H_positions = win_vcf_positions[H_idx]
-                    H_lbound = np.searchsorted(H_positions, w_l_end)
-                    num_H2[w, k] = dev.count_num_pairs(
-                        H_r_map, bins, llim=H_lbound
-                    )
-                else:
-                    gts_i = win_genotype_arr[:, i]
-                    gts_j = win_genotype_arr[:, j]
-                    site_H = get_two_sample_site_H(gts_i, gts_j)
-                    num_H2[w, k] = counting.count_weighted_site_pairs(
-                        site_H, win_vcf_r_map, bins, left_bound=vcf_lbound
-                    )
-                k += 1
-
-        print(util.get_time(), f'computed H2 in window {w}')
+    vcf_edges = counting.get_window_site_edges(genotype_pos, windows)
+    H2_stat = counting.PairStatistic('H2_counts', get_site_H(genotype_arr))
+    num_H2 = counting.compute_pair_statistics(
+        [H2_stat], vcf_r_map, bins, vcf_edges
+    )['H2_counts']
+    print(util.get_time(), f'computed H2 in {len(windows)} windows')
 
     return denom, num_H2
 
 
+def compute_H_H2(
+    positions,
+    genotype_arr,
+    genotype_positions,
+    r_map,
+    bins=None,
+    windows=None,
+    get_two_sample=True,
+    get_denominator=True
+):
+    """
+    compute one- and two-locus statistics together. window edges are found
+    once, and the per-site H matrix is built once and used for both H and
+    H2; one-locus H is summed over the left-locus range of each window.
+
+    :param positions: sorted position vector or util.SiteIndex of the mask
+    :param genotype_arr: array of shape (n_sites, n_samples, 2)
+    :param genotype_positions: positions of the genotyped sites
+    :param r_map: recombination map for positions, in cM
+    :param bins: optional. bins in r
+    :param windows: optional. array of shape (n_windows, 3)
+    :param get_two_sample: optional, default True
+    :param get_denominator: optional, default True. if False, n_site_pairs
+        is returned as zeros
+    :return: n_sites, H_counts, n_site_pairs and H2_counts arrays
+    """
+    if windows is None:
+        windows = np.array(
+            [[positions[0], positions[-1] + 1, positions[-1] + 1]]
+        )
+    if bins is None:
+        bins = _default_bins
+    bins = util.map_function(bins)
+
+    site_edges = counting.get_window_site_edges(positions, windows)
+    vcf_edges = counting.get_window_site_edges(genotype_positions, windows)
+    num_sites = site_edges[:, 1] - site_edges[:, 0]
+
+    site_H = get_site_H(genotype_arr, get_two_sample=get_two_sample)
+    cum_H = _get_cum_sums(site_H)
+    num_H = cum_H[vcf_edges[:, 1]] - cum_H[vcf_edges[:, 0]]
+
+    if get_denominator:
+        num_pairs = counting.count_windowed_site_pairs(
+            r_map, bins, site_edges
+        )
+    else:
+        num_pairs = np.zeros((len(windows), len(bins) - 1))
+
+    vcf_r_map = r_map[util.rank_sites(positions, genotype_positions)]
+    num_H2 = counting.count_windowed_site_pairs(
+        vcf_r_map, bins, vcf_edges, weights=site_H
+    )
+    print(util.get_time(), f'computed H, H2 in {len(windows)} windows')
+
+    return num_sites, num_H, num_pairs, num_H2
+
+
 """
 parsing statistics from file
 """
@@ -295,7 +373,7 @@ def parse_H(
 ):
     # from file
     mask_regions = util.read_mask_file(mask_fname)
-    mask_positions = util.get_mask_positions(mask_regions)
+    mask_positions = util.SiteIndex(mask_regions)
     sample_ids, vcf_positions, genotype_arr = \
         util.read_vcf_genotypes(vcf_fname, mask_regions)
     num_sites, num_H = compute_H(
@@ -342,22 +420,14 @@ def parse_H2(
     t0 = time.time()
 
     mask_regions = util.read_mask_file(mask_fname)
-    mask_positions = util.get_mask_positions(mask_regions)
+    # a rank/select index stands in for the dense vector of mask positions
+    mask_positions = util.SiteIndex(mask_regions)
     sample_ids, vcf_positions, genotype_arr = \
         util.read_vcf_genotypes(vcf_fname, mask_regions)
     r_map = util.read_map_file(map_fname, mask_positions)
     print(util.get_time(), 'loaded files')
 
-    num_sites, num_H = compute_H(
-        mask_positions,
-        genotype_arr,
-        vcf_positions,
-        windows=windows[:, :2],
-        get_two_sample=get_two_sample
-    )
-    print(util.get_time(), 'computed one-locus H')
-
-    num_pairs, num_H2 = compute_H2(
+    num_sites, num_H, num_pairs, num_H2 = compute_H_H2(
         mask_positions,
         genotype_arr,
         vcf_positions,
@@ -367,7 +437,6 @@ def parse_H2(
         get_two_sample=get_two_sample,
         get_denominator=get_denominator
     )
-    print(util.get_time(), 'computed two-locus H')
 
     n = len(sample_ids)
     if get_two_sample:
@@ -518,53 +587,233 @@ def parse_weighted_H2(
     return ret
 
 
-def bootstrap_H2(
-    dics,
-    n_iters=1000,
-    bin_slice=None
-):
-    # carry out bootstraps to get H, H2 distributions.
-    # takes dictionaries as args
+def _load_window_counts(dics, bin_slice=None):
+    # concatenate windowed counts from a list of dictionaries, optionally
+    # slicing out an inclusive interval of bins. n_sites and H_counts are
+    # None when dictionaries lack one-locus statistics
     if 'n_sites' in dics[0]:
         n_sites = np.concatenate([dic['n_sites'] for dic in dics])
         H_counts = np.concatenate([dic['H_counts'] for dic in dics])
+    else:
+        n_sites = None
+        H_counts = None
     H2_counts = np.concatenate([dic['H2_counts'] for dic in dics])
     num_pairs = np.concatenate([dic['n_site_pairs'] for dic in dics])
 
     if bin_slice is None:
-        n_windows, n, n_bins = H2_counts.shape
         r_bins = dics[0]["r_bins"]
     else:
         start, stop = bin_slice
-        n_windows, n, _ = H2_counts.shape
         r_bins = dics[0]['r_bins'][start:stop + 2]
         print(f'r_bins sliced to {r_bins}')
-        n_bins = len(r_bins) - 1
         num_pairs = num_pairs[:, start:stop + 1]
         H2_counts = H2_counts[:, :, start:stop + 1]
+    return r_bins, n_sites, H_counts, num_pairs, H2_counts
+
+
+_bootstrap_chunk_entries = 1 << 22
+# the default number of blocks of resamples to share among workers
+_bootstrap_n_blocks = 16
+
+
+def _get_resample_counts(rng, n_windows, n_iters):
+    # count the number of times each window is drawn in each of n_iters
+    # resamples with replacement. these are multinomial counts; binning
+    # uniform draws is much faster than rng.multinomial. shape
+    # (n_iters, n_windows)
+    draws = rng.integers(n_windows, size=(n_iters, n_windows))
+    draws += np.arange(n_iters)[:, np.newaxis] * n_windows
+    counts = np.bincount(draws.ravel(), minlength=n_iters * n_windows)
+    return counts.reshape(n_iters, n_windows).astype(np.float64)
+
+
+def _get_moments(dist):
+    # the count, mean and summed centered cross-products of a block of
+    # resamples. dist has shape (n_iters, n, n_bins)
+    mean = dist.mean(0)
+    centered = dist - mean
+    m2 = np.einsum('isk,itk->kst', centered, centered)
+    return len(dist), mean, m2
+
+
+def _merge_moments(a, b):
+    # combine the moments of two blocks of resamples (Chan et al.)
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * n_b / n
+    m2 = m2_a + m2_b + np.einsum('sk,tk->kst', delta, delta) * n_a * n_b / n
+    return n, mean, m2
+
+
+def _bootstrap_block(args):
+    # draw one block of resamples, returning H2 and H moments along with the
+    # first n_keep resamples of the block
+    rng, n_iters, n_keep, H2_counts, num_pairs, H_counts, n_sites = args
+    n_windows, n, n_bins = H2_counts.shape
+    counts = _get_resample_counts(rng, n_windows, n_iters)
+    H2_dist = (counts @ H2_counts.reshape(n_windows, n * n_bins)).reshape(
+        n_iters, n, n_bins
+    ) / (counts @ num_pairs)[:, np.newaxis, :]
+    if H_counts is not None:
+        H_dist = (counts @ H_counts) / (counts @ n_sites)[:, np.newaxis]
+    else:
+        H_dist = np.zeros((n_iters, n))
+    H2_moments = _get_moments(H2_dist)
+    H_moments = _get_moments(H_dist[:, :, np.newaxis])
+    # copy the kept resamples, so that the rest of the block can be freed
+    kept_H2 = H2_dist[:n_keep].copy()
+    kept_H = H_dist[:n_keep].copy()
+    return H2_moments, H_moments, kept_H2, kept_H
 
-    H_dist = np.zeros((n_iters, n))
-    H2_dist = np.zeros((n_iters, n, n_bins))
-    for i in range(n_iters):
-        sample = np.random.randint(n_windows, size=n_windows)
-        H2_dist[i] = H2_counts[sample].sum(0) / num_pairs[sample].sum(0)
-        if 'n_sites' in dics[0]:
-            H_dist[i] = H_counts[sample].sum(0) / n_sites[sample].sum()
 
-    H2_cov = np.zeros((n_bins, n, n))
-    for i in range(n_bins):
-        H2_cov[i, :, :] = np.cov(H2_dist[:, :, i], rowvar=False)
+def bootstrap_H2(
+    dics,
+    n_iters=1000,
+    bin_slice=None,
+    seed=None,
+    chunk_size=None,
+    n_workers=1,
+    n_reservoir=0
+):
+    # carry out bootstraps to get H, H2 distributions.
+    # takes dictionaries as args
+    # resamples are represented as a matrix of window counts C, so that
+    # each block of iterations is (C @ H2_counts) / (C @ num_pairs). means
+    # and covariances are accumulated block by block, so only a reservoir of
+    # the first n_reservoir resamples is held in memory and returned as
+    # H2_dist, H_dist; by default none are kept. blocks draw from
+    # independent generators spawned from seed, which may be an integer or a
+    # numpy.random.Generator. the default block layout depends only on
+    # n_iters and the number of windows, and workers share out the blocks,
+    # so results do not depend on n_workers
+    rng = np.random.default_rng(seed)
+    r_bins, n_sites, H_counts, num_pairs, H2_counts = \
+        _load_window_counts(dics, bin_slice=bin_slice)
+    n_windows = len(H2_counts)
+
+    if chunk_size is None:
+        chunk_size = max(1, min(
+            _bootstrap_chunk_entries // n_windows,
+            int(np.ceil(n_iters / _bootstrap_n_blocks))
+        ))
+    starts = np.arange(0, n_iters, chunk_size)
+    block_rngs = rng.spawn(len(starts))
+    tasks = [
+        (
+            block_rng,
+            min(chunk_size, n_iters - i),
+            int(np.clip(n_reservoir - i, 0, chunk_size)),
+            H2_counts,
+            num_pairs,
+            H_counts,
+            n_sites
+        ) for block_rng, i in zip(block_rngs, starts)
+    ]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            blocks = list(executor.map(_bootstrap_block, tasks))
+    else:
+        blocks = [_bootstrap_block(task) for task in tasks]
+
+    H2_moments, H_moments, H2_dist, H_dist = blocks[0]
+    H2_dists = [H2_dist]
+    H_dists = [H_dist]
+    for block in blocks[1:]:
+        H2_moments = _merge_moments(H2_moments, block[0])
+        H_moments = _merge_moments(H_moments, block[1])
+        H2_dists.append(block[2])
+        H_dists.append(block[3])
+    _, H2_mean, H2_m2 = H2_moments
+    _, H_mean, H_m2 = H_moments
+    print(util.get_time(), f'bootstrapped {n_iters} resamples')
 
     ids = dics[0]["ids"]
     # we transpose some arrays for more desirable behavior in inference
     stats = dict(
         ids=ids,
         r_bins=r_bins,
-        H_dist=H_dist,
-        H_mean=H_dist.mean(0),
-        H_cov=np.cov(H_dist, rowvar=False),
-        H2_dist=H2_dist,
-        H2_mean=H2_dist.mean(0).T,
+        n_iters=n_iters,
+        H_dist=np.concatenate(H_dists),
+        H_mean=H_mean[:, 0],
+        H_cov=H_m2[0] / (n_iters - 1),
+        H2_dist=np.concatenate(H2_dists),
+        H2_mean=H2_mean.T,
+        H2_cov=H2_m2 / (n_iters - 1)
+    )
+    return stats
+
+
+def _get_weighted_jackknife(counts, weights):
+    """
+    compute a delete-one-block jackknife estimate of the covariance of ratio
+    statistics sum(counts) / sum(weights), with blocks weighted by their
+    share of the denominator (Busing et al. 1999). blocks with zero weight
+    are ignored.
+
+    :param counts: array of shape (n_blocks, n, n_bins)
+    :param weights: array of shape (n_blocks, n_bins)
+    :return: point estimates of shape (n, n_bins) and covariances of shape
+        (n_bins, n, n)
+    """
+    tot_counts = counts.sum(0)
+    tot_weights = weights.sum(0)
+    theta = tot_counts / tot_weights
+    included = weights > 0
+    # blocks which hold all the weight in a bin cannot be deleted
+    deletable = np.logical_and(included, weights < tot_weights)
+    rem_weights = np.where(deletable, tot_weights - weights, 1)
+    theta_del = (tot_counts - counts) / rem_weights[:, np.newaxis, :]
+    h = np.divide(
+        tot_weights, weights, out=np.ones(weights.shape), where=included
+    )
+    g = included.sum(0)
+    theta_J = g * theta - np.einsum(
+        'jb,jsb->sb', np.where(deletable, 1 - 1 / h, 0), theta_del
+    )
+    pseudo = h[:, np.newaxis, :] * theta \
+        - (h - 1)[:, np.newaxis, :] * theta_del
+    resid = pseudo - theta_J
+    scale = np.divide(
+        1, g * (h - 1), out=np.zeros(h.shape), where=deletable
+    )
+    cov = np.einsum('jb,jsb,jtb->bst', scale, resid, resid)
+    return theta, cov
+
+
+def jackknife_H2(dics, bin_slice=None):
+    # compute H, H2 and their covariances from windowed counts with a
+    # delete-one-window jackknife. windows are weighted by n_site_pairs in
+    # each bin (and by n_sites for H), and no random draws are needed.
+    # returns a dictionary with the same mean and covariance keys as
+    # bootstrap_H2
+    r_bins, n_sites, H_counts, num_pairs, H2_counts = \
+        _load_window_counts(dics, bin_slice=bin_slice)
+    n_windows, n, _ = H2_counts.shape
+    if n_windows < 2:
+        raise ValueError('jackknife requires at least two windows')
+
+    H2_mean, H2_cov = _get_weighted_jackknife(H2_counts, num_pairs)
+    if H_counts is not None:
+        H_mean, H_cov = _get_weighted_jackknife(
+            H_counts[:, :, np.newaxis], n_sites[:, np.newaxis]
+        )
+        H_mean = H_mean[:, 0]
+        H_cov = H_cov[0]
+    else:
+        H_mean = np.zeros(n)
+        H_cov = np.zeros((n, n))
+    print(util.get_time(), f'jackknifed {n_windows} windows')
+
+    ids = dics[0]["ids"]
+    stats = dict(
+        ids=ids,
+        r_bins=r_bins,
+        n_windows=n_windows,
+        H_mean=H_mean,
+        H_cov=H_cov,
+        H2_mean=H2_mean.T,
         H2_cov=H2_cov
     )
     return stats
@@ -681,17 +930,85 @@ computing H2 across chromosome arms or across chromosomes
 """
 
 
+def _get_unit_totals(num_sites, num_H, units):
+    # sum site counts and H counts within each unit
+    # site counts keep their dtype, so that integer products stay exact
+    units = np.asanyarray(units)
+    n_units = units.max() + 1
+    unit_sites = np.zeros(n_units, dtype=num_sites.dtype)
+    np.add.at(unit_sites, units, num_sites)
+    unit_H = np.zeros((n_units, num_H.shape[1]))
+    np.add.at(unit_H, units, num_H)
+    return unit_sites, unit_H
+
+
+def compute_cross_H2(num_sites, num_H, units=None):
+    """
+    compute two-locus counts for site pairs falling in different units, such
+    as chromosomes or chromosome arms, from one-locus totals. for units
+    i < j the counts are the products sites_i * sites_j and H_i * H_j, taken
+    for every pair at once from the upper triangle of the outer products.
+
+    :param num_sites: array of shape (n_windows,) holding site counts
+    :param num_H: array of shape (n_windows, n_stats) holding H counts
+    :param units: optional. integer unit label for each window. if None,
+        each window is treated as a unit
+    :return: arrays of shape (n_unit_pairs,) and (n_unit_pairs, n_stats)
+        holding numbers of site pairs and H2 counts, ordered as
+        (0, 1), (0, 2), .. (1, 2), ..
+    """
+    num_sites = np.asanyarray(num_sites)
+    num_H = np.asanyarray(num_H, dtype=np.float64)
+    if units is not None:
+        num_sites, num_H = _get_unit_totals(num_sites, num_H, units)
+    rows, cols = np.triu_indices(len(num_sites), k=1)
+    num_pairs = num_sites[rows] * num_sites[cols]
+    num_H2 = num_H[rows] * num_H[cols]
+    return num_pairs, num_H2
+
+
+def compute_windowed_cross_H2(num_sites, num_H, units):
+    """
+    distribute the cross-unit counts of compute_cross_H2 across windows, so
+    that they can be resampled by window like any other bin. each window
+    carries half of the products between itself and all windows belonging
+    to other units; summed over windows, this recovers the total over all
+    pairs of units.
+
+    :param num_sites: array of shape (n_windows,) holding site counts
+    :param num_H: array of shape (n_windows, n_stats) holding H counts
+    :param units: integer unit label for each window
+    :return: arrays of shape (n_windows,) and (n_windows, n_stats)
+    """
+    num_sites = np.asanyarray(num_sites)
+    num_H = np.asanyarray(num_H, dtype=np.float64)
+    unit_sites, unit_H = _get_unit_totals(num_sites, num_H, units)
+    other_sites = unit_sites.sum() - unit_sites[units]
+    other_H = unit_H.sum(0) - unit_H[units]
+    num_pairs = num_sites * other_sites / 2
+    num_H2 = num_H * other_H / 2
+    return num_pairs, num_H2
+
+
 def compute_cross_arm_H2(chrom_dict, cen_idx):
     # returns a single 'r-bin'. cen_idx indexes first window after the
     # centromere
     H = 'H_counts'
     sites = 'n_sites'
-    H2 = 'H2_counts'
     pairs = 'n_site_pairs'
 
-    num_H2 = chrom_dict[H][:cen_idx].sum(0) * chrom_dict[H][cen_idx:].sum(0)
-    num_pairs = \
-        chrom_dict[sites][:cen_idx].sum() * chrom_dict[sites][cen_idx:].sum()
+    n_windows = len(chrom_dict[sites])
+    if cen_idx <= 0 or cen_idx >= n_windows:
+        # every window lies on one arm, so no site pairs cross the centromere
+        num_pairs = 0
+        num_H2 = np.zeros(chrom_dict[H].shape[1])
+    else:
+        arms = (np.arange(n_windows) >= cen_idx).astype(int)
+        num_pairs, num_H2 = compute_cross_H2(
+            chrom_dict[sites], chrom_dict[H], units=arms
+        )
+        num_pairs = num_pairs[0]
+        num_H2 = num_H2[0]
 
     expected_num_pairs = util.n_choose_2(chrom_dict[sites].sum())
     assert num_pairs + chrom_dict[pairs].sum() == expected_num_pairs
@@ -700,23 +1017,64 @@ def compute_cross_arm_H2(chrom_dict, cen_idx):
 
 
 def compute_cross_chrom_H2(chrom_dicts):
+    # num_pairs and num_H2 have a row for each pair of chromosomes
+    chrom_sites = np.array([dic['n_sites'].sum() for dic in chrom_dicts])
+    chrom_H = np.stack([dic['H_counts'].sum(0) for dic in chrom_dicts])
+    num_pairs, num_H2 = compute_cross_H2(chrom_sites, chrom_H)
+    return num_pairs, num_H2
 
-    H = 'H_counts'
-    sites = 'n_sites'
 
-    n_chroms = len(chrom_dicts)
-    n_pairs = util.n_choose_2(n_chroms)
-    _, n_stats = chrom_dicts[0]['H_counts'].shape
-    num_H2 = np.zeros((n_pairs, n_stats))
-    num_pairs = np.zeros(n_pairs)
-    k = 0
-
-    for i in range(n_chroms):
-        for j in range(i + 1, n_chroms):
-            chr_i = chrom_dicts[i]
-            chr_j = chrom_dicts[j]
-            num_H2[k] = chr_i[H].sum(0) * chr_j[H].sum(0)
-            num_pairs[k] = chr_i[sites].sum() * chr_j[sites].sum()
-            k += 1
+def _get_cross_dict(chrom_dicts, num_pairs, num_H2):
+    # package windowed cross-unit counts as a single bin at r = 0.5, in the
+    # form taken by bootstrap_H2 and jackknife_H2
+    dic = dict(
+        ids=chrom_dicts[0]['ids'],
+        r_bins=np.array([0.5, 0.5]),
+        n_sites=np.concatenate([dic['n_sites'] for dic in chrom_dicts]),
+        H_counts=np.concatenate([dic['H_counts'] for dic in chrom_dicts]),
+        n_site_pairs=num_pairs[:, np.newaxis],
+        H2_counts=num_H2[:, :, np.newaxis]
+    )
+    return dic
+
 
-    return num_pairs, num_H2
+def get_cross_chrom_dict(chrom_dicts):
+    """
+    get windowed counts of site pairs on different chromosomes, held as one
+    'unlinked' bin that can be bootstrapped or jackknifed by window.
+
+    :param chrom_dicts: list of per-chromosome dictionaries from parse_H2
+    :return: dictionary with keys as in parse_H2
+    """
+    num_sites = np.concatenate([dic['n_sites'] for dic in chrom_dicts])
+    num_H = np.concatenate([dic['H_counts'] for dic in chrom_dicts])
+    chroms = np.repeat(
+        np.arange(len(chrom_dicts)),
+        [len(dic['n_sites']) for dic in chrom_dicts]
+    )
+    num_pairs, num_H2 = compute_windowed_cross_H2(num_sites, num_H, chroms)
+    return _get_cross_dict(chrom_dicts, num_pairs, num_H2)
+
+
+def get_cross_arm_dict(chrom_dicts, cen_idxs):
+    """
+    get windowed counts of site pairs on opposite arms of the same
+    chromosome, held as one bin that can be bootstrapped by window.
+
+    :param chrom_dicts: list of per-chromosome dictionaries from parse_H2
+    :param cen_idxs: for each chromosome, the index of the first window
+        after the centromere
+    :return: dictionary with keys as in parse_H2
+    """
+    num_pairs = []
+    num_H2 = []
+    for dic, cen_idx in zip(chrom_dicts, cen_idxs):
+        arms = (np.arange(len(dic['n_sites'])) >= cen_idx).astype(int)
+        _num_pairs, _num_H2 = compute_windowed_cross_H2(
+            dic['n_sites'], dic['H_counts'], arms
+        )
+        num_pairs.append(_num_pairs)
+        num_H2.append(_num_H2)
+    return _get_cross_dict(
+        chrom_dicts, np.concatenate(num_pairs), np.concatenate(num_H2)
+    )
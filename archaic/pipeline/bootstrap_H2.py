@@ -16,6 +16,11 @@ def get_args():
     parser.add_argument('--name_map', nargs='*', default=[])
     parser.add_argument('--bin_slice', default=None)
     # not actually a slice. inclusive interval like 1-19
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--n_workers', type=int, default=1)
+    # number of resamples to save, e.g. for GIM uncertainties. by default
+    # only their means and covariances are saved
+    parser.add_argument('--n_reservoir', type=int, default=0)
     return parser.parse_args()
 
 
@@ -29,7 +34,12 @@ def main():
         bin_slice = (int(start), int(end))
     files = [np.load(fname) for fname in args.in_fnames]
     dic = parsing.bootstrap_H2(
-        files, n_iters=args.n_iters, bin_slice=bin_slice
+        files,
+        n_iters=args.n_iters,
+        bin_slice=bin_slice,
+        seed=args.seed,
+        n_workers=args.n_workers,
+        n_reservoir=args.n_reservoir
     )
     if len(args.name_map) > 0:
         ids = dic['ids']
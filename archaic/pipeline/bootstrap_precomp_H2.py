@@ -17,6 +17,11 @@ def get_args():
     parser.add_argument("-n", "--n_iters", type=int, default=1_000)
     parser.add_argument('--name_map', nargs='*', default=[])
     parser.add_argument('--bin_slice', default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--n_workers', type=int, default=1)
+    # number of resamples to save, e.g. for GIM uncertainties. by default
+    # only their means and covariances are saved
+    parser.add_argument('--n_reservoir', type=int, default=0)
     return parser.parse_args()
 
 
@@ -62,7 +67,12 @@ def main():
         bin_slice = (int(start), int(end))
 
     dic = parsing.bootstrap_H2(
-        in_files, n_iters=args.n_iters, bin_slice=bin_slice
+        in_files,
+        n_iters=args.n_iters,
+        bin_slice=bin_slice,
+        seed=args.seed,
+        n_workers=args.n_workers,
+        n_reservoir=args.n_reservoir
     )
     if len(args.name_map) > 0:
         ids = dic['ids']
@@ -35,8 +35,12 @@ def main():
     #
     args = get_args()
 
-    masks = [util.read_mask_file(fname) for fname in args.isec_masks]
-    chrom_nums = [util.read_mask_chrom_num(x) for x in args.isec_masks]
+    masks = []
+    chrom_nums = []
+    for fname in args.isec_masks:
+        mask, chrom_num = util.read_mask_file(fname, return_chrom_num=True)
+        masks.append(mask)
+        chrom_nums.append(chrom_num)
 
     if len(np.unique(chrom_nums)) > 1:
         raise ValueError(
@@ -89,9 +93,9 @@ def main():
                 sub_union = util.add_mask_flank(sub_union, int(args.flank))
 
             elif args.flank_unit == 'cM':
-                rcoords, rvals = util.read_map_file(args.rmap)
+                rmap = util.RecombinationMap.from_file(args.rmap)
                 sub_union = util.add_mask_flank_cM(
-                    sub_union, rcoords, rvals, float(args.flank)
+                    sub_union, rmap, float(args.flank)
                 )
             print(
                 util.get_time(),
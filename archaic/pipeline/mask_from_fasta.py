@@ -1,10 +1,9 @@
 """
-
+Write a mask file recording the called (non-N) sites in a .fasta file
 """
-
 import argparse
-from archaic import masks
-from archaic import one_locus
+
+from archaic import util
 
 
 def get_args():
@@ -12,17 +11,21 @@ def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', '--fasta_fname', required=True)
     parser.add_argument('-o', '--out_fname', required=True)
+    parser.add_argument('-n', '--chrom_num', default=None)
     return parser.parse_args()
 
 
 def main():
-
+    #
     args = get_args()
-    gts, header = one_locus.load_fasta_fmt(args.fasta_fname, simplify=True)
-    one_locus.simplify_gts(gts)
-    chrom_num = header.split(':')[2]
-    regions = one_locus.get_gt_mask(gts)
-    masks.write_regions(regions, args.out_fname, chrom_num)
+    regions, header = util.read_fasta_mask(args.fasta_fname)
+    if args.chrom_num is not None:
+        chrom_num = args.chrom_num
+    else:
+        # headers look like >chromosome:GRCh37:1:1:249250621:1
+        chrom_num = header.decode().split(':')[2]
+    util.write_mask_file(regions, args.out_fname, chrom_num)
+    print(util.get_time(), f'mask written at {args.out_fname}')
     return 0
 
 
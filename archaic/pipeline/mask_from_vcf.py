@@ -15,16 +15,14 @@ def get_args():
 
 
 def main():
-    # get positions and convert to regions; save
-    args = get_args() 
-    print(utils.get_time(), f'parsing mask from {args.vcf_fname}')
-    positions, chrom_num = masks.read_vcf_positions(args.vcf_fname)
-    regions = utils.positions_to_regions(positions)
-    masks.write_regions(regions, args.out_fname, chrom_num)
+    # stream positions into regions; save
+    args = get_args()
+    print(util.get_time(), f'parsing mask from {args.vcf_fname}')
+    regions, chrom_num = util.read_vcf_mask(args.vcf_fname)
+    util.write_mask_file(regions, args.out_fname, chrom_num)
     print(util.get_time(), f'mask written at {args.out_fname}')
     return 0
 
 
 if __name__ == "__main__":
     main()
-
@@ -9,8 +9,8 @@ import matplotlib
 import matplotlib.pyplot as plt
 import moments.Demes.Inference as minf
 import numpy as np
-from archaic import plotting
 from archaic import inference
+from archaic.spectra import H2Spectrum
 
 
 def get_args():
@@ -24,6 +24,10 @@ def get_args():
     parser.add_argument("-l", "--n_levels", type=int, default=50)
     parser.add_argument("-u", "--u", type=float, default=1.35e-8)
     parser.add_argument('--title', default=None)
+    parser.add_argument('--n_workers', type=int, default=1)
+    parser.add_argument('--n_refine', type=int, default=0)
+    # .npz file for saving the surface; an interrupted run resumes from it
+    parser.add_argument('--grid_fname', default=None)
     return parser.parse_args()
 
 
@@ -39,21 +43,23 @@ def main():
     y_bounds = np.linspace(lower_bounds[1], upper_bounds[1], n + 1)
     x = x_bounds[:-1] + (x_bounds[1:] - x_bounds[:-1]) / 2
     y = y_bounds[:-1] + (y_bounds[1:] - y_bounds[:-1]) / 2
-    sample_names = inference.scan_names(args.graph_fname, args.data_fname)
-    #
-    r_bins, data = inference.read_data(args.data_fname, sample_names)
-    samples, pairs, H, H_cov, H2, H2_cov = data
-    data = (samples, pairs, H, np.linalg.inv(H_cov), H2, np.linalg.inv(H2_cov))
-    r = inference.get_r(r_bins, method="Simpsons")
-    #
-    Z = np.zeros((n, n))
-    for i in range(n):
-        for j in range(n):
-            params = np.array([x[i], y[j]])
-            builder = minf._update_builder(builder, options, params)
-            graph = demes.Graph.fromdict(builder)
-            Z[j, i] = inference.eval_log_lik(graph, data, r, args.u)
-            print(x[i], y[j], Z[j, i])
+    data = H2Spectrum.from_bootstrap_file(
+        args.data_fname, graph=demes.load(args.graph_fname)
+    )
+    model_func = inference.H2Model(
+        builder, options, data.sample_ids, data.r, u=args.u, get_H=data.has_H
+    )
+    surfaces = inference.grid_ll(
+        model_func,
+        data,
+        [x, y],
+        n_workers=args.n_workers,
+        n_refine=args.n_refine,
+        out_fname=args.grid_fname
+    )
+    Z = surfaces[0][1].T
+    (best_x, best_y), best_lls = surfaces[-1]
+    i, j = np.unravel_index(np.argmax(best_lls), best_lls.shape)
     levels = - np.logspace(np.log10(-Z.min()), np.log10(-Z.max()), args.n_levels)
     fig, ax = plt.subplots(figsize=(9, 7), layout="constrained")
     # CS = ax.contour(x, y, Z, levels=levels)
@@ -67,6 +73,7 @@ def main():
         ax.set_title(args.title)
     x0, y0 = params_0
     ax.scatter(x0, y0, marker='x', color="black")
+    ax.scatter(best_x[i], best_y[j], marker='+', color="black")
     ax.set_ylabel(ylabel)
     ax.set_xlabel(xlabel)
     plt.savefig(args.out_fname, dpi=200)
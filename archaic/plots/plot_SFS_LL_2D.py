@@ -25,26 +25,13 @@ def get_args():
     parser.add_argument("-u", "--u", type=float, default=1.35e-8)
     parser.add_argument('--title', default=None)
     parser.add_argument("-L", "--L", type=float, required=True)
+    parser.add_argument('--n_workers', type=int, default=1)
+    parser.add_argument('--n_refine', type=int, default=0)
+    # .npz file for saving the surface; an interrupted run resumes from it
+    parser.add_argument('--grid_fname', default=None)
     return parser.parse_args()
 
 
-def get_ll(graph, data, config, u, L):
-
-    sfs = moments.Demes.SFS(graph, samples=config, u=u)
-    # get total SFS over genome
-    sfs *= L
-    # Poisson likelihood
-    ll = moments.Inference.ll(sfs, data)
-    return ll
-
-
-def update_graph(builder, options, params):
-
-    builder = minf._update_builder(builder, options, params)
-    graph = demes.Graph.fromdict(builder)
-    return graph
-
-
 def main():
 
     builder = minf._get_demes_dict(args.graph_fname)
@@ -70,13 +57,20 @@ def main():
         else:
             marg_idx.append(i)
     data = data.marginalize(marg_idx)
-    config = {s: 2 for s in samples}
-    Z = np.zeros((n, n))
-    for i in range(n):
-        for j in range(n):
-            graph = update_graph(builder, options, [x[i], y[j]])
-            Z[j, i] = get_ll(graph, data, config, args.u, args.L)
-            print(x[i], y[j], Z[j, i])
+    model_func = inference.SFSModel(
+        builder, options, samples, data.sample_sizes, uL=args.u * args.L
+    )
+    surfaces = inference.grid_ll(
+        model_func,
+        data,
+        [x, y],
+        n_workers=args.n_workers,
+        n_refine=args.n_refine,
+        out_fname=args.grid_fname
+    )
+    Z = surfaces[0][1].T
+    (best_x, best_y), best_lls = surfaces[-1]
+    i, j = np.unravel_index(np.argmax(best_lls), best_lls.shape)
     levels = - np.logspace(np.log10(-Z.min()), np.log10(-Z.max()), args.n_levels)
     fig, ax = plt.subplots(figsize=(9, 7), layout="constrained")
     cmap = plt.colormaps['PiYG']
@@ -85,6 +79,7 @@ def main():
     fig.colorbar(im, ax=ax)
     x0, y0 = params_0
     ax.scatter(x0, y0, marker='x', color="black")
+    ax.scatter(best_x[i], best_y[j], marker='+', color="black")
     ax.set_ylabel(ylabel)
     ax.set_xlabel(xlabel)
     if args.title:
@@ -51,7 +51,7 @@ if __name__ == '__main__':
     regions = util.read_mask_file(mask_fname)
     positions = util.get_mask_positions(regions)
 
-    r_map = util.read_map_file(rmap_fname, positions)
+    r_map = util.RecombinationMap.from_file(rmap_fname).cM_at(positions)
 
     u_map = np.load(umap_fname)[positions - 1]
 
@@ -62,38 +62,17 @@ if __name__ == '__main__':
 
     print(util.get_time(), 'loaded data')
 
-    u_prods = np.zeros((len(windows), len(bins) - 1))
-    B_prods = np.zeros((len(windows), len(bins) - 1))
-    num_pairs = np.zeros((len(windows), len(bins) - 1))
-
-    for w, (wstart, lbound, rbound) in enumerate(windows):
-        start = np.searchsorted(positions, wstart)
-        r_end = np.searchsorted(positions, rbound)
-        l_end = np.searchsorted(positions[start:], lbound)
-
-        u_prods[w] = counting.count_weighted_site_pairs(
-            u_map[start:r_end],
-            r_map[start:r_end],
-            bins,
-            left_bound=l_end
-        )
-        B_prods[w] = counting.count_weighted_site_pairs(
-            B_map[start:r_end],
-            r_map[start:r_end],
-            bins,
-            left_bound=l_end
-        )
-
-        # denominator
-        num_pairs[w] = counting.count_site_pairs(
-            r_map[start:r_end],
-            bins,
-            left_bound=l_end
-        )
-        print(
-            util.get_time(),
-            f'computed pair counts for window {w} {wstart, lbound, rbound}'
-        )
+    # u and B products and the denominator are counted in one pass
+    site_edges = counting.get_window_site_edges(positions, windows)
+    stats = [
+        counting.PairStatistic('u_prods', u_map),
+        counting.PairStatistic('B_prods', B_map),
+        counting.PairStatistic('num_pairs')
+    ]
+    sums = counting.compute_pair_statistics(stats, r_map, bins, site_edges)
+    u_prods = sums['u_prods']
+    B_prods = sums['B_prods']
+    num_pairs = sums['num_pairs']
 
     print(util.get_time(), 'computed pair counts')
 
@@ -7,7 +7,7 @@ import moments
 import msprime
 import numpy as np
 
-from archaic import inference, masks, two_locus, util
+from archaic import inference, util
 from archaic.parsing import parse_H2, bootstrap_H2, parse_SFS
 from archaic.spectra import H2Spectrum
 
@@ -28,13 +28,13 @@ def get_args():
     parser.add_argument('-v', '--verbosity', type=int, default=1)
     parser.add_argument('--n_reps', type=int, default=100)
     parser.add_argument('--return_best', type=int, default=1)
+    parser.add_argument('--n_workers', type=int, default=1)
     parser.add_argument('--cluster_id', default='0')
     parser.add_argument('--process_id', default='0')
     return parser.parse_args()
 
 
 data_path = 'data'
-graph_path = 'graphs'
 
 
 def write_mask_file(L):
@@ -42,7 +42,7 @@ def write_mask_file(L):
     regions = np.array([[0, L]], dtype=np.int64)
     mask_fname = f'{data_path}/mask{int(L / 1e6)}Mb.bed'
     chrom_num = 'chr0'
-    masks.write_regions(regions, mask_fname, chrom_num)
+    util.write_mask_file(regions, mask_fname, chrom_num)
     return mask_fname
 
 
@@ -95,18 +95,6 @@ def coalsim(
     return 0
 
 
-def get_best_fit_graphs(graph_fnames, percentile):
-    # return list of highest-LL graphs
-    graphs = [demes.load(fname) for fname in graph_fnames]
-    LLs = [float(graph.metadata['opt_info']['fopt']) for graph in graphs]
-    threshold = np.quantile(LLs, percentile, method='linear')
-    print(f'LL {percentile}th percentile: {threshold}')
-    idx = np.nonzero(LLs > threshold)[0]
-    for i in idx:
-        print(f'{graph_fnames[i]}: LL = {LLs[i]}')
-    return idx, [graph_fnames[i] for i in idx]
-
-
 def main():
     #
     args = get_args()
@@ -157,44 +145,27 @@ def main():
         H2_stats = bootstrap_H2(H2_dicts)
         np.savez(stat_fnames[c], **H2_stats)
 
-    # perturb
-    for i in range(args.n_reps):
-        inference.perturb_graph(
+    # each map is fit from the same set of perturbed starts
+    seed = np.random.randint(2 ** 31)
+    for c in rates:
+        data = H2Spectrum.from_bootstrap_file(stat_fnames[c], graph=graph)
+        results = inference.multistart(
+            inference.fit_H2,
             args.graph_fname,
             args.options_fname,
-            f'{graph_path}/init_rep{i}.yaml'
+            data,
+            n_starts=args.n_reps,
+            n_workers=args.n_workers,
+            top_k=args.return_best,
+            seed=seed,
+            out_prefix=f'{tag}_{c}cM',
+            max_iter=args.max_iter,
+            method=args.opt_method,
+            u=args.u,
+            verbosity=1,
+            use_H=True
         )
-
-    # H2
-    fnames = {c: [] for c in rates}
-    for c in rates:
-        data = H2Spectrum.from_bootstrap_file(stat_fnames[c], graph=graph)
-        for i in range(args.n_reps):
-            in_fname = f'{graph_path}/init_rep{i}.yaml'
-            out_fname = f'{graph_path}/{tag}_{c}cM_rep{i}.yaml'
-            inference.optimize_H2(
-                in_fname,
-                args.options_fname,
-                data,
-                max_iter=args.max_iter,
-                opt_method=args.opt_method,
-                u=args.u,
-                verbosity=1,
-                use_H=True,
-                out_fname=out_fname
-            )
-            fnames[c].append(out_fname)
-
-    percentile = 1 - args.return_best / args.n_reps
-    print(f'returning {percentile * 100}% highest-ll graphs')
-    for c in rates:
-        _, best_fit = get_best_fit_graphs(fnames[c], percentile)
-        print(best_fit)
-        for fname in best_fit:
-            base_name = fname.split('/')[-1]
-            g = demes.load(fname)
-            demes.dump(g, base_name)
-
+        print(c, [result['ll'] for result in results[:args.return_best]])
 
 if __name__ == '__main__':
     main()
@@ -21,6 +21,11 @@ def get_args():
     parser.add_argument('--method', default='Powell')
     parser.add_argument('-v', '--verbosity', type=int, default=10)
     parser.add_argument('--perturb_graph', type=int, default=0)
+    # workers for finite-difference gradients
+    parser.add_argument('--n_workers', type=int, default=1)
+    # continue from the checkpoint of an interrupted fit
+    parser.add_argument('--resume', type=int, default=0)
+    parser.add_argument('--checkpoint_every', type=int, default=10)
     return parser.parse_args()
 
 
@@ -38,6 +43,7 @@ def main():
     else:
         graph_fname = args.graph_fname
     out_fname = f'{args.out_fname}.yaml'
+    checkpoint_fname = f'{args.out_fname}_checkpoint.npz'
     inference.fit_H2(
         graph_fname,
         args.options_fname,
@@ -47,7 +53,11 @@ def main():
         u=args.u,
         verbosity=args.verbosity,
         use_H=args.use_H,
-        out_fname=out_fname
+        out_fname=out_fname,
+        n_workers=args.n_workers,
+        checkpoint_fname=checkpoint_fname,
+        checkpoint_every=args.checkpoint_every,
+        resume=args.resume
     )
     return 0
 
@@ -21,6 +21,11 @@ def get_args():
     parser.add_argument('--method', nargs='*', default=['Powell'])
     parser.add_argument('-v', '--verbosity', type=int, default=1)
     parser.add_argument('--perturb_graph', type=int, default=0)
+    # workers for finite-difference gradients
+    parser.add_argument('--n_workers', type=int, default=1)
+    # continue from the checkpoint of an interrupted fit
+    parser.add_argument('--resume', type=int, default=0)
+    parser.add_argument('--checkpoint_every', type=int, default=10)
     parser.add_argument('--cluster_id', default='')
     parser.add_argument('--process_id', default='')
     return parser.parse_args()
@@ -49,6 +54,7 @@ def main():
             out_fname = f'{tag}_iter{i + 1}.yaml'
         else:
             out_fname = f'{tag}.yaml'
+        checkpoint_fname = out_fname.replace('.yaml', '_checkpoint.npz')
         inference.fit_SFS(
             graph_fname,
             args.options_fname,
@@ -58,7 +64,11 @@ def main():
             max_iter=args.max_iter[i],
             method=method,
             verbosity=args.verbosity,
-            out_fname=out_fname
+            out_fname=out_fname,
+            n_workers=args.n_workers,
+            checkpoint_fname=checkpoint_fname,
+            checkpoint_every=args.checkpoint_every,
+            resume=args.resume
         )
     return 0
 
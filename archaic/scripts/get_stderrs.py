@@ -19,6 +19,7 @@ def get_args():
     parser.add_argument('--delta', type=float, default=0.01)
     parser.add_argument('-n', '--n_bootstraps', type=int, default=None)
     parser.add_argument('--method', default='GIM')
+    parser.add_argument('--n_workers', type=int, default=1)
     return parser.parse_args()
 
 
@@ -33,6 +34,11 @@ def main():
         else:
             file = np.load(args.data_fname)
             n = len(file['H2_dist'])
+            if n == 0:
+                raise ValueError(
+                    f'{args.data_fname} holds no resamples. bootstrap with '
+                    '--n_reservoir to save them'
+                )
         bootstraps = [
             H2Spectrum.from_bootstrap_distribution(
                 args.data_fname, i, sample_ids=data.sample_ids
@@ -47,7 +53,8 @@ def main():
         bootstraps=bootstraps,
         u=args.u,
         delta=args.delta,
-        method=args.method
+        method=args.method,
+        n_workers=args.n_workers
     )
     print('param\tfit\tstderr')
     for name, p, s in zip(pnames, p0, std_errs):
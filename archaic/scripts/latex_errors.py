@@ -30,6 +30,11 @@ def get_errs(graph_fname, options_fname, data_fname, method='GIM', u=1.35e-8):
     if method == 'GIM':
         file = np.load(data_fname)
         n = len(file['H2_dist'])
+        if n == 0:
+            raise ValueError(
+                f'{data_fname} holds no resamples. bootstrap with '
+                '--n_reservoir to save them'
+            )
         bootstraps = [
             H2Spectrum.from_bootstrap_distribution(
                 data_fname, i, sample_ids=data.sample_ids
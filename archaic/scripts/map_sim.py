@@ -78,10 +78,7 @@ def simulate(
         r_map = float(r)
         print(util.get_time(), f'using uniform r {r_map}')
     except:
-        coords, map_vals = util.read_map_file(r)
-        map_rates = np.diff(map_vals) / np.diff(coords) / 100
-        edges, map_rates = truncate_map(coords[:-1], map_rates, L)
-        r_map = msprime.RateMap(position=edges, rate=map_rates)
+        r_map = util.RecombinationMap.from_file(r).rate_map(L=L)
         print(util.get_time(), 'loaded r-map')
 
     if isinstance(graph, str):
@@ -163,11 +160,10 @@ def main():
     print(util.get_time(), f'mean u in mask: {mean_u}')
 
     # r setup
-    rcoords, rvals = util.read_map_file(args.rmap)
-    map_length = rvals[-1]
-    map_span = rcoords[-1] - rcoords[0]
-    mean_r = map_length / map_span / 100
-    map_end_val = map_span * mean_r * 100
+    rmap = util.RecombinationMap.from_file(args.rmap)
+    rcoords = rmap.coords
+    mean_r = rmap.mean_rate()
+    map_end_val = rmap.length
     # we need to write a dummy map file for parsing. rate column is not needed
     unif_rmap = f'unif_rmap_{chrom_num}.txt'
     with open(unif_rmap, 'w') as file:
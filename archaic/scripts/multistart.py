@@ -0,0 +1,99 @@
+"""
+Fit a demes model from many perturbed starting points in parallel, saving the
+best-fitting graphs
+"""
+import argparse
+import demes
+
+from archaic import inference, util
+from archaic.spectra import H2Spectrum
+
+
+fit_funcs = ['H2', 'H2H', 'SFS', 'composite']
+
+
+def get_args():
+    # get args
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--fit', default='H2', choices=fit_funcs)
+    parser.add_argument('-H2', '--H2_fname', default=None)
+    parser.add_argument('-SFS', '--SFS_fname', default=None)
+    parser.add_argument('-g', '--graph_fname', required=True)
+    parser.add_argument('-p', '--options_fname', required=True)
+    parser.add_argument('-o', '--out_prefix', required=True)
+    parser.add_argument('-u', '--u', type=float, default=None)
+    parser.add_argument('--max_iter', type=int, default=1000)
+    parser.add_argument('--method', default='Powell')
+    parser.add_argument('-v', '--verbosity', type=int, default=0)
+    parser.add_argument('-n', '--n_starts', type=int, default=10)
+    parser.add_argument('--n_workers', type=int, default=1)
+    parser.add_argument('-k', '--top_k', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    # abandon starts whose ll trails the best by more than this
+    parser.add_argument('--abandon_delta', type=float, default=None)
+    parser.add_argument('--abandon_after', type=int, default=100)
+    return parser.parse_args()
+
+
+def main():
+    #
+    args = get_args()
+    graph = demes.load(args.graph_fname)
+    kwargs = dict(
+        max_iter=args.max_iter,
+        method=args.method,
+        verbosity=args.verbosity
+    )
+    if args.fit in ['H2', 'H2H', 'composite']:
+        if args.H2_fname is None:
+            raise ValueError(f'fitting {args.fit} requires --H2_fname')
+        H2_data = H2Spectrum.from_bootstrap_file(args.H2_fname, graph=graph)
+    if args.fit in ['SFS', 'composite']:
+        if args.SFS_fname is None:
+            raise ValueError(f'fitting {args.fit} requires --SFS_fname')
+        if args.fit == 'composite':
+            SFS_data, L = inference.read_SFS(
+                args.SFS_fname, H2_data.sample_ids
+            )
+        else:
+            SFS_data, L = inference.read_SFS(args.SFS_fname, graph=graph)
+
+    if args.fit in ['H2', 'H2H']:
+        fit_func = inference.fit_H2
+        data = (H2_data,)
+        kwargs.update(u=args.u, use_H=args.fit == 'H2H')
+    elif args.fit == 'SFS':
+        fit_func = inference.fit_SFS
+        data = (SFS_data,)
+        uL = None if args.u is None else args.u * L
+        kwargs.update(uL=uL, L=L)
+    else:
+        fit_func = inference.fit_composite
+        data = (H2_data, SFS_data)
+        kwargs.update(u=args.u, L=L)
+
+    results = inference.multistart(
+        fit_func,
+        args.graph_fname,
+        args.options_fname,
+        *data,
+        n_starts=args.n_starts,
+        n_workers=args.n_workers,
+        top_k=args.top_k,
+        seed=args.seed,
+        abandon_delta=args.abandon_delta,
+        abandon_after=args.abandon_after,
+        out_prefix=args.out_prefix,
+        **kwargs
+    )
+    n_abandoned = sum(result['abandoned'] for result in results)
+    print(
+        util.get_time(),
+        f'ran {args.n_starts} starts, abandoned {n_abandoned}; '
+        f'best ll {results[0]["ll"]}'
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    main()
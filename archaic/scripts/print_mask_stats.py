@@ -1,39 +1,183 @@
+"""
+Report statistics for one or more .bed mask files. masks are read
+concurrently. for each mask we report the number of regions and sites and
+summary statistics of region lengths; optionally also
 
+    (1) histograms of region lengths
+    (2) a matrix of pairwise jaccard indices between masks on the same
+        chromosome
+    (3) the number of mask sites in each window of a windows file
+
+tables are printed as .tsv or, when --out_prefix is given, written to
+{prefix}_summary.tsv, {prefix}_hist.tsv, {prefix}_jaccard.tsv and
+{prefix}_coverage.tsv. --json_fname writes everything to one .json file
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
 import numpy as np
-import sys
 
 from archaic import util
 
 
+_default_hist_bins = np.concatenate([10 ** np.arange(0, 9), [np.inf]])
+
+
+def get_args():
+    #
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fnames', nargs='+')
+    parser.add_argument('-w', '--windows', default=None)
+    parser.add_argument('-o', '--out_prefix', default=None)
+    parser.add_argument('--json_fname', default=None)
+    parser.add_argument('--hist', type=int, default=0)
+    parser.add_argument('--jaccard', type=int, default=0)
+    parser.add_argument('--n_workers', type=int, default=1)
+    return parser.parse_args()
+
+
+def load_mask(fname):
+    # read a mask and its chromosome number; merge overlapping regions
+    regions, chrom_num = util.read_mask_file(fname, return_chrom_num=True)
+    if np.any(regions[1:, 0] < regions[:-1, 1]):
+        regions = util.collapse_mask(regions)
+    return regions, chrom_num
+
+
+def load_masks(fnames, n_workers=1):
+    #
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            loaded = list(executor.map(load_mask, fnames))
+    else:
+        loaded = [load_mask(fname) for fname in fnames]
+    return loaded
+
+
+def get_summary(regions):
+    #
+    lengths = np.diff(regions, axis=1)[:, 0]
+    if len(lengths) == 0:
+        lengths = np.zeros(1, dtype=int)
+    summary = dict(
+        n_regions=len(regions),
+        n_sites=int(lengths.sum()),
+        min_length=int(lengths.min()),
+        max_length=int(lengths.max()),
+        mean_length=float(np.round(lengths.mean(), 1)),
+        median_length=float(np.median(lengths))
+    )
+    return summary
+
+
+def get_length_hist(regions, bins=None):
+    #
+    if bins is None:
+        bins = _default_hist_bins
+    return np.histogram(np.diff(regions, axis=1)[:, 0], bins=bins)[0]
+
+
+def get_jaccard_matrix(masks, chrom_nums):
+    # pairs of masks on different chromosomes have index 0
+    n = len(masks)
+    matrix = np.eye(n)
+    for i, j in util.get_pair_idxs(n):
+        if chrom_nums[i] == chrom_nums[j]:
+            jaccard = util.get_mask_jaccard(masks[i], masks[j])
+        else:
+            jaccard = 0
+        matrix[i, j] = matrix[j, i] = jaccard
+    return matrix
+
+
+def format_table(header, rows):
+    #
+    lines = ['\t'.join(header)]
+    lines += ['\t'.join([str(x) for x in row]) for row in rows]
+    return '\n'.join(lines) + '\n'
+
+
+def write_table(table, fname=None):
+    #
+    if fname is None:
+        print(table)
+    else:
+        with open(fname, 'w') as file:
+            file.write(table)
+    return 0
+
+
 def main():
     #
-    fnames = sys.argv[1:]
-
-    print('fname\tn regions\tn sites\tmin size\tmax size')
-
-    tot_reg = 0
-    tot_sites = 0
-    tot_min = 1e10
-    tot_max = 0
-
-    for fname in fnames:
-        mask = util.read_mask_file(fname)
-        n_reg = len(mask)
-        tot_reg += n_reg
-        lengths = np.diff(mask)
-        n_sites = lengths.sum()
-        tot_sites += n_sites
-        min_reg = lengths.min()
-        tot_min = min(tot_min, min_reg)
-        max_reg = lengths.max()
-        tot_max = max(tot_max, max_reg)
-        print(
-            '\t'.join([str(x) for x in [fname, n_reg, n_sites, min_reg, max_reg]])
-        )
+    args = get_args()
+    fnames = args.fnames
+    loaded = load_masks(fnames, n_workers=args.n_workers)
+    masks = [regions for regions, _ in loaded]
+    chrom_nums = [chrom_num for _, chrom_num in loaded]
+
+    def out_fname(suffix):
+        #
+        if args.out_prefix is None:
+            return None
+        return f'{args.out_prefix}_{suffix}.tsv'
 
-    print(
-        '\t'.join([str(x) for x in ['TOT', tot_reg, tot_sites, tot_min, tot_max]])
+    report = dict(fnames=fnames, chrom_nums=chrom_nums)
+
+    # summary
+    summaries = [get_summary(mask) for mask in masks]
+    fields = list(summaries[0])
+    rows = [
+        [fname, chrom_num] + [summary[x] for x in fields]
+        for fname, chrom_num, summary in zip(fnames, chrom_nums, summaries)
+    ]
+    tot = get_summary(np.concatenate(masks))
+    rows.append(['TOT', '.'] + [tot[x] for x in fields])
+    write_table(
+        format_table(['fname', 'chrom'] + fields, rows), out_fname('summary')
     )
+    report['summary'] = summaries
+
+    # length histograms
+    if args.hist:
+        bins = _default_hist_bins
+        hists = [get_length_hist(mask, bins=bins) for mask in masks]
+        header = ['fname'] + [
+            f'{int(bins[i])}-{bins[i + 1]:.0f}' for i in range(len(bins) - 1)
+        ]
+        rows = [[fname] + list(hist) for fname, hist in zip(fnames, hists)]
+        write_table(format_table(header, rows), out_fname('hist'))
+        report['hist_bins'] = [float(x) for x in bins]
+        report['hists'] = [[int(x) for x in hist] for hist in hists]
+
+    # pairwise jaccard indices
+    if args.jaccard:
+        matrix = get_jaccard_matrix(masks, chrom_nums)
+        rows = [
+            [fname] + [np.round(x, 6) for x in row]
+            for fname, row in zip(fnames, matrix)
+        ]
+        write_table(format_table(['fname'] + fnames, rows), out_fname('jaccard'))
+        report['jaccard'] = matrix.tolist()
+
+    # coverage in windows
+    if args.windows is not None:
+        windows = np.loadtxt(args.windows, dtype=int, ndmin=2)
+        coverage = np.array(
+            [util.get_window_coverage(mask, windows) for mask in masks]
+        )
+        header = ['window_start', 'window_end'] + fnames
+        rows = [
+            list(window[:2]) + list(coverage[:, w])
+            for w, window in enumerate(windows)
+        ]
+        write_table(format_table(header, rows), out_fname('coverage'))
+        report['windows'] = windows[:, :2].tolist()
+        report['coverage'] = coverage.tolist()
+
+    if args.json_fname is not None:
+        with open(args.json_fname, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
 
 
 if __name__ == '__main__':
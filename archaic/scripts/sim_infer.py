@@ -6,13 +6,12 @@ import demes
 import msprime
 import numpy as np
 
-from archaic import inference, masks, two_locus, util
+from archaic import inference, util
 from archaic.parsing import parse_H2, bootstrap_H2, parse_SFS
 from archaic.spectra import H2Spectrum
 
 
 data_dir = 'data'
-graph_dir = 'graphs'
 
 needs_H2 = ['H2', 'H2H', 'composite']
 needs_SFS = ['SFS', 'composite']
@@ -35,6 +34,8 @@ def get_args():
     parser.add_argument('-v', '--verbosity', type=int, default=1)
     parser.add_argument('--n_reps', type=int, default=100)
     parser.add_argument('--return_best', type=int, default=1)
+    parser.add_argument('--n_workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
     parser.add_argument(
         '--fit', nargs='*', default=['H2', 'H2H', 'SFS', 'composite']
     )
@@ -48,13 +49,13 @@ def write_mask_file(L):
     regions = np.array([[0, L]], dtype=np.int64)
     mask_fname = f'{data_dir}/mask{int(L / 1e6)}Mb.bed'
     chrom_num = 'chr0'
-    masks.write_regions(regions, mask_fname, chrom_num)
+    util.write_mask_file(regions, mask_fname, chrom_num)
     return mask_fname
 
 
 def write_map_file(L, r):
     #
-    cM = two_locus.map_function(r) * L
+    cM = util.map_function(r) * L
     map_fname = f'{data_dir}/map{int(L / 1e6)}Mb.txt'
     with open(map_fname, 'w') as file:
         file.write('Position(bp)\tRate(cM/Mb)\tMap(cM)\n')
@@ -101,18 +102,6 @@ def coalsim(
     return 0
 
 
-def get_best_fit_graphs(graph_fnames, percentile):
-    # return list of highest-LL graphs
-    graphs = [demes.load(fname) for fname in graph_fnames]
-    LLs = [float(graph.metadata['opt_info']['fopt']) for graph in graphs]
-    threshold = np.quantile(LLs, percentile, method='linear')
-    print(f'LL {percentile}th percentile: {threshold}')
-    idx = np.nonzero(LLs > threshold)[0]
-    for i in idx:
-        print(f'{graph_fnames[i]}: LL = {LLs[i]}')
-    return idx, [graph_fnames[i] for i in idx]
-
-
 def main():
     #
     args = get_args()
@@ -203,90 +192,70 @@ def main():
         if want_SFS:
             uL = args.u * L
 
-    # perturb the initial graph to get starting points
-    inits = []
-    for i in range(args.n_reps):
-        fname = f'{graph_dir}/{tag}_init_rep{i}.yaml'
-        inference.perturb_graph(
-            args.graph_fname, args.options_fname, out_fname=fname
+    # every statistic is fit from the same set of perturbed starts
+    if args.seed is None:
+        seed = np.random.randint(2 ** 31)
+    else:
+        seed = args.seed
+    kwargs = dict(
+        n_starts=args.n_reps,
+        n_workers=args.n_workers,
+        top_k=args.return_best,
+        seed=seed,
+        max_iter=args.max_iter,
+        method=args.method,
+        verbosity=args.verbosity
+    )
+    fits = {}
+    if 'H2' in args.fit:
+        fits['H2'] = inference.multistart(
+            inference.fit_H2,
+            args.graph_fname,
+            args.options_fname,
+            H2_data,
+            out_prefix=f'{tag}_H2',
+            u=inf_u,
+            use_H=False,
+            **kwargs
+        )
+    if 'H2H' in args.fit:
+        fits['H2H'] = inference.multistart(
+            inference.fit_H2,
+            args.graph_fname,
+            args.options_fname,
+            H2_data,
+            out_prefix=f'{tag}_H2H',
+            u=inf_u,
+            use_H=True,
+            **kwargs
+        )
+    if 'SFS' in args.fit:
+        fits['SFS'] = inference.multistart(
+            inference.fit_SFS,
+            args.graph_fname,
+            args.options_fname,
+            SFS_data,
+            out_prefix=f'{tag}_SFS',
+            uL=uL,
+            L=L,
+            **kwargs
+        )
+    if 'composite' in args.fit:
+        fits['composite'] = inference.multistart(
+            inference.fit_composite,
+            args.graph_fname,
+            args.options_fname,
+            H2_data,
+            SFS_data,
+            out_prefix=f'{tag}_composite',
+            u=inf_u,
+            L=L,
+            **kwargs
         )
-        inits.append(fname)
-
-    fits = {stat: [] for stat in args.fit}
-    for i in range(args.n_reps):
-        if 'H2' in fits:
-            H2_fname = f'{graph_dir}/{tag}_H2_rep{i}.yaml'
-            inference.fit_H2(
-                inits[i],
-                args.options_fname,
-                H2_data,
-                max_iter=args.max_iter,
-                method=args.method,
-                u=inf_u,
-                verbosity=args.verbosity,
-                use_H=False,
-                out_fname=H2_fname
-            )
-            fits['H2'].append(H2_fname)
-
-        if 'H2H' in fits:
-            H2H_fname = f'{graph_dir}/{tag}_H2H_rep{i}.yaml'
-            inference.fit_H2(
-                inits[i],
-                args.options_fname,
-                H2_data,
-                max_iter=args.max_iter,
-                method=args.method,
-                u=inf_u,
-                verbosity=args.verbosity,
-                use_H=True,
-                out_fname=H2H_fname
-            )
-            fits['H2H'].append(H2H_fname)
-
-        if 'SFS' in fits:
-            SFS_fname = f'{graph_dir}/{tag}_SFS_rep{i}.yaml'
-            inference.fit_SFS(
-                inits[i],
-                args.options_fname,
-                SFS_data,
-                uL=uL,
-                L=L,
-                max_iter=args.max_iter,
-                method=args.method,
-                verbosity=args.verbosity,
-                out_fname=SFS_fname
-            )
-            fits['SFS'].append(SFS_fname)
-
-        if 'composite' in fits:
-            composite_fname = f'{graph_dir}/{tag}_composite_rep{i}.yaml'
-            inference.fit_composite(
-                inits[i],
-                args.options_fname,
-                H2_data,
-                SFS_data,
-                max_iter=args.max_iter,
-                method=args.method,
-                u=inf_u,
-                L=L,
-                verbosity=args.verbosity,
-                out_fname=composite_fname
-            )
-            fits['composite'].append(composite_fname)
-
-    percentile = 1 - args.return_best / args.n_reps
-    print(f'returning {percentile * 100}% highest-ll graphs')
 
     for stat in fits:
-        _, best_fits = get_best_fit_graphs(fits[stat], percentile)
-        print(stat, best_fits)
-        for fname in best_fits:
-            base_name = fname.split('/')[-1]
-            g = demes.load(fname)
-            demes.dump(g, base_name)
+        print(stat, [result['ll'] for result in fits[stat][:args.return_best]])
     return 0
 
-
 if __name__ == '__main__':
     main()
@@ -100,16 +100,7 @@ def simulate_chromosome(
         r_map = float(r)
         print(util.get_time(), f'using uniform r {r_map}')
     except:
-        coords, map_vals = util.read_map_file(r)
-        map_rates = np.diff(map_vals) / np.diff(coords)  # cM/bp
-        map_rates /= 100
-        coords[0] = 0
-        if coords[-1] <= L:
-            edges = np.append(coords[:-1], L)
-        else:
-            map_rates = map_rates[coords[:-1] < L]
-            edges = np.append(coords[coords < L], L)
-        r_map = msprime.RateMap(position=edges, rate=map_rates)
+        r_map = util.RecombinationMap.from_file(r).rate_map(L=L)
         print(util.get_time(), 'loaded r-map')
 
     if isinstance(graph, str):
@@ -43,6 +43,35 @@ class H2Spectrum:
         self.has_H = has_H
         self.covs = covs
 
+    @property
+    def covs(self):
+        # covariance matrices of the statistics, with shape (n bins, n, n)
+        return self._covs
+
+    @covs.setter
+    def covs(self, covs):
+        # cached factors are invalidated whenever the covariances change
+        self._covs = covs
+        self._cholesky = None
+        self._cov_factors = None
+
+    @property
+    def cholesky(self):
+        # lower Cholesky factors L of the covariance matrices, computed once
+        if self._cholesky is None:
+            if self.covs is None:
+                raise ValueError('H2Spectrum has no covariance matrices')
+            self._cholesky, self._cov_factors = self.get_cov_factors(self.covs)
+        return self._cholesky
+
+    @property
+    def cov_factors(self):
+        # inverse Cholesky factors W = inv(L), so that W.T @ W is the inverse
+        # covariance in each bin. computed once, alongside cholesky
+        if self._cov_factors is None:
+            self.cholesky
+        return self._cov_factors
+
     @classmethod
     def from_bootstrap_file(cls, fname, sample_ids=None, graph=None):
         #
@@ -148,28 +177,11 @@ class H2Spectrum:
 
     @classmethod
     def from_graph(cls, graph, sample_ids, r, u, r_bins=None, get_H=True):
-        #
-        sample_ids = sorted(sample_ids)
-        stats = moments.LD.LDstats.from_demes(
-            graph, sampled_demes=sample_ids, theta=None, r=r, u=u
+        # to evaluate many graphs, build an H2Evaluator once and call it
+        evaluator = H2Evaluator(
+            sorted(sample_ids), r, r_bins=r_bins, get_H=get_H
         )
-        ids = cls.expand_ids(sample_ids)
-        _exp_H2 = np.zeros((len(r), len(ids)))
-        for k, (x, y) in enumerate(ids):
-            if x == y:
-                phased = True
-                y = None
-            else:
-                phased = False
-            _exp_H2[:, k] = stats.H2(x, y, phased=phased)
-        exp_H2 = cls.approximate_H2(_exp_H2)
-        if get_H:
-            exp_H = stats.H()
-            data = np.vstack([exp_H2, exp_H])
-        else:
-            data = exp_H2
-        spectrum = cls(data, r_bins, np.array(ids), has_H=True)
-        return spectrum
+        return evaluator(graph, u)
 
     @classmethod
     def from_demes(
@@ -188,23 +200,8 @@ class H2Spectrum:
 
         if sampled_demes is None:
             sampled_demes = [d.name for d in graph.demes if d.end_time == 0]
-        stats = moments.LD.LDstats.from_demes(
-            graph, sampled_demes=sampled_demes, theta=None, r=r, u=u
-        )
-        exp_H = stats.H()
-        ids = cls.expand_ids(sampled_demes)
-        _exp_H2 = np.zeros((len(r), len(ids)))
-        for k, (x, y) in enumerate(ids):
-            if x == y:
-                phased = True
-                y = None
-            else:
-                phased = False
-            _exp_H2[:, k] = stats.H2(x, y, phased=phased)
-        exp_H2 = cls.approximate_H2(_exp_H2)
-        data = np.vstack([exp_H2, exp_H])
-        spectrum = cls(data, r_bins, np.array(ids), has_H=True)
-        return spectrum
+        evaluator = H2Evaluator(sampled_demes, r, r_bins=r_bins)
+        return evaluator(graph, u)
 
     @classmethod
     def from_graph_file(cls, fname, sample_ids, r, u):
@@ -283,6 +280,15 @@ class H2Spectrum:
             sub = self
         return sub
 
+    @staticmethod
+    def get_cov_factors(covs):
+        # batched Cholesky factors of covariance matrices and their inverses
+        try:
+            cholesky = np.linalg.cholesky(covs)
+        except np.linalg.LinAlgError:
+            raise ValueError('covariance matrices must be positive definite')
+        return cholesky, np.linalg.inv(cholesky)
+
     @staticmethod
     def invert_cos(covs):
         #
@@ -327,6 +333,85 @@ class H2Spectrum:
         return self.data
 
 
+class H2Evaluator:
+    """
+    computes expected H2 and H under demes graphs for fixed sampled demes and
+    r. the moments statistic indices, Simpson weights and id layout are
+    worked out once, so that each evaluation solves for the moments LD
+    statistics and extracts every H2 statistic with one matrix product.
+    """
+
+    def __init__(self, sample_ids, r, r_bins=None, get_H=True):
+        """
+        :param sample_ids: list of sampled demes, in the order of the output
+        :param r: recombination rates at which to compute statistics; bin
+            edges and midpoints, as from H2Spectrum.get_r
+        :param r_bins: optional. r bin edges, stored on output spectra
+        :param get_H: optional, default True. if True, append the one-locus
+            H row
+        """
+        self.sample_ids = list(sample_ids)
+        self.r = np.asanyarray(r)
+        self.r_bins = r_bins
+        self.get_H = get_H
+        self.ids = np.array(H2Spectrum.expand_ids(self.sample_ids))
+        self.weights = self.get_stat_weights(len(self.sample_ids))
+        self.simpson_weights = self.get_simpson_weights(len(self.r))
+
+    @staticmethod
+    def get_stat_weights(n_pops):
+        # a matrix mapping moments LD statistics to H2 statistics, with
+        # columns ordered as in expand_ids. within-deme statistics are
+        # phased and cross-deme statistics unphased, as in LDstats.H2
+        names = moments.LD.Util.moment_names(n_pops)[0]
+        pairs = [(i, j) for i in range(n_pops) for j in range(i, n_pops)]
+        weights = np.zeros((len(names), len(pairs)))
+        for k, (i, j) in enumerate(pairs):
+            if i == j:
+                coeffs = (4, 1, 1, 4)
+            else:
+                coeffs = (1, 1 / 2, 1 / 2, 4)
+            stats = (f'DD_{i}_{j}', f'Dz_{i}_{j}_{j}', f'Dz_{j}_{i}_{i}',
+                     f'pi2_{i}_{j}_{i}_{j}')
+            for stat, coeff in zip(stats, coeffs):
+                weights[names.index(stat), k] += coeff
+        return weights
+
+    @staticmethod
+    def get_simpson_weights(n_r):
+        # a matrix integrating statistics over bins by Simpson's rule, as in
+        # H2Spectrum.approximate_H2
+        n_bins = (n_r - 1) // 2
+        weights = np.zeros((n_bins, n_r))
+        idx = np.arange(n_bins)
+        weights[idx, idx * 2] = 1 / 6
+        weights[idx, idx * 2 + 1] = 4 / 6
+        weights[idx, idx * 2 + 2] = 1 / 6
+        return weights
+
+    def get_arr(self, graph, u):
+        """
+        compute expectations as an array of shape (n bins, n stats), or
+        (n bins + 1, n stats) with H
+
+        :param graph: demes graph
+        :param u: mutation rate
+        """
+        stats = moments.LD.LDstats.from_demes(
+            graph, sampled_demes=self.sample_ids, theta=None, r=self.r, u=u
+        )
+        arr = self.simpson_weights @ stats.LD() @ self.weights
+        if self.get_H:
+            arr = np.vstack([arr, stats.H()])
+        return arr
+
+    def __call__(self, graph, u):
+        # returns an H2Spectrum
+        return H2Spectrum(
+            self.get_arr(graph, u), self.r_bins, self.ids, has_H=self.get_H
+        )
+
+
 class H2stats:
     """
     """
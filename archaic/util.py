@@ -3,7 +3,14 @@ Various utilities that are widely used
 """
 from datetime import datetime
 import gzip
+from itertools import islice
 import numpy as np
+import os
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
 
 
 """
@@ -72,74 +79,184 @@ reading and writing data to file
 """
 
 
-def read_bedgraph(fname, sep='\t', fields=None):
-    # read a .bedgraph
-    if fname.endswith('.gz'):
-        open_func = gzip.open
-    else:
-        open_func = open
+_block_size = 1_000_000
+
+
+def _peek_lines(fname, n=2):
+    # read the first n lines of a (possibly gzipped) file as strings
+    open_func = gzip.open if fname.endswith('.gz') else open
     with open_func(fname, 'rb') as file:
-        header_line = file.readline().decode()
+        lines = [line.decode().rstrip('\r\n') for line in islice(file, n)]
+    return lines
 
-    header = header_line.strip('\n').split(sep)
-    data_names = header[3:]
-    cols = tuple(range(3, len(header)))
 
-    regions = np.loadtxt(
-        fname,
-        skiprows=1,
-        dtype=int,
-        usecols=(1, 2)
-    )
-    data_cols = np.loadtxt(
+def _is_number(x):
+    #
+    try:
+        float(x)
+    except ValueError:
+        return False
+    return True
+
+
+def read_columns(fname, usecols, dtypes=float, sep='\t', block_size=None):
+    """
+    read a set of columns from a (possibly gzipped) delimited text file with a
+    single decompression pass over the file. if pandas is installed its
+    C parser is used; otherwise lines are parsed in blocks of block_size.
+
+    the first line is treated as a header if it begins with '#' or if any
+    numeric column holds a non-numeric field in it. columns may be specified
+    by index or, when the file has a header, by name.
+
+    :param fname: path to file
+    :param usecols: list of column indices and/or header names
+    :param dtypes: optional, default float. a dtype for all columns or a list
+        of dtypes, one for each column in usecols
+    :param sep: optional, default '\t'. field delimiter
+    :param block_size: optional. number of lines parsed per block when pandas
+        is not available
+    :return: list of header names (or None), list of 1d column arrays, and the
+        first field of the first data row (typically the contig id) as a str
+    """
+    if block_size is None:
+        block_size = _block_size
+    if not isinstance(dtypes, (list, tuple)):
+        dtypes = [dtypes] * len(usecols)
+    if len(dtypes) != len(usecols):
+        raise ValueError('dtypes and usecols have mismatched lengths')
+
+    first_lines = _peek_lines(fname, n=2)
+    if len(first_lines) == 0:
+        raise ValueError(f'{fname} is empty')
+    first_fields = first_lines[0].split(sep)
+    has_header = first_lines[0].startswith('#')
+    if not has_header:
+        for col, dtype in zip(usecols, dtypes):
+            if isinstance(col, str):
+                has_header = True
+            elif np.issubdtype(dtype, np.number) and col < len(first_fields):
+                if not _is_number(first_fields[col]):
+                    has_header = True
+
+    if has_header:
+        header = first_lines[0].lstrip('#').split(sep)
+        data_lines = first_lines[1:]
+    else:
+        header = None
+        data_lines = first_lines
+    contig = data_lines[0].split(sep)[0] if len(data_lines) > 0 else None
+
+    idxs = []
+    for col in usecols:
+        if isinstance(col, str):
+            if header is None or col not in header:
+                raise ValueError(f'column {col} is not in the header of {fname}')
+            idxs.append(header.index(col))
+        else:
+            idxs.append(int(col))
+    skiprows = 1 if has_header else 0
+
+    if pd is not None:
+        col_dtypes = {}
+        for idx, dtype in zip(idxs, dtypes):
+            col_dtypes.setdefault(idx, dtype)
+        table = pd.read_csv(
+            fname,
+            sep=sep,
+            header=None,
+            skiprows=skiprows,
+            usecols=list(col_dtypes),
+            dtype=col_dtypes,
+            engine='c'
+        )
+        cols = [
+            table[idx].to_numpy(dtype=dtype)
+            for idx, dtype in zip(idxs, dtypes)
+        ]
+    else:
+        blocks = []
+        open_func = gzip.open if fname.endswith('.gz') else open
+        with open_func(fname, 'rt') as file:
+            for _ in range(skiprows):
+                file.readline()
+            while True:
+                lines = list(islice(file, block_size))
+                if len(lines) == 0:
+                    break
+                blocks.append(
+                    np.loadtxt(
+                        lines,
+                        dtype=str,
+                        delimiter=sep,
+                        usecols=idxs,
+                        ndmin=2,
+                        comments=None
+                    )
+                )
+        if len(blocks) > 0:
+            block = np.concatenate(blocks, axis=0)
+        else:
+            block = np.zeros((0, len(idxs)), dtype=str)
+        cols = [
+            block[:, i].astype(dtype) for i, dtype in enumerate(dtypes)
+        ]
+    return header, cols, contig
+
+
+def read_bedgraph(fname, sep='\t', fields=None):
+    # read a .bedgraph with a header line naming its data columns
+    header = _peek_lines(fname, n=1)[0].lstrip('#').split(sep)
+    data_names = header[3:] if fields is None else list(fields)
+    _, cols, __ = read_columns(
         fname,
-        skiprows=1,
-        usecols=cols,
-        dtype=float,
-        unpack=True,
+        [1, 2] + data_names,
+        dtypes=[int, int] + [float] * len(data_names),
+        sep=sep
     )
-    data = dict(zip(data_names, data_cols))
-    # add field filter
+    regions = np.stack(cols[:2], axis=1)
+    data = dict(zip(data_names, cols[2:]))
     return regions, data
 
 
 def read_u_bedgraph(fname):
     # read a .bedgraph file with regions in its 1st/2nd col and u in its 4th
-    regions = np.loadtxt(fname, usecols=(1, 2), dtype=int)
-    u = np.loadtxt(fname, usecols=4, dtype=float)
-    starts = regions[:, 0]
+    _, (starts, u), __ = read_columns(fname, [1, 4], dtypes=[int, float])
     return starts, u
 
 
-def read_mask_file(fname):
-    #
-    open_func = gzip.open if fname.endswith('.gz') else open
-
-    with open_func(fname, 'rb') as file:
-        split_line = file.readline().decode().split('\t')
-        skiprows = 0 if split_line[1].isnumeric() else 1
-
-    regions = np.loadtxt(fname, usecols=(1, 2), dtype=int, skiprows=skiprows)
-
-    if regions.ndim == 1:
-        regions = regions[np.newaxis]
+def read_mask_file(fname, return_chrom_num=False):
+    # read mask regions. optionally also return the chromosome number, which
+    # is read in the same pass over the file
+    if return_chrom_num:
+        _, (chroms, starts, ends), __ = read_columns(
+            fname, [0, 1, 2], dtypes=[str, int, int]
+        )
+    else:
+        _, (starts, ends), __ = read_columns(fname, [1, 2], dtypes=int)
+    regions = np.stack([starts, ends], axis=1)
+    if return_chrom_num:
+        return regions, _get_chrom_num(chroms, fname)
     return regions
 
 
-def read_mask_chrom_num(fname):
-    # return the chromosome number as int, absent any alphabetic characters
-    chrom_nums = np.loadtxt(fname, usecols=(0), dtype=str)
-    if chrom_nums.ndim == 0:
-        chrom_nums = np.array([chrom_nums])
-    if chrom_nums[0] == 'chrom':
-        chrom_nums = chrom_nums[1:]
-    unique_nums = np.unique(chrom_nums)
+def _get_chrom_num(chroms, fname):
+    # reduce a column of chromosome names to a single chromosome number
+    unique_nums = np.unique(chroms)
     if len(unique_nums) > 1:
         raise ValueError(f'more than one chromosome is represented in {fname}')
     chrom_num = int(unique_nums[0].lstrip('chrom'))
     return chrom_num
 
 
+def read_mask_chrom_num(fname):
+    # return the chromosome number as int, absent any alphabetic characters
+    _, (chroms,), __ = read_columns(fname, [0], dtypes=str)
+    if len(chroms) > 0 and chroms[0] == 'chrom':
+        chroms = chroms[1:]
+    return _get_chrom_num(chroms, fname)
+
+
 def write_mask_file(regions, out_fname, chrom_num, write_header=False):
 
     if ".gz" in out_fname:
@@ -157,53 +274,44 @@ def write_mask_file(regions, out_fname, chrom_num, write_header=False):
 
 
 def read_map_file(fname, positions=None, map_col='Map(cM)'):
-    #
-    if fname.endswith('.gz'):
-        file = gzip.open(fname, 'rb')
-    else:
-        file = open(fname, 'rb')
-    header = file.readline().decode()
-    file.close()
-    cols = header.strip('\n').split('\t')
-    pos_idx = cols.index('Position(bp)')
-    map_idx = cols.index(map_col)
-    rcoords, rvals = np.loadtxt(
-        fname, skiprows=1, usecols=(pos_idx, map_idx), unpack=True
-    )
+    # returns (rcoords, rvals) or, if positions are given, the map
+    # interpolated at positions. positions may be a SiteIndex, which is
+    # interpolated without building the dense position vector
+    rmap = RecombinationMap.from_file(fname, map_col=map_col)
     if positions is not None:
-        if positions[0] < rcoords[0]:
+        if positions[0] < rmap.coords[0]:
             print(get_time(), 'positions below map start!')
-        if positions[-1] > rcoords[-1]:
+        if positions[-1] > rmap.coords[-1]:
             print(get_time(), 'positions above map end!')
-        r_map = np.interp(
-            positions,
-            rcoords,
-            rvals,
-            left=rvals[0],
-            right=rvals[-1]
-        )
+        if isinstance(positions, SiteIndex):
+            r_map = rmap.cM_at_sites(positions)
+        else:
+            r_map = rmap.cM_at(positions)
         assert np.all(r_map >= 0)
         assert np.all(np.diff(r_map)) >= 0
     else:
-        r_map = (rcoords, rvals)
+        r_map = (rmap.coords, rmap.vals)
     return r_map
 
 
 def read_map_rates(fname, rate_col='Rate(cM/Mb)'):
     #
-    file = open(fname, 'r')
-    header = file.readline()
-    file.close()
-    cols = header.strip('\n').split('\t')
-    pos_idx = cols.index('Position(bp)')
-    rate_idx = cols.index(rate_col)
-    coords = np.loadtxt(fname, skiprows=1, usecols=pos_idx, dtype=int)
-    rates = np.loadtxt(fname, skiprows=1, usecols=rate_idx, dtype=float)
+    _, (coords, rates), __ = read_columns(
+        fname, ['Position(bp)', rate_col], dtypes=[int, float]
+    )
     return coords, rates
 
 
+# maps fasta symbols onto uppercase bases; '.' and '-' become 'N'
+_fasta_symbol_table = bytes.maketrans(b'.-acgtn', b'NNACGTN')
+# True for bytes which represent called bases
+_fasta_called_table = np.ones(256, dtype=bool)
+_fasta_called_table[np.frombuffer(b'Nn.-', dtype=np.uint8)] = False
+_chunk_size = 1 << 24
+
+
 def read_fasta_file(fname, map_symbols=True):
-    # expects one sequence per file. returns an array of bytes
+    # expects one sequence per file. returns an array of bytes (dtype S1)
     if 'gz' in fname:
         open_fxn = gzip.open
     else:
@@ -217,21 +325,121 @@ def read_fasta_file(fname, map_symbols=True):
                 header = line
             else:
                 lines.append(line)
-    alleles = np.array(list(b''.join(lines).decode()))
+    sequence = b''.join(lines)
     if map_symbols:
-        mapping = {'.': 'N', '-': 'N', 'a': 'A', 'g': 'G', 't': 'T', 'c': 'C'}
-        for symbol in mapping:
-            alleles[alleles == symbol] = mapping[symbol]
+        sequence = sequence.translate(_fasta_symbol_table)
+    alleles = np.frombuffer(sequence, dtype='S1')
     return alleles, header
 
 
 def get_fa_allele_mask(genotypes):
     # bad name...
-    indicator = genotypes != 'N'
+    N = b'N' if genotypes.dtype.kind == 'S' else 'N'
+    indicator = genotypes != N
     regions = get_mask_from_bool(indicator)
     return regions
 
 
+class _RegionAccumulator:
+    # collects mask regions emitted in order from consecutive chunks of a
+    # sequence, merging regions that continue across chunk boundaries
+
+    def __init__(self):
+        self.blocks = []
+        self.last = None
+
+    def add(self, regions):
+        #
+        if len(regions) == 0:
+            return
+        regions = np.array(regions, dtype=np.int64)
+        if self.last is not None:
+            if regions[0, 0] <= self.last[1]:
+                regions[0, 0] = self.last[0]
+                regions[0, 1] = max(regions[0, 1], self.last[1])
+            else:
+                self.blocks.append(self.last[np.newaxis])
+        self.blocks.append(regions[:-1])
+        self.last = regions[-1]
+
+    def get_regions(self):
+        #
+        blocks = self.blocks
+        if self.last is not None:
+            blocks = blocks + [self.last[np.newaxis]]
+        if len(blocks) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        return np.concatenate(blocks, axis=0)
+
+
+def read_fasta_mask(fname, chunk_size=None):
+    """
+    build a mask of called (not N, '.' or '-') sites in a one-sequence
+    .fasta or .fa.gz file. the sequence is streamed in chunks and regions are
+    emitted from run boundaries, so memory use does not scale with sequence
+    length
+
+    :param fname: path to .fasta file
+    :param chunk_size: optional. number of bytes read at once
+    :return: array of 0-indexed mask regions, fasta header (bytes)
+    """
+    if chunk_size is None:
+        chunk_size = _chunk_size
+    open_fxn = gzip.open if 'gz' in fname else open
+    accumulator = _RegionAccumulator()
+    offset = 0
+    with open_fxn(fname, 'rb') as file:
+        header = file.readline().rstrip(b'\r\n')
+        if not header.startswith(b'>'):
+            raise ValueError(f'{fname} does not begin with a fasta header')
+        while True:
+            chunk = file.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            chunk = chunk.translate(None, b'\r\n')
+            called = _fasta_called_table[np.frombuffer(chunk, dtype=np.uint8)]
+            if len(called) > 0:
+                accumulator.add(get_mask_from_bool(called) + offset)
+            offset += len(called)
+    return accumulator.get_regions(), header
+
+
+def read_vcf_mask(fname, block_size=None):
+    """
+    build a mask of the positions covered by rows in a .vcf or .vcf.gz file.
+    rows are streamed in blocks and regions are emitted from run boundaries,
+    so memory use scales with the number of regions rather than with the
+    number of positions
+
+    :param fname: path to .vcf file
+    :param block_size: optional. number of rows parsed at once
+    :return: array of 0-indexed mask regions, contig id of the first row
+    """
+    if block_size is None:
+        block_size = _block_size
+    pos_idx = 1
+    open_fxn = gzip.open if ".gz" in fname else open
+    accumulator = _RegionAccumulator()
+    chrom = None
+    with open_fxn(fname, 'rb') as file:
+        lines = (line for line in file if not line.startswith(b'#'))
+        while True:
+            block = list(islice(lines, block_size))
+            if len(block) == 0:
+                break
+            if chrom is None:
+                chrom = block[0].split(b'\t', 1)[0].decode()
+            positions = np.array(
+                [line.split(b'\t', 2)[pos_idx] for line in block]
+            ).astype(np.int64)
+            # runs of adjacent 1-indexed positions; duplicates do not break runs
+            breaks = np.nonzero(np.diff(positions) > 1)[0]
+            starts = np.concatenate([[positions[0]], positions[breaks + 1]])
+            ends = np.concatenate([positions[breaks], [positions[-1]]])
+            accumulator.add(np.stack([starts - 1, ends], axis=1))
+    return accumulator.get_regions(), chrom
+
+
 def read_vcf_genotypes(fname, mask_regions=None, verbosity=1e5):
     # returns genotypes
 
@@ -468,30 +676,17 @@ def add_mask_flank(mask, flank):
     return ret
 
 
-def add_mask_flank_cM(mask, rcoords, rvals, flank):
-    # extend masks by a given map distance
-    # if the mask extends beyond the end of rcoords, the highest position
-    # in the returned mask will be rcoords[-1]
-    r_mask = np.interp(
-        mask,
-        rcoords,
-        rvals
-    )
-    ret = np.zeros((len(mask), 2), dtype=int)
-
-    for i, (r_start, r_end) in enumerate(r_mask):
-        # interpolate region edges
-        _start, _end = np.interp(
-            [r_start - flank, r_end + flank],
-            rvals,
-            rcoords
-        )
-        ret[i] = [_start, _end]
-
+def add_mask_flank_cM(mask, rmap, flank):
+    # extend masks by a given map distance. rmap is a RecombinationMap
+    # if the mask extends beyond the end of the map, the highest position
+    # in the returned mask will be the last map coordinate
+    r_mask = rmap.cM_at(mask)
+    r_mask[:, 0] -= flank
+    r_mask[:, 1] += flank
+    ret = rmap.position_at(r_mask).astype(int)
     ret[ret < 0] = 0
     # get rid of any overlap by merging overlapping regions
     ret = collapse_mask(ret)
-
     return ret
 
 
@@ -530,6 +725,32 @@ def add_masks(*masks):
     return regions
 
 
+def count_mask_intersection(mask_x, mask_y):
+    # count the sites shared by two masks with a sweep over the regions of
+    # mask_x against a rank index of mask_y. neither mask is expanded into a
+    # boolean array
+    index_y = SiteIndex(mask_y)
+    starts = np.asanyarray(mask_x)[:, 0] + 1
+    ends = np.asanyarray(mask_x)[:, 1] + 1
+    n_shared = (index_y.rank(ends) - index_y.rank(starts)).sum()
+    return int(n_shared)
+
+
+def get_mask_jaccard(mask_x, mask_y):
+    # the jaccard index (intersection over union) of the sites in two masks
+    n_x = np.diff(mask_x, axis=1).sum()
+    n_y = np.diff(mask_y, axis=1).sum()
+    n_shared = count_mask_intersection(mask_x, mask_y)
+    n_union = n_x + n_y - n_shared
+    return n_shared / n_union if n_union > 0 else np.nan
+
+
+def get_window_coverage(mask, windows):
+    # count the mask sites falling in each window [start, end)
+    windows = np.asanyarray(windows)[:, :2]
+    return np.diff(SiteIndex(mask).rank(windows), axis=1)[:, 0]
+
+
 def subtract_masks(minuend, subtrahend):
     # remove regions in subtrahend from minuend
     lengths = [minuend[-1, 1], subtrahend[-1, 1]]
@@ -541,6 +762,285 @@ def subtract_masks(minuend, subtrahend):
     return regions
 
 
+"""
+a rank/select index over mask regions
+"""
+
+
+class SiteIndex:
+    """
+    a compact index over the 1-indexed positions covered by mask regions,
+    stored as region edges and a prefix sum of region lengths. it stands in
+    for the dense vector returned by get_mask_positions: rank(x) equals
+    np.searchsorted(positions, x) and select(k) equals positions[k], each in
+    O(log n_regions) without ever building the position vector.
+    """
+
+    def __init__(self, regions):
+        """
+        :param regions: array of shape (n_regions, 2) holding sorted,
+            non-overlapping 0-indexed half-open mask regions
+        """
+        regions = np.asanyarray(regions, dtype=np.int64).reshape(-1, 2)
+        lengths = regions[:, 1] - regions[:, 0]
+        if np.any(lengths < 0):
+            raise ValueError('mask regions must have end >= start')
+        if np.any(regions[1:, 0] < regions[:-1, 1]):
+            raise ValueError('mask regions must be sorted and non-overlapping')
+        nonempty = lengths > 0
+        # first and last 1-indexed position in each region
+        self.starts = regions[nonempty, 0] + 1
+        self.ends = regions[nonempty, 1]
+        self.cum_lengths = np.concatenate(
+            [[0], np.cumsum(lengths[nonempty])]
+        )
+
+    @classmethod
+    def from_mask_file(cls, fname):
+        #
+        return cls(read_mask_file(fname))
+
+    def __len__(self):
+        #
+        return int(self.cum_lengths[-1])
+
+    @property
+    def n_sites(self):
+        #
+        return len(self)
+
+    @property
+    def n_regions(self):
+        #
+        return len(self.starts)
+
+    def rank(self, x):
+        # number of masked positions below x. equivalent to
+        # np.searchsorted(positions, x) on the dense position vector
+        x = np.asanyarray(x)
+        i = np.searchsorted(self.starts, x) - 1
+        _i = np.maximum(i, 0)
+        in_region = np.minimum(
+            x - self.starts[_i], self.ends[_i] - self.starts[_i] + 1
+        )
+        ret = np.where(i >= 0, self.cum_lengths[_i] + in_region, 0)
+        if ret.ndim == 0:
+            return int(ret)
+        return ret
+
+    def select(self, k):
+        # the kth (0-indexed) masked position. equivalent to positions[k]
+        k = np.asanyarray(k)
+        if np.any(k < 0) or np.any(k >= len(self)):
+            raise IndexError('site index out of range')
+        i = np.searchsorted(self.cum_lengths, k, side='right') - 1
+        ret = self.starts[i] + (k - self.cum_lengths[i])
+        if ret.ndim == 0:
+            return int(ret)
+        return ret
+
+    def __getitem__(self, idx):
+        # supports integer indices and contiguous slices
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            return self.select(np.arange(start, stop, step, dtype=np.int64))
+        if idx < 0:
+            idx += len(self)
+        return self.select(idx)
+
+    def contains(self, x):
+        # whether positions x are masked
+        x = np.asanyarray(x)
+        i = np.searchsorted(self.starts, x, side='right') - 1
+        return (i >= 0) & (x <= self.ends[np.maximum(i, 0)])
+
+    @property
+    def positions(self):
+        # the dense 1-indexed position vector
+        return self[:]
+
+
+def rank_sites(positions, x):
+    # count the sites below x, where positions is either a sorted position
+    # vector or a SiteIndex
+    if isinstance(positions, SiteIndex):
+        return positions.rank(x)
+    return np.searchsorted(positions, x)
+
+
+"""
+a class for holding recombination maps
+"""
+
+
+class RecombinationMap:
+    """
+    holds the knots of a linear recombination map, loaded once, and performs
+    vectorized lookups between physical (bp) and map (cM) coordinates
+    """
+
+    def __init__(self, coords, vals, contig=None):
+        """
+        :param coords: 1d array of map coordinates in bp, non-decreasing
+        :param vals: 1d array of map values in cM, non-decreasing
+        :param contig: optional. contig or chromosome id of the map
+        """
+        coords = np.asanyarray(coords, dtype=np.float64)
+        vals = np.asanyarray(vals, dtype=np.float64)
+        if coords.ndim != 1 or coords.shape != vals.shape:
+            raise ValueError('coords and vals must be 1d of equal length')
+        if len(coords) < 2:
+            raise ValueError('a map must have at least two knots')
+        if np.any(np.diff(coords) < 0):
+            raise ValueError('map coordinates must be non-decreasing')
+        if coords[-1] == coords[0]:
+            raise ValueError('a map must span a positive length')
+        if np.any(np.diff(vals) < 0):
+            raise ValueError('map values must be non-decreasing')
+        self.coords = coords
+        self.vals = vals
+        self.contig = contig
+
+    @classmethod
+    def from_file(cls, fname, map_col='Map(cM)', cache_dir=None):
+        """
+        load a map from a (possibly gzipped) text file with a header naming
+        'Position(bp)' and map_col columns. when cache_dir is given the knots
+        are also stored in a binary archive there, which is read in place of
+        the text file on later loads as long as it is newer than the text file
+
+        :param fname: path to map file
+        :param map_col: optional, default 'Map(cM)'. name of the map column
+        :param cache_dir: optional. directory in which to keep binary caches
+        """
+        source = os.path.abspath(fname)
+        if cache_dir is not None:
+            cache_fname = os.path.join(
+                cache_dir, f'{os.path.basename(fname)}.npz'
+            )
+            if os.path.exists(cache_fname) and \
+                    os.path.getmtime(cache_fname) > os.path.getmtime(fname):
+                with np.load(cache_fname) as archive:
+                    # maps with the same file name may live in other dirs
+                    if str(archive['source']) == source and \
+                            str(archive['map_col']) == map_col:
+                        contig = str(archive['contig'])
+                        return cls(
+                            archive['coords'],
+                            archive['vals'],
+                            contig=contig if len(contig) > 0 else None
+                        )
+        header, (coords, vals), contig = read_columns(
+            fname, ['Position(bp)', map_col], dtypes=float
+        )
+        # only keep the contig if the file has a chromosome column
+        if header[0] == 'Position(bp)':
+            contig = None
+        rmap = cls(coords, vals, contig=contig)
+        if cache_dir is not None:
+            try:
+                rmap.write_cache(cache_fname, map_col=map_col, source=source)
+            except OSError:
+                print(get_time(), f'could not write map cache {cache_fname}')
+        return rmap
+
+    def write_cache(self, fname, map_col='Map(cM)', source=''):
+        # write knots to a binary .npz archive
+        with open(fname, 'wb') as file:
+            np.savez(
+                file,
+                coords=self.coords,
+                vals=self.vals,
+                contig='' if self.contig is None else str(self.contig),
+                map_col=map_col,
+                source=source
+            )
+        return 0
+
+    def __len__(self):
+        #
+        return len(self.coords)
+
+    @property
+    def span(self):
+        # physical length covered by the map, in bp
+        return self.coords[-1] - self.coords[0]
+
+    @property
+    def length(self):
+        # map length in cM
+        return self.vals[-1] - self.vals[0]
+
+    @property
+    def rates(self):
+        # rate in cM/bp within each of the len(self) - 1 map intervals.
+        # zero-length intervals, from repeated coordinates, have rate 0
+        widths = np.diff(self.coords)
+        return np.divide(
+            np.diff(self.vals),
+            widths,
+            out=np.zeros(len(widths)),
+            where=widths > 0
+        )
+
+    def cM_at(self, positions):
+        # interpolate map values at positions. positions beyond the map are
+        # assigned the value at the nearest map end
+        return np.interp(
+            positions,
+            self.coords,
+            self.vals,
+            left=self.vals[0],
+            right=self.vals[-1]
+        )
+
+    def cM_at_sites(self, index, chunk_size=1 << 20):
+        # interpolate map values at every position of a SiteIndex. positions
+        # are selected chunk_size at a time, so the dense position vector is
+        # never built
+        r_map = np.empty(len(index), dtype=np.float64)
+        for start in range(0, len(index), chunk_size):
+            stop = min(start + chunk_size, len(index))
+            r_map[start:stop] = self.cM_at(index[start:stop])
+        return r_map
+
+    def position_at(self, cM):
+        # interpolate physical positions at map values. values beyond the
+        # map are assigned the nearest map end coordinate
+        return np.interp(
+            cM,
+            self.vals,
+            self.coords,
+            left=self.coords[0],
+            right=self.coords[-1]
+        )
+
+    def mean_rate(self):
+        # average recombination rate per bp per generation, in Morgans
+        return self.length / self.span / 100
+
+    def rate_map(self, L=None):
+        """
+        get an msprime.RateMap of per-bp recombination rates (in Morgans). the
+        first map interval is extended to position 0, and the map is truncated
+        at L or, where it ends before L, its last rate is extended to L
+
+        :param L: optional. sequence length; defaults to the last coordinate
+        """
+        import msprime
+
+        if L is None:
+            L = self.coords[-1]
+        # drop zero-length intervals, which RateMap does not accept
+        nonzero = np.diff(self.coords) > 0
+        starts = self.coords[:-1][nonzero]
+        starts[0] = 0
+        rates = self.rates[nonzero] / 100
+        keep = starts < L
+        edges = np.append(starts[keep], L)
+        return msprime.RateMap(position=edges, rate=rates[keep])
+
+
 """
 a class for rapidly reading and accessing small .vcf files
 """
@@ -751,21 +1251,19 @@ class Mask(np.ndarray):
         :param fname: path to .vcf or vcf.gz file
         :return: class instance
         """
-        chrom_idx = 0
-        pos_idx = 1
-        positions = []
-        if ".gz" in fname:
-            open_func = gzip.open
-        else:
-            open_func = open
-        with open_func(fname, "rb") as file:
-            for line in file:
-                if line.startswith(b'#'):
-                    continue
-                positions.append(line.split(b'\t')[pos_idx])
-        chrom_num = line.split(b'\t')[chrom_idx].decode()
-        positions = np.array(positions).astype(np.int64)
-        regions = cls.positions_to_regions(positions)
+        regions, chrom_num = read_vcf_mask(fname)
+        return cls(regions, chrom_num=chrom_num)
+
+    @classmethod
+    def from_fasta_file(cls, fname, chrom_num=None):
+        """
+        read a mask of called sites in a .fasta file
+
+        :param fname: path to .fasta or .fa.gz file
+        :param chrom_num: optional. chromosome number of the mask
+        :return: class instance
+        """
+        regions, _ = read_fasta_mask(fname)
         return cls(regions, chrom_num=chrom_num)
 
     @classmethod
@@ -16,11 +16,14 @@ setup(
             'parse_H2=archaic.pipeline.parse_H2:main',
             'parse_weighted_H2=archaic.pipeline.parse_weighted_H2:main',
             'bootstrap_H2=archaic.pipeline.bootstrap_H2:main',
+            'jackknife_H2=archaic.pipeline.jackknife_H2:main',
             'compute_H2=archaic.pipeline.compute_H2:main',
             'bootstrap_precomp_H2=archaic.pipeline.bootstrap_precomp_H2:main',
             'fit_H2=archaic.scripts.fit_H2:main',
+            'multistart=archaic.scripts.multistart:main',
             'plot_H2=archaic.plots.plot_H2:main',
-            'isec_masks=archaic.pipeline.isec_masks:main'
+            'isec_masks=archaic.pipeline.isec_masks:main',
+            'print_mask_stats=archaic.scripts.print_mask_stats:main'
         ]
     }
 )
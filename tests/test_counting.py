@@ -4,7 +4,7 @@ tests of numpy functions, especially searchsorted
 from bisect import bisect
 import numpy as np
 
-from archaic import util, counting
+from archaic import util, counting, dev
 
 
 """
@@ -306,6 +306,196 @@ def test_weighted_site_pair_counting():
     return
 
 
+def test_2d_weighted_site_pair_counting():
+    # many weight vectors at once should match one-at-a-time counting
+    thresh = 1e-6
+
+    def sub_test(weights, rmap, bins, left_bound):
+        #
+        vec = counting.count_weighted_site_pairs_2d(
+            weights, rmap, bins, left_bound=left_bound, chunk_size=300
+        )
+        for k in range(weights.shape[1]):
+            naive = naively_count_weighted_site_pairs(
+                weights[:, k], rmap, bins, left_bound=left_bound
+            )
+            assert np.all(
+                np.logical_and(
+                    vec[k] <= naive * (1 + thresh),
+                    vec[k] >= naive * (1 - thresh)
+                )
+            )
+
+    rmap = get_random_rmap(1000, upper=5e-6)
+    long_rmap = get_random_rmap(1000, upper=0.002)
+    weights = np.random.uniform(size=(1000, 3))
+    integer_weights = np.random.randint(0, 2, size=(1000, 2))
+
+    sub_test(weights, rmap, _default_bins, None)
+    sub_test(weights, rmap, _extended_bins, 400)
+    sub_test(weights, long_rmap, _default_bins, None)
+    sub_test(weights, long_rmap, _extended_bins, 700)
+    sub_test(integer_weights, long_rmap, _default_bins, 500)
+
+    # a left bound of zero counts nothing
+    empty = counting.count_weighted_site_pairs_2d(
+        weights, rmap, _default_bins, left_bound=0
+    )
+    assert np.all(empty == 0)
+
+    return
+
+
+def test_windowed_site_pair_counting():
+    # one sweep over all windows should match counting window by window
+    rmap = get_random_rmap(1500, upper=0.002)
+    weights = np.random.uniform(size=(1500, 2))
+    right_weights = np.random.uniform(size=(1500, 2))
+    # tiling windows with overlapping right bounds, plus an empty window and
+    # one whose left range overlaps another
+    site_edges = np.array(
+        [[0, 400, 700], [400, 800, 1100], [800, 800, 1500],
+         [800, 1500, 1500], [300, 900, 1000]]
+    )
+    windowed = counting.count_windowed_site_pairs(
+        rmap, _default_bins, site_edges, weights=weights, chunk_size=250
+    )
+    unweighted = counting.count_windowed_site_pairs(
+        rmap, _default_bins, site_edges
+    )
+    asymmetric = counting.count_windowed_site_pairs(
+        rmap,
+        _default_bins,
+        site_edges,
+        weights=weights,
+        right_weights=right_weights
+    )
+    for w, (start, l_end, r_end) in enumerate(site_edges):
+        sub_rmap = rmap[start:r_end]
+        expected = counting.count_weighted_site_pairs_2d(
+            weights[start:r_end], sub_rmap, _default_bins,
+            left_bound=l_end - start
+        )
+        assert np.allclose(windowed[w], expected)
+        if l_end > start:
+            naive = naively_count_site_pairs(
+                sub_rmap, _default_bins, left_bound=l_end - start
+            )
+            assert np.all(unweighted[w] == naive)
+        else:
+            assert np.all(unweighted[w] == 0)
+        # left weights times binned sums of right weights
+        edges = counting.get_bin_edges(
+            sub_rmap, _default_bins, left_bound=l_end - start
+        )
+        cum = np.zeros((r_end - start + 1, 2))
+        cum[1:] = np.cumsum(right_weights[start:r_end], axis=0)
+        expected = np.einsum(
+            'ij,ikj->jk', weights[start:l_end], np.diff(cum[edges], axis=1)
+        )
+        assert np.allclose(asymmetric[w], expected)
+    return
+
+
+def test_left_site_chunks():
+    # chunks of the left-site enumeration tile the full enumeration
+    site_edges = np.array(
+        [[0, 4, 7], [4, 8, 11], [8, 8, 15], [8, 15, 15], [3, 9, 10]]
+    )
+    expected_sites = np.concatenate(
+        [np.arange(start, end) for start, end, _ in site_edges]
+    )
+    expected_owners = np.repeat(
+        np.arange(5), np.maximum(site_edges[:, 1] - site_edges[:, 0], 0)
+    )
+    for chunk_size in [1, 3, 5, 100]:
+        chunks = [
+            counting._get_left_sites(site_edges, start, start + chunk_size)
+            for start in range(0, len(expected_sites), chunk_size)
+        ]
+        assert np.all(np.concatenate([c[0] for c in chunks]) == expected_sites)
+        assert np.all(
+            np.concatenate([c[1] for c in chunks]) == expected_owners
+        )
+    return
+
+
+def test_pair_statistics():
+    # declared statistics should match direct windowed counts, in serial
+    # and in parallel
+    rmap = get_random_rmap(1200, upper=0.002)
+    u = np.random.uniform(size=1200)
+    left = np.random.uniform(size=(1200, 2))
+    right = np.random.uniform(size=(1200, 2))
+    site_edges = np.array([[0, 300, 700], [300, 900, 1100], [900, 1200, 1200]])
+    stats = [
+        counting.PairStatistic('u', u),
+        counting.PairStatistic('lr', left, right),
+        counting.PairStatistic('pairs')
+    ]
+    for n_workers in [1, 2]:
+        sums = counting.compute_pair_statistics(
+            stats, rmap, _default_bins, site_edges, n_workers=n_workers
+        )
+        assert np.allclose(
+            sums['u'],
+            counting.count_windowed_site_pairs(
+                rmap, _default_bins, site_edges, weights=u
+            )
+        )
+        assert np.allclose(
+            sums['lr'],
+            counting.count_windowed_site_pairs(
+                rmap,
+                _default_bins,
+                site_edges,
+                weights=left,
+                right_weights=right
+            )
+        )
+        assert np.all(
+            sums['pairs'] == counting.count_windowed_site_pairs(
+                rmap, _default_bins, site_edges
+            )
+        )
+    reduced = counting.compute_pair_statistics(
+        stats, rmap, _default_bins, site_edges, dtype=np.float32
+    )
+    # bins holding few sites carry float32 rounding of sums within one
+    # prefix-sum block, bounded near 2 * 64 * 6e-8
+    for name in sums:
+        assert np.allclose(reduced[name], sums[name], rtol=1e-5)
+    return
+
+
+def test_float32_weighted_site_pair_counting():
+    # single-precision storage of u-map sized weights, quantified against
+    # the float64 reference
+    rmap = get_random_rmap(100_000, upper=5e-6)
+    u = np.random.uniform(0.5e-8, 2e-8, size=100_000)
+    reference = counting.compute_binned_u_prods(u, rmap, _default_bins)
+    reduced = counting.compute_binned_u_prods(
+        u, rmap, _default_bins, dtype=np.float32
+    )
+    nonzero = reference > 0
+    rel_err = np.abs(reduced - reference)[nonzero] / reference[nonzero]
+    assert np.max(rel_err) < 1e-7
+
+    # an uncompensated float32 running sum is orders of magnitude worse
+    u32 = u.astype(np.float32)
+    cum = np.zeros(len(u) + 1, dtype=np.float32)
+    cum[1:] = np.cumsum(u32)
+    edges = counting.get_bin_edges(rmap, _default_bins)
+    naive = (u32[:, np.newaxis] * np.diff(cum[edges], axis=1)).sum(0)
+    naive_err = np.abs(naive - reference)[nonzero] / reference[nonzero]
+    assert np.max(rel_err) * 100 < np.max(naive_err)
+
+    # dev.compute_uu_sums keeps float32 maps in single precision
+    uu_sums = dev.compute_uu_sums(rmap, u32, _default_bins)
+    assert np.allclose(uu_sums, reference, rtol=1e-6)
+    return
+
+
 def __test_fast_weighted_site_pair_counting():
     # uses the new function
 
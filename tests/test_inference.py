@@ -0,0 +1,659 @@
+"""
+tests of likelihood and optimization utilities
+"""
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import demes
+import moments
+import multiprocessing
+import numpy as np
+import pytest
+
+from archaic import inference
+from archaic.spectra import H2Evaluator, H2Spectrum
+
+
+"""
+utilities for generating spectra
+"""
+
+
+def get_random_covs(n_bins, n):
+    # random positive definite matrices
+    A = np.random.uniform(size=(n_bins, n, n))
+    return A @ A.transpose(0, 2, 1) + n * np.eye(n)
+
+
+def get_random_spectrum(n_samples=2, n_bins=5, has_H=True):
+    #
+    ids = np.array(H2Spectrum.expand_ids([f'X{i}' for i in range(n_samples)]))
+    n_rows = n_bins + 1 if has_H else n_bins
+    data = np.random.uniform(size=(n_rows, len(ids)))
+    covs = get_random_covs(n_rows, len(ids))
+    r_bins = np.logspace(-6, -2, n_bins + 1)
+    return H2Spectrum(data, r_bins, ids, has_H=has_H, covs=covs)
+
+
+_graph = """
+time_units: generations
+demes:
+- name: A
+  epochs:
+  - {end_time: 1000, start_size: 10000}
+  - {end_time: 0, start_size: 2000}
+- name: B
+  ancestors: [A]
+  start_time: 1000
+  epochs:
+  - {end_time: 0, start_size: 5000}
+"""
+
+
+_options = """
+parameters:
+- name: NA
+  lower_bound: 1000
+  upper_bound: 30000
+  values:
+  - demes:
+      A:
+        epochs:
+          0: start_size
+- name: NB
+  lower_bound: 1000
+  upper_bound: 30000
+  values:
+  - demes:
+      B:
+        epochs:
+          0: start_size
+"""
+
+
+def write_model_files(path):
+    # write a small two-deme graph and its options file
+    graph_fname = f'{path}/graph.yaml'
+    options_fname = f'{path}/options.yaml'
+    with open(graph_fname, 'w') as file:
+        file.write(_graph)
+    with open(options_fname, 'w') as file:
+        file.write(_options)
+    return graph_fname, options_fname
+
+
+def get_model_data(graph_fname):
+    # expected H2 with 1% standard errors
+    data = H2Spectrum.from_demes(demes.load(graph_fname), u=1.35e-8)
+    data.covs = np.array([np.diag((x * 0.01) ** 2) for x in data.arr])
+    return data
+
+
+def naively_get_bin_ll(xs, mus, covs):
+    #
+    return np.array([
+        inference.log_gaussian(x, mu, np.linalg.inv(cov))
+        for x, mu, cov in zip(xs, mus, covs)
+    ])
+
+
+"""
+likelihood
+"""
+
+
+def test_bin_ll():
+    #
+    data = get_random_spectrum(3)
+    model = get_random_spectrum(3)
+    expected = naively_get_bin_ll(data.arr, model.arr, data.covs)
+    assert np.allclose(inference.get_bin_ll(model, data), expected)
+    assert np.isclose(inference.get_ll(model, data), expected.sum())
+    assert np.allclose(
+        inference._get_bin_ll(data.arr, model.arr, data.covs), expected
+    )
+
+    # alternating datasets each use their own factors
+    other = get_random_spectrum(3)
+    for spectrum in [data, other, data]:
+        expected = naively_get_bin_ll(spectrum.arr, model.arr, spectrum.covs)
+        assert np.allclose(inference.get_bin_ll(model, spectrum), expected)
+    return
+
+
+def test_many_ll():
+    # stacked models should match one-at-a-time evaluation
+    data = get_random_spectrum(3)
+    models = [get_random_spectrum(3) for _ in range(7)]
+    lls = inference.get_many_ll(models, data)
+    expected = [inference.get_ll(model, data) for model in models]
+    assert np.allclose(lls, expected)
+    mus = np.stack([model.arr for model in models])
+    assert np.allclose(inference.get_many_ll(mus, data), expected)
+    bin_lls = inference.get_whitened_bin_ll(data.arr, mus, data.cov_factors)
+    assert bin_lls.shape == (7, 6)
+    return
+
+
+def test_cov_factors():
+    #
+    spectrum = get_random_spectrum(3)
+    L = spectrum.cholesky
+    assert np.allclose(L @ L.transpose(0, 2, 1), spectrum.covs)
+    W = spectrum.cov_factors
+    assert np.allclose(
+        W.transpose(0, 2, 1) @ W, np.linalg.inv(spectrum.covs)
+    )
+
+    # factors are recomputed for subsets and when H is removed
+    sub = spectrum.subset(['X0', 'X2'])
+    assert sub.cholesky.shape == (6, 3, 3)
+    L = sub.cholesky
+    assert np.allclose(L @ L.transpose(0, 2, 1), sub.covs)
+    no_H = spectrum.remove_H()
+    assert no_H.cov_factors.shape == (5, 6, 6)
+
+    # and when covariances are replaced
+    spectrum.covs = get_random_covs(6, 6)
+    assert np.allclose(
+        spectrum.cholesky @ spectrum.cholesky.transpose(0, 2, 1),
+        spectrum.covs
+    )
+    return
+
+
+def test_model_cache():
+    #
+    cache = inference.ModelCache(max_size=2)
+    calls = []
+
+    def model_func(p):
+        calls.append(p)
+        return float(np.sum(p))
+
+    r = np.array([0, 1e-3])
+    cache.get_model(model_func, [1.0, 2.0], ['A'], r, 1e-8)
+    # nearly identical parameters share a key
+    cache.get_model(model_func, [1.0 + 1e-13, 2.0], ['A'], r, 1e-8)
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    # but context distinguishes entries
+    cache.get_model(model_func, [1.0, 2.0], ['B'], r, 1e-8)
+    cache.get_model(model_func, [1.0, 2.0], ['A'], r * 2, 1e-8)
+    assert len(calls) == 3
+    assert len(cache) == 2
+    # the least recently used entry was evicted
+    cache.get_model(model_func, [1.0, 2.0], ['A'], r, 1e-8)
+    assert len(calls) == 4
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0
+    return
+
+
+"""
+expectations
+"""
+
+
+def test_H2_evaluator(tmp_path):
+    # compare against one-statistic-at-a-time extraction from moments
+    graph_fname, _ = write_model_files(tmp_path)
+    graph = demes.load(graph_fname)
+    r_bins = np.logspace(-6, -2, 5)
+    r = H2Spectrum.get_r(r_bins)
+    u = 1.35e-8
+    evaluator = H2Evaluator(['A', 'B'], r, r_bins=r_bins)
+    spectrum = evaluator(graph, u)
+    stats = moments.LD.LDstats.from_demes(
+        graph, sampled_demes=['A', 'B'], theta=None, r=r, u=u
+    )
+    expected = np.stack([
+        stats.H2('A', phased=True),
+        stats.H2('A', 'B', phased=False),
+        stats.H2('B', phased=True)
+    ], axis=1)
+    expected = H2Spectrum.approximate_H2(expected)
+    assert np.allclose(spectrum.arr[:-1], expected)
+    assert np.allclose(spectrum.arr[-1], stats.H())
+    assert np.all(spectrum.ids == [['A', 'A'], ['A', 'B'], ['B', 'B']])
+    no_H = H2Evaluator(['A', 'B'], r, get_H=False)(graph, u)
+    assert not no_H.has_H
+    assert np.allclose(no_H.arr, expected)
+    return
+
+
+"""
+likelihood surfaces
+"""
+
+
+def test_grid_ll(tmp_path):
+    #
+    target = np.array([1.3, -0.4])
+
+    def ll_func(model, data):
+        return -np.sum((np.sqrt(model) - data) ** 2)
+
+    axes = [np.linspace(0, 2, 5), np.linspace(-1, 1, 7)]
+    levels = inference.grid_ll(
+        squares, np.abs(target), axes, ll_func=ll_func, n_refine=3
+    )
+    assert len(levels) == 4
+    _axes, lls = levels[0]
+    assert lls.shape == (5, 7)
+    expected = ll_func(squares([0.5, -1 / 3]), np.abs(target))
+    assert np.isclose(lls[1, 2], expected)
+    # refined grids close in on the maximum
+    _axes, lls = levels[-1]
+    best = np.unravel_index(np.argmax(lls), lls.shape)
+    best_p = [axis[i] for axis, i in zip(_axes, best)]
+    assert np.allclose(best_p, target, atol=0.02)
+
+    # interrupt a run partway and resume it
+    out_fname = f'{tmp_path}/grid.npz'
+    n_calls = 0
+    max_calls = 20
+
+    def failing_ll_func(model, data):
+        nonlocal n_calls
+        n_calls += 1
+        if n_calls > max_calls:
+            raise KeyboardInterrupt
+        return ll_func(model, data)
+
+    with pytest.raises(KeyboardInterrupt):
+        inference.grid_ll(
+            squares,
+            np.abs(target),
+            axes,
+            ll_func=failing_ll_func,
+            n_refine=1,
+            chunk_size=4,
+            out_fname=out_fname
+        )
+    partial = np.load(out_fname)['ll0']
+    assert np.sum(~np.isnan(partial)) == 20
+    n_calls = 0
+    max_calls = np.inf
+    resumed = inference.grid_ll(
+        squares,
+        np.abs(target),
+        axes,
+        ll_func=failing_ll_func,
+        n_refine=1,
+        chunk_size=4,
+        out_fname=out_fname
+    )
+    # only the remaining points were evaluated
+    assert n_calls == 35 - 20 + 35
+    for (axes0, lls0), (axes1, lls1) in zip(levels, resumed):
+        assert np.all(lls0 == lls1)
+
+    # nan lls are neither maxima nor re-evaluated on resume
+    nan_fname = f'{tmp_path}/nan_grid.npz'
+
+    def nan_ll_func(model, data):
+        nonlocal n_calls
+        n_calls += 1
+        if model[0] < 0.5:
+            return np.nan
+        return ll_func(model, data)
+
+    n_calls = 0
+    levels = inference.grid_ll(
+        squares,
+        np.abs(target),
+        axes,
+        ll_func=nan_ll_func,
+        n_refine=1,
+        out_fname=nan_fname
+    )
+    assert np.any(np.isnan(levels[0][1]))
+    assert np.all(levels[1][0][0] >= 1)
+    assert n_calls == 35 + 35
+    inference.grid_ll(
+        squares,
+        np.abs(target),
+        axes,
+        ll_func=nan_ll_func,
+        n_refine=1,
+        out_fname=nan_fname
+    )
+    assert n_calls == 35 + 35
+    return
+
+
+"""
+uncertainties
+"""
+
+
+def test_stencil():
+    # central differences are exact for quadratic functions
+    n = 4
+    Q = get_random_covs(1, n)[0]
+    b = np.random.uniform(size=n)
+    p0 = np.random.uniform(1, 2, size=n)
+
+    def func(p, _):
+        return p @ Q @ p + b @ p
+
+    points, hs = inference.get_stencil(p0, 0.01)
+    assert len(points) == 1 + 2 * n ** 2
+    assert len(np.unique(points, axis=0)) == len(points)
+    fs = np.array([func(p, None) for p in points])
+    assert np.allclose(inference.get_stencil_hessian(fs, hs), 2 * Q)
+    gradient = 2 * Q @ p0 + b
+    assert np.allclose(inference.get_stencil_gradient(fs, hs), gradient)
+    assert np.allclose(inference.get_hessian(func, p0, None, 0.01), 2 * Q)
+    assert np.allclose(
+        inference.get_gradient(func, p0, 0.01, None)[:, 0], gradient
+    )
+    return
+
+
+def test_godambe_matrix():
+    # with a linear model the Hessian is exact
+    data = get_random_spectrum(2)
+    n = 3
+    B = np.random.uniform(size=(data.n_bins, len(data.ids), n))
+
+    def model_func(p):
+        arr = data.arr + B @ p
+        return H2Spectrum(arr, data.r_bins, data.ids, has_H=True)
+
+    p0 = np.random.uniform(1, 2, size=n)
+    bootstraps = [get_random_spectrum(2) for _ in range(4)]
+    for bootstrap in bootstraps:
+        bootstrap.covs = data.covs
+    inv_covs = np.linalg.inv(data.covs)
+    expected_H = 2 * np.einsum('kia,kij,kjb->ab', B, inv_covs, B)
+    H = inference.get_godambe_matrix(
+        model_func, p0, data, bootstraps, 0.01, just_H=True
+    )
+    assert np.allclose(H, expected_H)
+
+    # bootstrap scores are exact gradients of the log-likelihood
+    scores = []
+    for bootstrap in bootstraps:
+        resid = bootstrap.arr - model_func(p0).arr
+        scores.append(2 * np.einsum('ki,kij,kja->a', resid, inv_covs, B))
+    scores = np.array(scores)
+    J = scores.T @ scores / len(bootstraps)
+    expected = expected_H @ np.linalg.inv(J) @ expected_H
+    cache = inference.ModelCache()
+    godambe_matrix = inference.get_godambe_matrix(
+        model_func, p0, data, bootstraps, 0.01, cache=cache
+    )
+    assert np.allclose(godambe_matrix, expected)
+    # every stencil point was built once
+    assert cache.misses == len(cache) == 1 + 2 * n ** 2
+    return
+
+
+"""
+fitting
+"""
+
+
+def test_fit_sessions(tmp_path):
+    # fits in concurrent threads keep separate counts and caches
+    graph_fname, options_fname = write_model_files(tmp_path)
+    data = get_model_data(graph_fname)
+    p0s = [[5000, 5000], [20000, 2000]]
+
+    def fit(p0):
+        return inference.fit_H2(
+            graph_fname,
+            options_fname,
+            data,
+            max_iter=5,
+            u=1.35e-8,
+            verbosity=0,
+            p0=p0
+        )
+
+    serial = [fit(p0).metadata['opt_info'] for p0 in p0s]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        graphs = list(executor.map(fit, p0s))
+    threaded = [graph.metadata['opt_info'] for graph in graphs]
+    for info, expected in zip(threaded, serial):
+        assert info['fopt'] == expected['fopt']
+        assert info['func_calls'] == expected['func_calls']
+
+    session = inference.FitSession()
+    builder = demes.load_asdict(graph_fname)
+    options = moments.Demes.Inference._get_params_dict(options_fname)
+    args = (builder, options, data, 1.35e-8)
+    f = inference.objective_H2(p0s[0], *args, verbosity=0, session=session)
+    assert f == inference.objective_H2(
+        p0s[0], *args, verbosity=0, session=session
+    )
+    assert session.n_calls == 2
+    assert (session.cache.hits, session.cache.misses) == (1, 1)
+    return
+
+
+class Interrupt(Exception):
+    pass
+
+
+def test_checkpoint_resume(tmp_path):
+    # an interrupted and resumed fit ends where an uninterrupted fit does
+    graph_fname, options_fname = write_model_files(tmp_path)
+    data = get_model_data(graph_fname)
+    checkpoint_fname = str(tmp_path / 'checkpoint.npz')
+    kwargs = dict(
+        max_iter=12,
+        u=1.35e-8,
+        verbosity=0,
+        p0=[5000, 20000],
+        method='NelderMead'
+    )
+    expected = inference.fit_H2(
+        graph_fname, options_fname, data, **kwargs
+    ).metadata['opt_info']
+
+    def monitor(p, f):
+        monitor.n_calls += 1
+        if monitor.n_calls > 15:
+            raise Interrupt
+
+    monitor.n_calls = 0
+    with pytest.raises(Interrupt):
+        inference.fit_H2(
+            graph_fname,
+            options_fname,
+            data,
+            monitor=monitor,
+            checkpoint_fname=checkpoint_fname,
+            checkpoint_every=4,
+            **kwargs
+        )
+    state = inference.read_checkpoint(checkpoint_fname)
+    assert 0 < state['n_iters'] < 12
+    assert not state['done']
+
+    info = inference.fit_H2(
+        graph_fname,
+        options_fname,
+        data,
+        checkpoint_fname=checkpoint_fname,
+        checkpoint_every=4,
+        resume=True,
+        **kwargs
+    ).metadata['opt_info']
+    assert info['fopt'] == expected['fopt']
+    assert info['n_iter'] == expected['n_iter'] == 12
+    # restarting a segment does not re-evaluate the saved simplex
+    assert info['func_calls'] == expected['func_calls']
+    assert inference.read_checkpoint(checkpoint_fname)['done']
+
+    # a run stopped after its last iteration, but before it finished, is
+    # not continued
+    state = inference.read_checkpoint(checkpoint_fname)
+    state['done'] = False
+    inference.write_checkpoint(checkpoint_fname, **state)
+    monitor.n_calls = 0
+    info = inference.fit_H2(
+        graph_fname,
+        options_fname,
+        data,
+        monitor=monitor,
+        checkpoint_fname=checkpoint_fname,
+        checkpoint_every=4,
+        resume=True,
+        **kwargs
+    ).metadata['opt_info']
+    assert monitor.n_calls == 0
+    assert info['fopt'] == expected['fopt']
+    assert info['n_iter'] == 12 and info['flag'] == 2
+    return
+
+
+def squares(p):
+    # a picklable stand-in for a model function
+    return np.asarray(p) ** 2
+
+
+def test_finite_difference_gradient():
+    #
+    cache = inference.ModelCache()
+
+    def object_func(p, scale):
+        return scale * cache.get_model(squares, p).sum()
+
+    p = np.array([1.0, 2.0, 3.0])
+    expected = 2 * 2 * p
+    for central in [False, True]:
+        gradient = inference.FiniteDifferenceGradient(
+            object_func, squares, cache, delta=1e-6, central=central
+        )
+        assert np.allclose(gradient(p, 2), expected)
+    # every objective evaluation was a cache hit
+    assert cache.misses == 1 + 3 + 3
+
+    # the objective at p is reused from the session, and other points are
+    # evaluated through the function passed by the optimizer
+    session = inference.FitSession()
+    session.update(p, object_func(p, 2))
+    gradient = inference.FiniteDifferenceGradient(
+        object_func, squares, cache, delta=1e-6, session=session
+    )
+    evaluated = []
+
+    def wrapper(x, scale):
+        evaluated.append(x)
+        return object_func(x, scale)
+
+    assert np.allclose(gradient(p, 2, object_func=wrapper), expected)
+    assert len(evaluated) == 3
+    assert not any(np.all(x == p) for x in evaluated)
+
+    # steps do not cross bounds
+    gradient = inference.FiniteDifferenceGradient(
+        object_func,
+        squares,
+        cache,
+        lower_bounds=np.array([1.0, 0, 0]),
+        upper_bounds=np.array([10, 10, 3.0]),
+        delta=1e-6,
+        central=True
+    )
+    points, idx_upper, idx_lower, widths = gradient.get_points(p)
+    assert np.all(points >= gradient.lower_bounds)
+    assert np.all(points <= gradient.upper_bounds)
+    assert idx_lower[0] == 0 and idx_upper[2] == 0
+    assert np.allclose(gradient(p, 2), expected, rtol=1e-5)
+
+    # nor do they violate constraints, where the objective returns a
+    # sentinel value
+    def constraints(p):
+        return np.array([p[1] - p[0]])
+
+    def constrained_func(p, scale):
+        if inference.check_params(p, None, None, gradient.constraints):
+            return 1e10
+        return object_func(p, scale)
+
+    gradient = inference.FiniteDifferenceGradient(
+        constrained_func, squares, cache, constraints=constraints, delta=1e-4
+    )
+    p = np.array([1.0, 1.00005])
+    assert np.allclose(gradient(p, 2), 4 * p, rtol=1e-3)
+
+    # with no feasible step, the derivative falls back to 0
+    def narrow_constraints(p):
+        return np.array([p[1] - p[0], p[0] + 2e-5 - p[1]])
+
+    gradient.constraints = narrow_constraints
+    p = np.array([1.0, 1.00001])
+    assert np.all(gradient(p, 2) == 0)
+    return
+
+
+"""
+multi-start optimization
+"""
+
+
+def test_start_monitor():
+    #
+    shared_best = multiprocessing.Value('d', -np.inf)
+    leader = inference._StartMonitor(shared_best, delta=10, after=3)
+    trailer = inference._StartMonitor(shared_best, delta=10, after=3)
+    leader(None, 5.0)
+    assert shared_best.value == -5
+    trailer(None, 100.0)
+    trailer(None, 50.0)
+    # the trailing start is abandoned once it has made enough calls
+    with pytest.raises(inference.AbandonedFit):
+        trailer(None, 20.0)
+    trailer = inference._StartMonitor(shared_best, delta=10, after=1)
+    trailer(None, 14.0)
+    assert trailer.best_ll == -14
+    return
+
+
+def test_multistart(tmp_path):
+    #
+    graph_fname, options_fname = write_model_files(tmp_path)
+    data = get_model_data(graph_fname)
+    results = inference.multistart(
+        inference.fit_H2,
+        graph_fname,
+        options_fname,
+        data,
+        n_starts=3,
+        top_k=2,
+        seed=1,
+        out_prefix=f'{tmp_path}/fit',
+        u=1.35e-8,
+        max_iter=3,
+        verbosity=0,
+        method='NelderMead'
+    )
+    lls = [result['ll'] for result in results]
+    assert len(results) == 3
+    assert lls == sorted(lls, reverse=True)
+    best = demes.load(f'{tmp_path}/fit_best1.yaml')
+    assert np.isclose(best.metadata['opt_info']['fopt'], lls[0])
+    assert (tmp_path / 'fit_best2.yaml').exists()
+    assert not (tmp_path / 'fit_best3.yaml').exists()
+    # starting points are reproducible given a seed
+    builder = demes.load_asdict(graph_fname)
+    options = moments.Demes.Inference._get_params_dict(options_fname)
+    rng = np.random.default_rng(1)
+    p0 = inference.get_perturbed_params(builder, options, rng=rng)
+    p0s = {result['start']: result['p0'] for result in results}
+    assert np.all(p0s[0] == p0)
+    return
+
+
+@pytest.mark.parametrize(
+    'script', ['multistart', 'sim_infer', 'H2_map_test']
+)
+def test_multistart_scripts_import(script):
+    # scripts that drive multistart import cleanly
+    module = importlib.import_module(f'archaic.scripts.{script}')
+    assert hasattr(module, 'get_args')
+    return
@@ -0,0 +1,361 @@
+"""
+tests of vectorized statistic-parsing functions against naive loops
+"""
+import numpy as np
+
+from archaic import counting, parsing, util
+
+
+"""
+naive functions
+"""
+
+
+def naively_compute_H(genotype_arr, vcf_positions, windows):
+    # loop over windows and sample pairs
+    _, n_samples, __ = genotype_arr.shape
+    n_stats = n_samples + util.n_choose_2(n_samples)
+    num_H = np.zeros((len(windows), n_stats))
+    for z, window in enumerate(windows):
+        start, end = np.searchsorted(vcf_positions, window)
+        k = 0
+        for i in range(n_samples):
+            for j in range(i, n_samples):
+                gts_i = genotype_arr[start:end, i]
+                gts_j = genotype_arr[start:end, j]
+                if i == j:
+                    num_H[z, k] = (gts_i[:, 0] != gts_i[:, 1]).sum()
+                else:
+                    num_H[z, k] = \
+                        parsing.get_two_sample_site_H(gts_i, gts_j).sum()
+                k += 1
+    return num_H
+
+
+def naively_compute_H2(genotype_arr, vcf_positions, vcf_r_map, bins, windows):
+    # loop over windows and sample pairs, counting one statistic at a time
+    _, n_samples, __ = genotype_arr.shape
+    n_stats = n_samples + util.n_choose_2(n_samples)
+    num_H2 = np.zeros((len(windows), n_stats, len(bins) - 1))
+    for w, (w_start, w_l_end, w_r_end) in enumerate(windows):
+        start, l_end, r_end = np.searchsorted(
+            vcf_positions, [w_start, w_l_end, w_r_end]
+        )
+        gts = genotype_arr[start:r_end]
+        r_map = vcf_r_map[start:r_end]
+        k = 0
+        for i in range(n_samples):
+            for j in range(i, n_samples):
+                if i == j:
+                    het = gts[:, i, 0] != gts[:, i, 1]
+                    site_H = het.astype(float)
+                else:
+                    site_H = parsing.get_two_sample_site_H(
+                        gts[:, i], gts[:, j]
+                    )
+                num_H2[w, k] = counting.count_weighted_site_pairs(
+                    site_H, r_map, bins, left_bound=l_end - start
+                )
+                k += 1
+    return num_H2
+
+
+def get_random_genotypes(n_sites, n_samples, max_allele=1):
+    #
+    genotype_arr = np.random.randint(0, 2, size=(n_sites, n_samples, 2))
+    if max_allele > 1:
+        multi = np.random.uniform(size=genotype_arr.shape) < 0.1
+        genotype_arr[multi] = np.random.randint(
+            2, max_allele + 1, size=multi.sum()
+        )
+    positions = np.sort(np.random.choice(
+        np.arange(1, n_sites * 10), size=n_sites, replace=False
+    ))
+    return genotype_arr, positions
+
+
+"""
+one-locus H
+"""
+
+
+def test_compute_H():
+    #
+    for max_allele in [1, 3]:
+        genotype_arr, vcf_positions = get_random_genotypes(
+            2000, 6, max_allele=max_allele
+        )
+        mask_positions = np.arange(1, 20_001)
+        windows = np.array(
+            [[1, 5000], [5000, 12_000], [4000, 15_000], [12_000, 20_000]]
+        )
+        n_sites, num_H = parsing.compute_H(
+            mask_positions, genotype_arr, vcf_positions, windows=windows
+        )
+        naive = naively_compute_H(genotype_arr, vcf_positions, windows)
+        assert np.allclose(num_H, naive)
+        assert np.all(n_sites == np.diff(windows, axis=1)[:, 0])
+
+        _, one_sample_H = parsing.compute_H(
+            mask_positions,
+            genotype_arr,
+            vcf_positions,
+            windows=windows,
+            get_two_sample=False
+        )
+        rows, cols = np.triu_indices(6)
+        assert np.allclose(one_sample_H, naive[:, rows == cols])
+
+
+"""
+two-locus H
+"""
+
+
+def test_compute_H2():
+    #
+    bins = np.logspace(-6, -2, 9)
+    windows = np.array([[1, 5000, 8000], [5000, 12_000, 15_000]])
+    mask_positions = np.arange(1, 20_001)
+    # a roughly 1 cM/Mb map
+    r_map = np.cumsum(np.random.uniform(0, 2e-6, size=len(mask_positions)))
+    for max_allele in [1, 2]:
+        genotype_arr, vcf_positions = get_random_genotypes(
+            1500, 4, max_allele=max_allele
+        )
+        num_pairs, num_H2 = parsing.compute_H2(
+            mask_positions,
+            genotype_arr,
+            vcf_positions,
+            r_map,
+            bins=bins,
+            windows=windows
+        )
+        vcf_r_map = r_map[vcf_positions - 1]
+        naive = naively_compute_H2(
+            genotype_arr,
+            vcf_positions,
+            vcf_r_map,
+            util.map_function(bins),
+            windows
+        )
+        assert np.allclose(num_H2, naive)
+
+
+def test_compute_H_H2():
+    # the fused engine should match separate one- and two-locus passes
+    bins = np.logspace(-6, -2, 9)
+    windows = np.array([[1, 5000, 8000], [5000, 12_000, 20_001]])
+    mask_positions = util.SiteIndex(np.array([[0, 9000], [10_000, 20_000]]))
+    r_map = np.cumsum(np.random.uniform(0, 2e-6, size=len(mask_positions)))
+    genotype_arr, vcf_positions = get_random_genotypes(1500, 3, max_allele=2)
+    vcf_positions = mask_positions.select(
+        np.sort(np.random.choice(len(mask_positions), 1500, replace=False))
+    )
+    num_sites, num_H, num_pairs, num_H2 = parsing.compute_H_H2(
+        mask_positions,
+        genotype_arr,
+        vcf_positions,
+        r_map,
+        bins=bins,
+        windows=windows
+    )
+    expected_sites, expected_H = parsing.compute_H(
+        mask_positions, genotype_arr, vcf_positions, windows=windows[:, :2]
+    )
+    expected_pairs, expected_H2 = parsing.compute_H2(
+        mask_positions,
+        genotype_arr,
+        vcf_positions,
+        r_map,
+        bins=bins,
+        windows=windows
+    )
+    assert np.all(num_sites == expected_sites)
+    assert np.all(num_H == expected_H)
+    assert np.all(num_pairs == expected_pairs)
+    assert np.all(num_H2 == expected_H2)
+
+
+def get_random_H2_dics(n_dics, n_windows, n, n_bins):
+    #
+    dics = []
+    for _ in range(n_dics):
+        num_pairs = np.random.uniform(1e6, 1e7, size=(n_windows, n_bins))
+        n_sites = np.random.randint(1e5, 1e6, size=n_windows)
+        H = np.random.uniform(0, 1e-3, size=(n_windows, n))
+        H2 = np.random.uniform(0, 1e-6, size=(n_windows, n, n_bins))
+        dic = dict(
+            ids=np.array([str(i) for i in range(n)]),
+            r_bins=np.logspace(-6, -2, n_bins + 1),
+            n_sites=n_sites,
+            H_counts=H * n_sites[:, np.newaxis],
+            n_site_pairs=num_pairs,
+            H2_counts=H2 * num_pairs[:, np.newaxis]
+        )
+        dics.append(dic)
+    return dics
+
+
+def test_bootstrap_H2(monkeypatch):
+    #
+    dics = get_random_H2_dics(2, 40, 3, 5)
+    stats = parsing.bootstrap_H2(
+        dics, n_iters=500, seed=1, chunk_size=64, n_reservoir=500
+    )
+
+    # seeded resampling is reproducible, regardless of the number of workers
+    repeat = parsing.bootstrap_H2(
+        dics, n_iters=500, seed=1, chunk_size=64, n_workers=2, n_reservoir=500
+    )
+    for key in ['H_dist', 'H2_dist', 'H2_cov', 'H_cov']:
+        assert np.all(stats[key] == repeat[key])
+
+    # also with the default block layout, which keeps no resamples
+    default = parsing.bootstrap_H2(dics, n_iters=200, seed=2)
+    repeat = parsing.bootstrap_H2(dics, n_iters=200, seed=2, n_workers=2)
+    assert default['H2_dist'].shape == (0, 3, 5)
+    for key in ['H2_mean', 'H_mean', 'H2_cov', 'H_cov']:
+        assert np.all(default[key] == repeat[key])
+
+    # streamed moments match those of the full distribution
+    assert np.allclose(stats['H2_mean'].T, stats['H2_dist'].mean(0))
+    assert np.allclose(stats['H_cov'], np.cov(stats['H_dist'], rowvar=False))
+
+    # a reservoir keeps the leading resamples and leaves moments unchanged
+    reservoir = parsing.bootstrap_H2(
+        dics, n_iters=500, seed=1, chunk_size=64, n_reservoir=100
+    )
+    assert reservoir['H2_dist'].shape == (100, 3, 5)
+    assert np.all(reservoir['H2_dist'] == stats['H2_dist'][:100])
+    assert np.all(reservoir['H2_cov'] == stats['H2_cov'])
+
+    # batched covariances match np.cov in each bin
+    for k in range(5):
+        cov = np.cov(stats['H2_dist'][:, :, k], rowvar=False)
+        assert np.allclose(stats['H2_cov'][k], cov)
+
+    # each resample is a ratio of sums over some multiset of windows, so it
+    # lies within the range of the window ratios
+    H2_counts = np.concatenate([dic['H2_counts'] for dic in dics])
+    num_pairs = np.concatenate([dic['n_site_pairs'] for dic in dics])
+    win_H2 = H2_counts / num_pairs[:, np.newaxis]
+    assert np.all(stats['H2_dist'] >= win_H2.min(0) - 1e-15)
+    assert np.all(stats['H2_dist'] <= win_H2.max(0) + 1e-15)
+
+    # the bootstrap mean approximates the point estimate
+    H2 = H2_counts.sum(0) / num_pairs.sum(0)
+    assert np.allclose(stats['H2_mean'].T, H2, rtol=0.05)
+
+    # by default the resamples are split into blocks for workers to share
+    tasks = []
+
+    class Executor:
+
+        def __init__(self, max_workers=None):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def map(self, func, iterable):
+            tasks.extend(iterable)
+            return map(func, tasks)
+
+    monkeypatch.setattr(parsing, 'ProcessPoolExecutor', Executor)
+    parsing.bootstrap_H2(dics, n_iters=1000, n_workers=4)
+    assert len(tasks) == parsing._bootstrap_n_blocks
+    return
+
+
+def naively_jackknife(counts, weights):
+    # weighted delete-one jackknife of a ratio, for one statistic in one bin
+    g = len(counts)
+    N = weights.sum()
+    theta = counts.sum() / N
+    theta_del = [(counts.sum() - c) / (N - m) for c, m in zip(counts, weights)]
+    theta_J = g * theta - sum(
+        (1 - m / N) * t for m, t in zip(weights, theta_del)
+    )
+    var = 0
+    for m, t in zip(weights, theta_del):
+        h = N / m
+        pseudo = h * theta - (h - 1) * t
+        var += (pseudo - theta_J) ** 2 / (h - 1)
+    return theta, var / g
+
+
+def test_jackknife_H2():
+    #
+    dics = get_random_H2_dics(2, 30, 3, 4)
+    stats = parsing.jackknife_H2(dics)
+    H2_counts = np.concatenate([dic['H2_counts'] for dic in dics])
+    num_pairs = np.concatenate([dic['n_site_pairs'] for dic in dics])
+    assert stats['H2_mean'].shape == (4, 3)
+    assert stats['H2_cov'].shape == (4, 3, 3)
+    for k in range(4):
+        for i in range(3):
+            theta, var = naively_jackknife(H2_counts[:, i, k], num_pairs[:, k])
+            assert np.isclose(stats['H2_mean'][k, i], theta)
+            assert np.isclose(stats['H2_cov'][k, i, i], var)
+
+    # with equal weights this is the ordinary delete-one jackknife
+    for dic in dics:
+        dic['n_sites'] = np.full(30, 1000)
+    stats = parsing.jackknife_H2(dics)
+    H_counts = np.concatenate([dic['H_counts'] for dic in dics])
+    H_del = (H_counts.sum(0) - H_counts) / (1000 * 59)
+    resid = H_del - H_del.mean(0)
+    cov = resid.T @ resid * 59 / 60
+    assert np.allclose(stats['H_cov'], cov)
+    return
+
+
+def test_cross_H2():
+    # outer-product cross-chromosome H2 should match a loop over pairs
+    dics = get_random_H2_dics(4, 10, 3, 2)
+    num_pairs, num_H2 = parsing.compute_cross_chrom_H2(dics)
+    k = 0
+    for i in range(4):
+        for j in range(i + 1, 4):
+            chr_i = dics[i]
+            chr_j = dics[j]
+            expected_H2 = chr_i['H_counts'].sum(0) * chr_j['H_counts'].sum(0)
+            expected_pairs = chr_i['n_sites'].sum() * chr_j['n_sites'].sum()
+            assert np.allclose(num_H2[k], expected_H2)
+            assert num_pairs[k] == expected_pairs
+            k += 1
+
+    # windowed products sum to the totals, and can be bootstrapped
+    cross_dict = parsing.get_cross_chrom_dict(dics)
+    assert cross_dict['H2_counts'].shape == (40, 3, 1)
+    assert np.isclose(cross_dict['n_site_pairs'].sum(), num_pairs.sum())
+    assert np.allclose(cross_dict['H2_counts'].sum(0)[:, 0], num_H2.sum(0))
+    stats = parsing.bootstrap_H2([cross_dict], n_iters=50, seed=0)
+    assert stats['H2_cov'].shape == (1, 3, 3)
+
+    # cross-arm products for one chromosome
+    dic = dics[0]
+    n_sites = dic['n_sites'].sum()
+    dic['n_site_pairs'] = np.full((10, 2), 0)
+    dic['n_site_pairs'][0, 0] = n_sites * (n_sites - 1) // 2 \
+        - dic['n_sites'][:4].sum() * dic['n_sites'][4:].sum()
+    num_H2, num_pairs = parsing.compute_cross_arm_H2(dic, 4)
+    assert np.allclose(
+        num_H2, dic['H_counts'][:4].sum(0) * dic['H_counts'][4:].sum(0)
+    )
+    arm_dict = parsing.get_cross_arm_dict([dic], [4])
+    assert np.isclose(arm_dict['n_site_pairs'].sum(), num_pairs)
+
+    # when the centromere bounds the windows, there is only one arm
+    dic['n_site_pairs'][0, 0] = n_sites * (n_sites - 1) // 2
+    for cen_idx in [0, 10, 12]:
+        num_H2, num_pairs = parsing.compute_cross_arm_H2(dic, cen_idx)
+        assert num_pairs == 0
+        assert np.all(num_H2 == 0) and num_H2.shape == (3,)
+        arm_dict = parsing.get_cross_arm_dict([dic], [cen_idx])
+        assert np.all(arm_dict['n_site_pairs'] == 0)
+    return
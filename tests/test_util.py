@@ -0,0 +1,289 @@
+"""
+tests of file-reading and mask utilities
+"""
+import gzip
+import os
+import numpy as np
+import pytest
+
+from archaic import util
+
+
+"""
+utilities for writing test files
+"""
+
+
+def write_bed(fname, regions, chrom='chr1', header=False):
+    #
+    open_func = gzip.open if fname.endswith('.gz') else open
+    with open_func(fname, 'wt') as file:
+        if header:
+            file.write('#chrom\tchromStart\tchromEnd\n')
+        for start, end in regions:
+            file.write(f'{chrom}\t{start}\t{end}\n')
+    return fname
+
+
+def write_map(fname, coords, vals):
+    #
+    with open(fname, 'w') as file:
+        file.write('Chromosome\tPosition(bp)\tRate(cM/Mb)\tMap(cM)\n')
+        for coord, val in zip(coords, vals):
+            file.write(f'chr1\t{coord}\t0\t{val}\n')
+    return fname
+
+
+def get_random_regions(n, max_gap=100):
+    #
+    edges = np.cumsum(np.random.randint(1, max_gap, size=2 * n))
+    return edges.reshape(n, 2)
+
+
+"""
+reading tabular files
+"""
+
+
+@pytest.mark.parametrize('use_pandas', [True, False])
+@pytest.mark.parametrize('suffix', ['.bed', '.bed.gz'])
+@pytest.mark.parametrize('header', [True, False])
+def test_read_mask_file(tmp_path, monkeypatch, use_pandas, suffix, header):
+    #
+    if not use_pandas:
+        monkeypatch.setattr(util, 'pd', None)
+        monkeypatch.setattr(util, '_block_size', 7)
+    regions = get_random_regions(50)
+    fname = write_bed(str(tmp_path / f'mask{suffix}'), regions, header=header)
+    assert np.all(util.read_mask_file(fname) == regions)
+    _regions, chrom_num = util.read_mask_file(fname, return_chrom_num=True)
+    assert np.all(_regions == regions)
+    assert chrom_num == 1
+    assert util.read_mask_chrom_num(fname) == 1
+
+
+@pytest.mark.parametrize('use_pandas', [True, False])
+def test_read_single_region_mask(tmp_path, monkeypatch, use_pandas):
+    #
+    if not use_pandas:
+        monkeypatch.setattr(util, 'pd', None)
+    fname = write_bed(str(tmp_path / 'mask.bed'), [[10, 20]])
+    regions = util.read_mask_file(fname)
+    assert regions.shape == (1, 2)
+    assert np.all(regions == [[10, 20]])
+
+
+@pytest.mark.parametrize('use_pandas', [True, False])
+def test_read_columns(tmp_path, monkeypatch, use_pandas):
+    #
+    if not use_pandas:
+        monkeypatch.setattr(util, 'pd', None)
+        monkeypatch.setattr(util, '_block_size', 3)
+    coords = np.arange(0, 1000, 100)
+    vals = np.cumsum(np.random.uniform(size=10))
+    fname = write_map(str(tmp_path / 'map.txt'), coords, vals)
+    header, (_coords, _vals, chroms), contig = util.read_columns(
+        fname, ['Position(bp)', 'Map(cM)', 0], dtypes=[int, float, str]
+    )
+    assert header[1] == 'Position(bp)'
+    assert contig == 'chr1'
+    assert np.all(_coords == coords)
+    assert np.allclose(_vals, vals)
+    assert np.all(chroms == 'chr1')
+    rcoords, rvals = util.read_map_file(fname)
+    assert np.all(rcoords == coords)
+    assert np.allclose(rvals, vals)
+
+
+def test_read_bedgraph(tmp_path):
+    #
+    fname = str(tmp_path / 'u.bedgraph')
+    regions = get_random_regions(20)
+    u = np.random.uniform(1e-8, 2e-8, size=20)
+    with open(fname, 'w') as file:
+        file.write('chrom\tchromStart\tchromEnd\tu\n')
+        for (start, end), x in zip(regions, u):
+            file.write(f'chr1\t{start}\t{end}\t{x}\n')
+    _regions, data = util.read_bedgraph(fname)
+    assert np.all(_regions == regions)
+    assert np.allclose(data['u'], u)
+
+
+"""
+recombination maps
+"""
+
+
+def test_recombination_map(tmp_path):
+    #
+    coords = np.arange(0, 10_000, 500)
+    vals = np.cumsum(np.random.uniform(0.01, 0.1, size=20)) - 0.01
+    fname = write_map(str(tmp_path / 'map.txt'), coords, vals)
+    rmap = util.RecombinationMap.from_file(fname)
+    assert rmap.contig == 'chr1'
+    positions = np.sort(np.random.randint(0, 9500, size=100))
+    cM = rmap.cM_at(positions)
+    assert np.allclose(cM, np.interp(positions, coords, vals))
+    assert np.allclose(rmap.position_at(cM), positions)
+    assert np.isclose(
+        rmap.mean_rate(), (vals[-1] - vals[0]) / (coords[-1] - coords[0]) / 100
+    )
+    # nothing is written next to the map by default
+    assert not (tmp_path / 'map.txt.npz').exists()
+    # with a cache directory, the second load reads the binary cache
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    util.RecombinationMap.from_file(fname, cache_dir=str(cache_dir))
+    cache_fname = cache_dir / 'map.txt.npz'
+    assert cache_fname.exists()
+    mtime = os.path.getmtime(fname)
+    os.utime(cache_fname, (mtime + 10, mtime + 10))
+    cached = util.RecombinationMap.from_file(fname, cache_dir=str(cache_dir))
+    assert np.all(cached.coords == rmap.coords)
+    assert np.all(cached.vals == rmap.vals)
+    assert cached.contig == 'chr1'
+    # a cache older than the map is rewritten
+    write_map(fname, coords, vals * 2)
+    os.utime(fname, (mtime + 20, mtime + 20))
+    reloaded = util.RecombinationMap.from_file(fname, cache_dir=str(cache_dir))
+    assert np.allclose(reloaded.vals, vals * 2)
+    rate_map = rmap.rate_map(L=7_000)
+    assert rate_map.sequence_length == 7_000
+    assert np.isclose(
+        rate_map.get_cumulative_mass(6_000) * 100, rmap.cM_at(6_000) - vals[0]
+    )
+
+
+def test_map_at_site_index(tmp_path):
+    # interpolating through a SiteIndex matches the dense position vector
+    coords = np.arange(0, 10_000, 500)
+    vals = np.cumsum(np.random.uniform(0.01, 0.1, size=20)) - 0.01
+    fname = write_map(str(tmp_path / 'map.txt'), coords, vals)
+    regions = get_random_regions(50)
+    regions = regions[regions[:, 1] < 9500]
+    index = util.SiteIndex(regions)
+    expected = util.read_map_file(fname, util.get_mask_positions(regions))
+    assert np.all(util.read_map_file(fname, index) == expected)
+    rmap = util.RecombinationMap.from_file(fname)
+    assert np.all(rmap.cM_at_sites(index, chunk_size=7) == expected)
+
+
+def test_recombination_map_repeated_coords():
+    # repeated coordinates give zero-length intervals with rate 0
+    coords = np.array([0, 1000, 1000, 3000])
+    vals = np.array([0, 0.5, 0.6, 1.0])
+    rmap = util.RecombinationMap(coords, vals)
+    assert np.all(np.isfinite(rmap.rates))
+    assert np.allclose(rmap.rates, [5e-4, 0, 2e-4])
+    assert np.isclose(rmap.mean_rate(), 1.0 / 3000 / 100)
+    rate_map = rmap.rate_map()
+    assert np.all(rate_map.position == [0, 1000, 3000])
+    with pytest.raises(ValueError):
+        util.RecombinationMap([5, 5], [0, 1])
+
+
+def test_add_mask_flank_cM():
+    #
+    coords = np.arange(0, 100_000, 1000)
+    vals = np.cumsum(np.random.uniform(0, 0.01, size=100))
+    rmap = util.RecombinationMap(coords, vals)
+    mask = np.array([[5000, 6000], [20_000, 21_000], [60_000, 70_000]])
+    flank = 0.02
+    flanked = util.add_mask_flank_cM(mask, rmap, flank)
+    # compare to flanking each region one at a time
+    expected = []
+    for start, end in mask:
+        r_start, r_end = np.interp([start, end], coords, vals)
+        expected.append(
+            np.interp([r_start - flank, r_end + flank], vals, coords)
+        )
+    expected = util.collapse_mask(np.array(expected).astype(int))
+    assert np.all(flanked == expected)
+
+
+"""
+site indices
+"""
+
+
+def test_site_index():
+    #
+    regions = get_random_regions(200)
+    index = util.SiteIndex(regions)
+    positions = util.get_mask_positions(regions)
+    assert len(index) == len(positions)
+    assert np.all(index.positions == positions)
+    xs = np.arange(0, regions[-1, 1] + 10)
+    assert np.all(index.rank(xs) == np.searchsorted(positions, xs))
+    assert index.rank(positions[10]) == 10
+    ks = np.random.randint(0, len(positions), size=500)
+    assert np.all(index.select(ks) == positions[ks])
+    assert index[-1] == positions[-1]
+    assert np.all(index[5:50] == positions[5:50])
+    assert np.all(index.contains(xs) == np.isin(xs, positions))
+    windows = np.array([[0, 500], [500, 1000], [1000, 100_000]])
+    assert np.all(
+        util.rank_sites(index, windows) == np.searchsorted(positions, windows)
+    )
+
+
+def test_mask_intersection():
+    #
+    mask_x = get_random_regions(300)
+    mask_y = get_random_regions(300)
+    isec = util.intersect_masks(mask_x, mask_y)
+    n_shared = util.count_mask_intersection(mask_x, mask_y)
+    assert n_shared == np.diff(isec, axis=1).sum()
+    assert n_shared == util.count_mask_intersection(mask_y, mask_x)
+    union = util.add_masks(mask_x, mask_y)
+    jaccard = util.get_mask_jaccard(mask_x, mask_y)
+    assert np.isclose(jaccard, n_shared / np.diff(union, axis=1).sum())
+    windows = np.array([[0, 1000], [1000, 5000], [5000, 100_000]])
+    positions = util.get_mask_positions(mask_x)
+    assert np.all(
+        util.get_window_coverage(mask_x, windows)
+        == np.diff(np.searchsorted(positions, windows), axis=1)[:, 0]
+    )
+
+
+"""
+streaming mask builders
+"""
+
+
+def test_read_vcf_mask(tmp_path, monkeypatch):
+    #
+    monkeypatch.setattr(util, '_block_size', 13)
+    positions = np.unique(np.random.randint(1, 2000, size=600))
+    # a duplicated row should not break a run of positions
+    positions = np.sort(np.append(positions, positions[5]))
+    fname = str(tmp_path / 'test.vcf.gz')
+    with gzip.open(fname, 'wt') as file:
+        file.write('##fileformat=VCFv4.2\n')
+        file.write('#CHROM\tPOS\tID\tREF\tALT\n')
+        for position in positions:
+            file.write(f'chr1\t{position}\t.\tA\tT\n')
+    regions, chrom = util.read_vcf_mask(fname)
+    assert chrom == 'chr1'
+    assert np.all(regions == util.Mask.positions_to_regions(positions))
+
+
+def test_read_fasta_mask(tmp_path):
+    #
+    symbols = np.array(list('ACGTacgtNn.-'))
+    idx = np.random.choice(len(symbols), size=5000, p=[0.1] * 8 + [0.05] * 4)
+    idx[:30] = 8
+    sequence = ''.join(symbols[idx])
+    fname = str(tmp_path / 'test.fa')
+    with open(fname, 'w') as file:
+        file.write('>chromosome:GRCh37:1:1:5000:1\n')
+        for i in range(0, len(sequence), 60):
+            file.write(sequence[i:i + 60] + '\n')
+    regions, header = util.read_fasta_mask(fname, chunk_size=101)
+    assert header == b'>chromosome:GRCh37:1:1:5000:1'
+    called = ~np.isin(symbols[idx], ['N', 'n', '.', '-'])
+    assert np.all(regions == util.get_mask_from_bool(called))
+    alleles, _ = util.read_fasta_file(fname)
+    expected = sequence.upper().replace('.', 'N').replace('-', 'N')
+    assert alleles.tobytes().decode() == expected
+    assert np.all(util.get_fa_allele_mask(alleles) == regions)